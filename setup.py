@@ -11,7 +11,14 @@ with open("README.rst") as readme_file:
 with open("CHANGELOG.rst") as history_file:
     history = history_file.read()
 
-requirements = ["click>=7.0,<8", "PyYAML>=5.1,<5.2", "flying-circus>=0.7,<0.8", "inflection==0.3.1"]
+requirements = [
+    "click>=7.0,<8",
+    "PyYAML>=5.1,<5.2",
+    "flying-circus>=0.7,<0.8",
+    "inflection==0.3.1",
+]
+
+extra_requirements = {"apply": ["boto3"]}
 
 setup_requirements = ["pytest-runner"]
 
@@ -35,7 +42,13 @@ setup(
         "Topic :: System :: Systems Administration",
     ],
     description="SSM AppConfig Storage Helper",
-    entry_points={"console_scripts": ["ssmash=ssmash.cli:run_ssmash"]},
+    entry_points={
+        "console_scripts": [
+            "ssmash=ssmash.cli:run_ssmash",
+            "ssmash-client=ssmash.client:main",
+        ]
+    },
+    extras_require=extra_requirements,
     install_requires=requirements,
     license="GNU Affero General Public License v3",
     long_description=readme + "\n\n" + history,
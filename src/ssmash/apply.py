@@ -0,0 +1,230 @@
+"""Tools to write parameters directly to the SSM Parameter Store, without CloudFormation."""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from flyingcircus.core import Stack
+from flyingcircus.service.ssm import SSMParameter
+
+from ssmash.stack import get_resources
+
+LOGGER = logging.getLogger(__name__)
+
+#: AWS error codes that indicate we are sending requests too quickly
+THROTTLING_ERROR_CODES = {
+    "RequestLimitExceeded",
+    "Throttling",
+    "ThrottlingException",
+    "TooManyUpdates",
+}
+
+#: The maximum number of parameters that SSM can get in a single request
+GET_PARAMETERS_BATCH_SIZE = 10
+
+
+class ParameterValue(NamedTuple):
+    """The desired state of a single SSM parameter."""
+
+    name: str
+    type: str
+    value: str
+
+
+class ApplyResult(NamedTuple):
+    """Summary of the changes made by writing parameters."""
+
+    created: List[str]
+    updated: List[str]
+    unchanged: List[str]
+    failed: Dict[str, str]
+
+    def as_report(self) -> dict:
+        """Describe the result as plain data, suitable for output."""
+        return {
+            "created": sorted(self.created),
+            "updated": sorted(self.updated),
+            "unchanged": len(self.unchanged),
+            "failed": [
+                {"name": name, "error": error}
+                for name, error in sorted(self.failed.items())
+            ],
+        }
+
+
+class AdaptiveRateLimiter:
+    """Limit the rate of requests that are shared between many threads.
+
+    The rate is halved every time the service throttles us, and slowly
+    increases again (up to the maximum) as requests succeed.
+    """
+
+    def __init__(
+        self,
+        max_rate: float,
+        min_rate: float = 0.5,
+        increase: float = 0.2,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if max_rate <= 0:
+            raise ValueError("The maximum request rate must be positive")
+
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.increase = increase
+        self.rate = max_rate
+
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next_time = clock()
+
+    def acquire(self):
+        """Wait until the next request is allowed to be sent."""
+        with self._lock:
+            now = self._clock()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + 1.0 / self.rate
+        if delay > 0:
+            self._sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+
+def get_parameters_from_stack(stack: Stack) -> List[ParameterValue]:
+    """Get the desired state of every SSM parameter in a Flying Circus stack."""
+    return [
+        ParameterValue(
+            name=r.Properties.Name, type=r.Properties.Type, value=r.Properties.Value
+        )
+        for r in get_resources(stack, SSMParameter)
+    ]
+
+
+def get_parameter_snapshot(client, names: Iterable[str]) -> Dict[str, ParameterValue]:
+    """Get the current state of the named parameters that already exist.
+
+    Only the named parameters are read (in batches), so we don't need
+    permission to read the rest of the Parameter Store.
+
+    Raises:
+        ValueError: If AWS refuses to read the parameters.
+    """
+    names = sorted(set(names))
+    result = dict()
+    for i in range(0, len(names), GET_PARAMETERS_BATCH_SIZE):
+        try:
+            response = client.get_parameters(
+                Names=names[i : i + GET_PARAMETERS_BATCH_SIZE], WithDecryption=False
+            )
+        except Exception as ex:
+            if getattr(ex, "response", None) is None:
+                raise
+            raise ValueError(f"Unable to read the existing parameters: {ex}") from ex
+
+        for param in response["Parameters"]:
+            result[param["Name"]] = ParameterValue(
+                name=param["Name"], type=param["Type"], value=param["Value"]
+            )
+    return result
+
+
+def apply_parameters(
+    client,
+    parameters: List[ParameterValue],
+    max_workers: int = 4,
+    max_rate: float = 10.0,
+    max_attempts: int = 8,
+    rate_limiter: Optional[AdaptiveRateLimiter] = None,
+    sleep: Optional[Callable[[float], None]] = None,
+) -> ApplyResult:
+    """Write parameters to the SSM Parameter Store, skipping any that are unchanged.
+
+    Parameters:
+        client: A boto3 SSM client (or a compatible stand-in)
+        parameters: The desired state of the parameters.
+        max_workers: The number of concurrent requests to make.
+        max_rate: The maximum number of requests per second.
+        max_attempts: The number of times to try writing a single parameter
+            if we are throttled.
+
+
+    Raises:
+        ValueError: If AWS refuses to read the existing parameters.
+    """
+    snapshot = get_parameter_snapshot(client, [p.name for p in parameters])
+    rate_limiter = rate_limiter or AdaptiveRateLimiter(max_rate)
+    sleep = sleep or time.sleep
+
+    result = ApplyResult(created=[], updated=[], unchanged=[], failed={})
+    pending = []
+    for param in parameters:
+        existing = snapshot.get(param.name)
+        if existing == param:
+            result.unchanged.append(param.name)
+        else:
+            pending.append((param, existing is not None))
+
+    def write_parameter(param: ParameterValue, exists: bool):
+        for attempt in range(max_attempts):
+            rate_limiter.acquire()
+            try:
+                client.put_parameter(
+                    Name=param.name, Type=param.type, Value=param.value, Overwrite=True
+                )
+            except Exception as ex:
+                if not _is_throttling_error(ex) or attempt + 1 >= max_attempts:
+                    LOGGER.warning("Unable to write parameter %s: %s", param.name, ex)
+                    result.failed[param.name] = str(ex)
+                    return
+
+                rate_limiter.on_throttle()
+                sleep(random.uniform(0, min(20.0, 0.1 * 2 ** attempt)))
+                continue
+
+            rate_limiter.on_success()
+            (result.updated if exists else result.created).append(param.name)
+            return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in executor.map(lambda args: write_parameter(*args), pending):
+            pass
+
+    return result
+
+
+def create_ssm_client(region: Optional[str] = None):
+    """Create a boto3 client for SSM.
+
+    boto3 is an optional dependency, so we only import it when it's needed.
+    """
+    try:
+        import boto3
+    except ImportError as ex:
+        raise ValueError(
+            "Writing parameters directly requires boto3. "
+            "Install it with `pip install ssmash[apply]`."
+        ) from ex
+
+    return boto3.client("ssm", region_name=region)
+
+
+def _is_throttling_error(ex: Exception) -> bool:
+    """Check whether an exception from a boto3 client indicates throttling."""
+    response = getattr(ex, "response", None) or {}
+    return response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
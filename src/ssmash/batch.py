@@ -0,0 +1,114 @@
+"""Tools to generate many templates in one process pool."""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+import click
+import yaml
+
+
+class BatchEntry(NamedTuple):
+    """A single ssmash invocation in a batch."""
+
+    input: str
+    output: str
+    args: List[str]
+
+
+class BatchResult(NamedTuple):
+    """The outcome of a single ssmash invocation in a batch."""
+
+    entry: BatchEntry
+    exit_code: int
+    duration: float
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.exit_code == 0
+
+
+def load_batch_manifest(manifest, base_dir: str = ".") -> List[BatchEntry]:
+    """Load the entries from a batch manifest.
+
+    The manifest has a list of `entries`, where each entry has an `input`
+    configuration file, an `output` template file, and an optional list of
+    `args` for the chained commands (eg. `invalidate-ecs` and it's options).
+    Relative paths are relative to `base_dir`.
+
+    Raises:
+        ValueError: If the manifest is malformed.
+    """
+    data = yaml.safe_load(manifest) or {}
+    if not isinstance(data, dict) or not isinstance(data.get("entries"), list):
+        raise ValueError("The batch manifest must have a list of entries")
+
+    result = []
+    for index, item in enumerate(data["entries"]):
+        if (
+            not isinstance(item, dict)
+            or not item.get("input")
+            or not item.get("output")
+        ):
+            raise ValueError(
+                f"Batch entry {index} must have an input and an output file"
+            )
+        args = item.get("args") or []
+        if not isinstance(args, list):
+            raise ValueError(f"The args for batch entry {index} must be a list")
+
+        result.append(
+            BatchEntry(
+                input=os.path.join(base_dir, item["input"]),
+                output=os.path.join(base_dir, item["output"]),
+                args=[str(arg) for arg in args],
+            )
+        )
+    return result
+
+
+def run_batch(
+    entries: List[BatchEntry], workers: Optional[int] = None
+) -> List[BatchResult]:
+    """Run every entry in a batch across a pool of processes.
+
+    Each worker process only pays the cost of importing ssmash once, no
+    matter how many entries it runs.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_batch_entry, entries))
+
+
+def run_batch_entry(entry: BatchEntry) -> BatchResult:
+    """Run a single entry in a batch, as though ssmash had been run on the command line."""
+    # The CLI uses this module, so we import it late
+    from ssmash.cli import run_ssmash
+
+    start = time.monotonic()
+    try:
+        exit_code = run_ssmash.main(
+            args=["--input", entry.input, "--output", entry.output] + entry.args,
+            prog_name="ssmash",
+            standalone_mode=False,
+        )
+        error = None
+    except click.ClickException as ex:
+        exit_code = ex.exit_code
+        error = ex.format_message()
+    except click.Abort:
+        exit_code = 1
+        error = "Aborted"
+    except Exception as ex:
+        exit_code = 1
+        error = f"{type(ex).__name__}: {ex}"
+
+    return BatchResult(
+        entry=entry,
+        exit_code=exit_code or 0,
+        duration=time.monotonic() - start,
+        error=error,
+    )
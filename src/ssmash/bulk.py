@@ -0,0 +1,169 @@
+"""Tools to write many SSM parameters using only a few CloudFormation resources."""
+
+import zlib
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Set
+
+from flyingcircus.core import AWSObject
+from flyingcircus.core import LogicalName
+from flyingcircus.core import Resource
+from flyingcircus.core import Stack
+from flyingcircus.intrinsic_function import GetAtt
+from flyingcircus.intrinsic_function import Ref
+from flyingcircus.service.ssm import SSMParameter
+
+from ssmash.custom_resources import write_ssm_parameters_resource_handler
+from ssmash.inline import create_inline_function
+
+#: The CloudFormation type for a custom resource that writes a shard of parameters
+BULK_PARAMETERS_RESOURCE_TYPE = "Custom::WriteSsmParameters"
+
+
+def create_bulk_parameter_stack(
+    parameters: List[SSMParameter], role, shard_count: int, retain: bool = False
+) -> Stack:
+    """Create CloudFormation resources that write SSM parameters in bulk.
+
+    The parameters are divided into shards, and each shard is written by a
+    single custom resource. A parameter is always assigned to the same shard,
+    as long as the number of shards doesn't change.
+
+    Parameters:
+        parameters: The SSM Parameters to write
+        role: CloudFormation reference (eg. an ARN) to an IAM role
+            that will be used to write the parameters.
+        shard_count: The maximum number of custom resources to create.
+        retain: Keep parameters that are removed from a shard, or whose
+            shard is deleted, instead of deleting them.
+    """
+    if shard_count < 1:
+        raise ValueError("There must be at least one shard of parameters")
+
+    stack = Stack(Description="Write SSM Parameters in bulk")
+
+    # Create an inline Lambda that can write SSM parameters.
+    stack.Resources["WriterLambda"] = writer_lambda = create_inline_function(
+        write_ssm_parameters_resource_handler, role
+    )
+    writer_lambda.Properties.Timeout = 5 * 60
+
+    shards = [[] for _ in range(shard_count)]
+    for param in parameters:
+        shards[get_shard_index(param.Properties.Name, shard_count)].append(param)
+
+    for index, shard in enumerate(shards):
+        if not shard:
+            continue
+        stack.Resources[f"Shard{index}"] = resource = dict(
+            Type=BULK_PARAMETERS_RESOURCE_TYPE,
+            Properties=dict(
+                ServiceToken=GetAtt(writer_lambda, "Arn"),
+                Parameters=[
+                    dict(
+                        Name=p.Properties.Name,
+                        Type=p.Properties.Type,
+                        Value=p.Properties.Value,
+                    )
+                    for p in sorted(shard, key=lambda p: p.Properties.Name)
+                ],
+            ),
+        )
+        if retain:
+            resource["Properties"]["RetainParameters"] = "true"
+
+    return stack
+
+
+def bundle_ssm_parameters(stack: Stack, role, shard_count: int) -> None:
+    """Replace every SSM Parameter resource in a stack with bulk writers.
+
+    References to the parameters from other resources are replaced by the
+    literal name or value of the parameter, along with a dependency on the
+    custom resource that writes that parameter. The stack is modified in
+    place.
+    """
+    parameters = dict()
+    for logical_name, resource in list(stack.Resources.items()):
+        if isinstance(resource, SSMParameter):
+            parameters[logical_name] = resource
+            del stack.Resources[logical_name]
+
+    if not parameters:
+        return
+
+    # Parameters that CloudFormation would retain are also retained by the shards
+    retain = all(p.DeletionPolicy == "Retain" for p in parameters.values())
+    bulk_stack = create_bulk_parameter_stack(
+        list(parameters.values()), role, shard_count, retain=retain
+    ).with_prefixed_names("SSMParam")
+
+    # Find the shard for every parameter
+    shards_by_name = dict()
+    for resource in bulk_stack.Resources.values():
+        if isinstance(resource, dict):
+            for param in resource["Properties"]["Parameters"]:
+                shards_by_name[param["Name"]] = resource
+
+    # Replace references to the parameters
+    replacements = dict()
+    shards_by_reference = dict()
+    for param in parameters.values():
+        name = param.Properties.Name
+        replacements[Ref(param)] = name
+        replacements[GetAtt(param, "Value")] = param.Properties.Value
+        shards_by_reference[Ref(param)] = shards_by_name[name]
+        shards_by_reference[GetAtt(param, "Value")] = shards_by_name[name]
+
+    for resource in stack.Resources.values():
+        found = set()
+        if isinstance(resource, dict):
+            resource["Properties"] = _replace_references(
+                resource.get("Properties", {}), replacements, found
+            )
+        elif isinstance(resource, Resource):
+            _replace_references(resource.Properties, replacements, found)
+
+        dependencies = []
+        for reference in found:
+            shard = shards_by_reference[reference]
+            if not any(shard is d for d in dependencies):
+                dependencies.append(shard)
+        if dependencies:
+            if isinstance(resource, dict):
+                depends_on = resource.setdefault("DependsOn", [])
+            else:
+                depends_on = resource.DependsOn
+            depends_on.extend(LogicalName(shard) for shard in dependencies)
+
+    stack.merge_stack(bulk_stack)
+
+
+def get_shard_index(name: str, shard_count: int) -> int:
+    """Get a stable shard number for a parameter name."""
+    return zlib.crc32(name.encode("utf-8")) % shard_count
+
+
+def _replace_references(value: Any, replacements: Dict[Any, Any], found: Set) -> Any:
+    """Recursively replace references to objects, returning the updated value.
+
+    Flying Circus objects are updated in place.
+    """
+    if isinstance(value, (Ref, GetAtt)):
+        if value in replacements:
+            found.add(value)
+            return replacements[value]
+        return value
+    if isinstance(value, dict):
+        return {
+            k: _replace_references(v, replacements, found) for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_replace_references(v, replacements, found) for v in value]
+    if isinstance(value, AWSObject):
+        for key in value:
+            if value.is_attribute_set(key):
+                value[key] = _replace_references(value[key], replacements, found)
+        return value
+    return value
@@ -2,28 +2,31 @@
 
 """Convert a plain YAML file with application configuration into a CloudFormation template with SSM parameters."""
 
+import io
+import json
+import os
 import sys
+import time
 from datetime import datetime
 from datetime import timezone
 from functools import partial
 from functools import wraps
 from typing import Callable
-from typing import Dict
 from typing import List
+from typing import Optional
+from typing import TYPE_CHECKING
 
 import click
-import yaml
-from flyingcircus.core import Resource
-from flyingcircus.core import Stack
-from flyingcircus.service.ssm import SSMParameter
-
-from ssmash.config import InvalidatingConfigKey
-from ssmash.converter import convert_hierarchy_to_ssm
-from ssmash.invalidation import create_lambda_invalidation_stack
-from ssmash.loader import EcsServiceInvalidator
-from ssmash.loader import get_cfn_resource_from_options
-from ssmash.util import clean_logical_name
-from ssmash.yamlhelper import SsmashYamlLoader
+
+if TYPE_CHECKING:
+    from flyingcircus.core import Stack
+
+    from ssmash.pipeline import PipelineContext
+    from ssmash.profiling import PipelineProfiler
+
+# Most imports are deferred until the command that needs them runs, so that
+# starting the CLI (eg. for `--help`) stays fast. Check this with
+# `make benchmark-import`.
 
 # TODO move helper functions to another module
 # TODO tests for helper functions
@@ -32,6 +35,9 @@ from ssmash.yamlhelper import SsmashYamlLoader
 #: Prefix for specifying a CloudFormation import as a CLI parameter
 CFN_IMPORT_PREFIX = "!ImportValue:"
 
+#: Filename for the manifest that describes a split set of templates
+MANIFEST_FILENAME = "manifest.yaml"
+
 
 @click.group("ssmash", chain=True, invoke_without_command=True, help=__doc__)
 @click.option(
@@ -58,27 +64,366 @@ CFN_IMPORT_PREFIX = "!ImportValue:"
     default="Application configuration",
     help="The description for the CloudFormation stack.",
 )
-def run_ssmash(input_file, output_file, description: str):
+@click.option(
+    "--split-by-depth",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Write a separate CloudFormation template for each subtree at this "
+    "depth in the configuration hierarchy, instead of a single template.",
+    metavar="DEPTH",
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Where to write the split CloudFormation templates, and a manifest "
+    "that describes them.",
+)
+@click.option(
+    "--max-parallel-params",
+    type=click.IntRange(min=1),
+    default=None,
+    help="The maximum number of SSM parameters that CloudFormation should "
+    "create at the same time, to avoid being throttled.",
+    metavar="COUNT",
+)
+@click.option(
+    "--retain-parameters",
+    is_flag=True,
+    default=False,
+    help="Keep the SSM parameters when CloudFormation deletes their "
+    "resources, so that they can safely move to different resources.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Report the wall time and peak memory of each stage, and counts of "
+    "what was produced, as JSON on stderr.",
+)
+@click.option(
+    "--profile-stats",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Run under cProfile, and write the statistics to this file (for use "
+    "with pstats).",
+    metavar="PATH",
+)
+def run_ssmash(
+    input_file,
+    output_file,
+    description: str,
+    split_by_depth,
+    output_dir,
+    max_parallel_params,
+    retain_parameters: bool,
+    profile: bool,
+    profile_stats,
+):
     pass
 
 
 @run_ssmash.resultcallback()
-def process_pipeline(processors, input_file, output_file, description: str):
+def process_pipeline(
+    processors,
+    input_file,
+    output_file,
+    description: str,
+    split_by_depth: int,
+    output_dir: str,
+    max_parallel_params: int,
+    retain_parameters: bool,
+    profile: bool,
+    profile_stats: Optional[str],
+):
+    # Some commands (eg. batch) replace the whole pipeline
+    standalones = [
+        p for p in processors if getattr(p, "is_standalone_processor", False)
+    ]
+    watches = [p for p in processors if getattr(p, "is_watch_processor", False)]
+    if (profile or profile_stats) and (standalones or watches):
+        raise click.UsageError(
+            f"Profiling can't be used with the "
+            f"{(standalones + watches)[0].command_name} command."
+        )
+
+    if standalones:
+        if len(processors) > 1:
+            raise click.UsageError(
+                f"The {standalones[0].command_name} command can't be chained "
+                f"with other commands."
+            )
+        standalones[0](output_file)
+        return
+
+    # Watching the input file replaces a single pass through the pipeline
+    processors = [p for p in processors if p not in watches]
+    if len(watches) > 1:
+        raise click.UsageError("Only one watch command may be used.")
+
+    if (split_by_depth is None) != (output_dir is None):
+        raise click.UsageError(
+            "The --split-by-depth and --output-dir options must be used together."
+        )
+
+    # Some chained commands replace the default template writer
+    writers = [p for p in processors if getattr(p, "is_output_processor", False)]
+    processors = [p for p in processors if p not in writers]
+    if len(writers) > 1:
+        raise click.UsageError("Only one output command may be used.")
+    writer = writers[0] if writers else _write_cfn_template
+
+    if max_parallel_params is not None:
+        processors = [
+            partial(_limit_parallel_parameters, max_parallel_params)
+        ] + processors
+
+    if retain_parameters:
+        processors = [_retain_parameters] + processors
+
+    if split_by_depth is not None and writers:
+        raise click.UsageError("Output commands can't be used with --split-by-depth.")
+
+    generate = partial(
+        _run_pipeline, processors, writer, description, split_by_depth, output_dir
+    )
+    if watches:
+        watches[0](generate, input_file, output_file)
+        return
+
+    if profile or profile_stats:
+        _profile_pipeline(generate, input_file, output_file, profile, profile_stats)
+        return
+
     # Create basic processor inputs
     appconfig = _load_appconfig_from_yaml(input_file)
-    stack = _initialise_stack(description)
+    generate(appconfig, output_file)
+
+
+def _profile_pipeline(
+    generate: Callable, input_file, output_file, report: bool, stats_path: Optional[str]
+):
+    """Run the pipeline once, measuring each stage."""
+    import cProfile
+
+    from ssmash.profiling import PipelineProfiler
+
+    profiler = PipelineProfiler()
+    cprofiler = cProfile.Profile() if stats_path else None
+    if cprofiler:
+        cprofiler.enable()
+    try:
+        with profiler.stage("load"):
+            appconfig = _load_appconfig_from_yaml(input_file)
+        generate(appconfig, output_file, profiler=profiler)
+    finally:
+        # Commands like diff report their result with the exit status, so
+        # the measurements are reported even if the pipeline stops early
+        if cprofiler:
+            cprofiler.disable()
+            cprofiler.dump_stats(stats_path)
+        result = profiler.finish()
+        if report:
+            click.echo(json.dumps(result, indent=2), err=True)
+
+
+def _run_pipeline(
+    processors: List[Callable],
+    writer: Callable,
+    description: str,
+    split_by_depth: Optional[int],
+    output_dir: Optional[str],
+    appconfig: dict,
+    output,
+    cache: Optional[dict] = None,
+    profiler: Optional["PipelineProfiler"] = None,
+) -> int:
+    """Apply all chained commands to the application configuration.
+
+    Returns:
+        The number of templates that were written.
+    """
+    if split_by_depth is not None:
+        return _process_split_pipeline(
+            processors,
+            appconfig,
+            description,
+            split_by_depth,
+            output_dir,
+            cache,
+            profiler,
+        )
+
+    _apply_full_pipeline(
+        processors, writer, output, appconfig, _initialise_stack(description), profiler
+    )
+    return 1
+
+
+def _apply_full_pipeline(
+    processors: List[Callable],
+    writer: Callable,
+    output,
+    appconfig: dict,
+    stack: "Stack",
+    profiler: Optional["PipelineProfiler"] = None,
+    **labels,
+) -> "PipelineContext":
+    """Apply all the processing functions to a stack, and write it.
+
+    If there is a profiler, then each processing function is measured as a
+    separate stage, with the supplied labels.
+    """
+    from ssmash.pipeline import PipelineContext
+
+    context = PipelineContext(appconfig, stack)
+    if profiler is None:
+        for processor in _get_full_pipeline(processors, partial(writer, output)):
+            processor(appconfig, stack, context)
+        return context
+
+    from ssmash.profiling import count_leaves
+
+    output = profiler.count_output(output)
+    for processor in _get_full_pipeline(processors, partial(writer, output)):
+        with profiler.stage(_get_stage_name(processor), **labels):
+            processor(appconfig, stack, context)
+
+    profiler.add_counts(
+        leaves=count_leaves(context.clean_config),
+        parameters=len(context.parameters),
+        invalidated_applications=len(context.invalidated_resources),
+    )
+    return context
+
+
+def _get_stage_name(processor: Callable) -> str:
+    """Get a readable name for a processing function, for profiling."""
+    if isinstance(processor, partial):
+        processor = processor.func
 
-    # Augment processing functions with default loader and writer
-    processors = (
+    builtin_names = {
+        _create_ssm_parameters: "convert",
+        _create_embedded_invalidations: "embedded-invalidations",
+        _share_invalidation_functions: "share-invalidation-functions",
+        _limit_parallel_parameters: "max-parallel-params",
+        _retain_parameters: "retain-parameters",
+        _write_cfn_template: "export",
+    }
+    if processor in builtin_names:
+        return builtin_names[processor]
+    return getattr(processor, "command_name", processor.__name__)
+
+
+def _get_full_pipeline(processors: List[Callable], writer: Callable) -> List[Callable]:
+    """Augment processing functions with default loader and writer.
+
+    Some chained commands need to see all the invalidations, so they are
+    applied after the embedded invalidations have been created.
+    """
+    late_processors = [p for p in processors if getattr(p, "is_late_processor", False)]
+    return (
         [_create_ssm_parameters]
-        + processors
-        + [_create_embedded_invalidations]
-        + [partial(_write_cfn_template, output_file)]
+        + [p for p in processors if p not in late_processors]
+        + [_create_embedded_invalidations, _share_invalidation_functions]
+        + late_processors
+        + [writer]
     )
 
-    # Apply all chained commands
-    for processor in processors:
-        processor(appconfig, stack)
+
+def _process_split_pipeline(
+    processors: List[Callable],
+    appconfig: dict,
+    description: str,
+    depth: int,
+    output_dir: str,
+    cache: Optional[dict] = None,
+    profiler: Optional["PipelineProfiler"] = None,
+) -> int:
+    """Apply all chained commands separately to each subtree of the configuration.
+
+    Each subtree is written to it's own template in the output directory,
+    along with a manifest describing all the templates. Every template can
+    be deployed independently of the others.
+
+    If a cache is supplied, then templates are only regenerated for the
+    subtrees that have changed since the cache was last used.
+
+    Returns:
+        The number of templates that were written.
+    """
+    import yaml
+
+    from ssmash.diff import index_stack
+    from ssmash.pipeline import SSMASH_CONFIG_KEY
+    from ssmash.splitter import get_subtree_filename
+    from ssmash.splitter import split_appconfig
+    from ssmash.watch import get_config_fingerprint
+
+    ssmash_config = appconfig.get(SSMASH_CONFIG_KEY)
+    clean_config = dict(appconfig)
+    clean_config.pop(SSMASH_CONFIG_KEY, None)
+
+    os.makedirs(output_dir, exist_ok=True)
+    filenames = {MANIFEST_FILENAME}
+    manifest_entries = []
+    previous_cache = dict(cache) if cache is not None else {}
+    written = 0
+
+    for path_components, subconfig in split_appconfig(clean_config, depth).items():
+        path = "/" + "/".join(path_components)
+        filename = get_subtree_filename(path_components, filenames)
+
+        if cache is not None:
+            fingerprint = get_config_fingerprint(
+                [path, description, subconfig, ssmash_config]
+            )
+            cached = previous_cache.get(filename)
+            if cached is not None and cached[0] == fingerprint:
+                manifest_entries.append(cached[1])
+                continue
+
+        if ssmash_config is not None:
+            subconfig[SSMASH_CONFIG_KEY] = ssmash_config
+
+        stack = _initialise_stack(f"{description} ({path})")
+        with open(os.path.join(output_dir, filename), "w") as output:
+            context = _apply_full_pipeline(
+                processors,
+                _write_cfn_template,
+                output,
+                subconfig,
+                stack,
+                profiler,
+                template=filename,
+            )
+
+        subconfig.pop(SSMASH_CONFIG_KEY, None)
+        manifest_entry = {
+            "template": filename,
+            "path": path,
+            "parameters": len(index_stack(stack).parameters),
+            "invalidates": sorted(context.invalidated_resources.keys()),
+        }
+        manifest_entries.append(manifest_entry)
+        written += 1
+        if cache is not None:
+            cache[filename] = (fingerprint, manifest_entry)
+
+    if cache is not None:
+        for filename in set(cache) - filenames:
+            del cache[filename]
+
+    from ssmash import __version__
+
+    manifest = {
+        "ssmash": {"version": __version__, "split_depth": depth},
+        "templates": manifest_entries,
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILENAME), "w") as output:
+        yaml.safe_dump(manifest, output, default_flow_style=False, sort_keys=False)
+
+    return written
 
 
 def appconfig_processor(func: Callable) -> Callable:
@@ -86,21 +431,379 @@ def appconfig_processor(func: Callable) -> Callable:
 
     @wraps(func)
     def wrapper(*args, **kwargs):
-        def processor(appconfig: dict, stack: Stack):
+        def processor(appconfig: dict, stack: "Stack", context: "PipelineContext"):
             try:
-                return func(appconfig, stack, *args, **kwargs)
+                return func(appconfig, stack, context, *args, **kwargs)
             except ValueError as ex:
                 raise click.UsageError(str(ex)) from ex
 
+        processor.command_name = _get_command_name(func)
         return processor
 
     return wrapper
 
 
+def output_processor(func: Callable) -> Callable:
+    """Decorator to convert a Click command into a custom processor that
+    writes the output, instead of writing the CloudFormation template.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        def processor(
+            output, appconfig: dict, stack: "Stack", context: "PipelineContext"
+        ):
+            try:
+                return func(output, appconfig, stack, context, *args, **kwargs)
+            except ValueError as ex:
+                raise click.UsageError(str(ex)) from ex
+
+        processor.is_output_processor = True
+        processor.command_name = _get_command_name(func)
+        return processor
+
+    return wrapper
+
+
+def _get_command_name(func: Callable) -> str:
+    """Get the name of the Click command that is being invoked."""
+    context = click.get_current_context(silent=True)
+    return context.info_name if context is not None else func.__name__
+
+
+def late_processor(func: Callable) -> Callable:
+    """Decorator to convert a Click command into a custom processor that is
+    applied after all the invalidations have been created.
+    """
+    processor_factory = appconfig_processor(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        processor = processor_factory(*args, **kwargs)
+        processor.is_late_processor = True
+        return processor
+
+    return wrapper
+
+
+@run_ssmash.command(
+    "bulk-parameters",
+    options_metavar="[--shards COUNT] (--role-name|--role-import) ROLE ",
+)
+@click.option(
+    "--shards",
+    type=click.IntRange(min=1),
+    default=10,
+    help="The number of custom resources to spread the parameters across. "
+    "Don't change this for an existing stack without --retain-parameters, "
+    "because parameters that move between shards may be deleted.",
+    metavar="COUNT",
+)
+@click.option(
+    "--role-name",
+    type=str,
+    default=None,
+    help="The IAM role to use for writing the parameters (as an ARN).",
+    metavar="ARN",
+)
+@click.option(
+    "--role-import",
+    type=str,
+    default=None,
+    help="Alternatively, specify the IAM role as a CloudFormation export.",
+    metavar="EXPORT_NAME",
+)
+@late_processor
+def bulk_parameters(appconfig, stack, context, shards: int, role_name, role_import):
+    """Write the SSM parameters using a few custom resources, instead of
+    creating a CloudFormation resource for every parameter.
+    """
+    from ssmash.bulk import bundle_ssm_parameters
+    from ssmash.loader import get_cfn_resource_from_options
+
+    role = get_cfn_resource_from_options("role", role_name, role_import)
+    bundle_ssm_parameters(stack, role=role, shard_count=shards)
+
+
+@run_ssmash.command("batch", options_metavar="[--workers COUNT] MANIFEST")
+@click.argument("manifest_path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="The number of processes to use. Defaults to the number of CPUs.",
+    metavar="COUNT",
+)
+def run_batch_manifest(manifest_path, workers):
+    """Generate many templates in one pool of processes, as described by a
+    MANIFEST file. This can't be chained with other commands.
+
+    Prints the status of each entry in the manifest. Exits with a non-zero
+    status if any entry failed.
+    """
+
+    def processor(output):
+        from ssmash.batch import load_batch_manifest
+        from ssmash.batch import run_batch
+
+        try:
+            with open(manifest_path) as manifest:
+                entries = load_batch_manifest(
+                    manifest, base_dir=os.path.dirname(manifest_path)
+                )
+        except ValueError as ex:
+            raise click.UsageError(str(ex)) from ex
+
+        results = run_batch(entries, workers=workers)
+        for result in results:
+            status = "ok" if result.succeeded else "FAILED"
+            output.write(
+                f"{status:<6} {result.duration:6.2f}s "
+                f"{result.entry.input} -> {result.entry.output}\n"
+            )
+            if result.error:
+                output.write(f"       {result.error}\n")
+
+        failed = len([r for r in results if not r.succeeded])
+        output.write(f"{len(results) - failed} succeeded, {failed} failed\n")
+        if failed:
+            click.get_current_context().exit(1)
+
+    processor.is_standalone_processor = True
+    processor.command_name = "batch"
+    return processor
+
+
+@run_ssmash.command("serve", options_metavar="--socket PATH")
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    required=True,
+    help="The Unix socket to listen on.",
+    metavar="PATH",
+)
+def serve_conversions(socket_path):
+    """Keep running, and convert application configuration sent by
+    `ssmash-client` over a Unix socket. This can't be chained with other
+    commands. Press Ctrl+C to stop.
+
+    Each conversion reuses this process, so it doesn't pay the cost of
+    starting ssmash. Many clients can be served at the same time.
+    """
+
+    def processor(output):
+        from ssmash.server import create_server
+        from ssmash.server import serve
+
+        try:
+            server = create_server(socket_path)
+        except ValueError as ex:
+            raise click.UsageError(str(ex)) from ex
+
+        click.echo(f"Listening on {socket_path}", err=True)
+        try:
+            serve(server)
+        except KeyboardInterrupt:
+            pass
+
+    processor.is_standalone_processor = True
+    processor.command_name = "serve"
+    return processor
+
+
+@run_ssmash.command("watch", options_metavar="[--interval SECONDS]")
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.01),
+    default=0.5,
+    help="How often to check the input file for changes.",
+    metavar="SECONDS",
+)
+def watch_input_file(interval: float):
+    """Keep running, and regenerate the output whenever the input file
+    changes. Press Ctrl+C to stop.
+
+    Other chained commands are applied to every regeneration. With
+    --split-by-depth, only the templates for subtrees that have changed are
+    rewritten.
+    """
+
+    def processor(generate, input_file, output_file):
+        import yaml
+
+        from ssmash.watch import FileWatcher
+        from ssmash.watch import get_config_fingerprint
+
+        input_path = getattr(input_file, "name", "-")
+        if not os.path.isfile(input_path):
+            raise click.UsageError("The watch command needs an --input file.")
+        # Files are opened lazily by Click, so we can write them repeatedly
+        output_path = (
+            output_file.name if isinstance(output_file, click.utils.LazyFile) else None
+        )
+
+        watcher = FileWatcher(input_path, interval=interval)
+        fingerprint = None
+        cache = dict()
+        exit_code = 0
+
+        click.echo(f"Watching {input_path} for changes", err=True)
+        try:
+            while True:
+                watcher.wait_for_change()
+                start = time.perf_counter()
+                try:
+                    with open(input_path) as input:
+                        appconfig = _load_appconfig_from_yaml(input)
+                    new_fingerprint = get_config_fingerprint(appconfig)
+                    if new_fingerprint == fingerprint:
+                        continue
+
+                    # Only replace the output once it has been generated
+                    # successfully. Commands like diff report their result
+                    # with the exit status, which shouldn't stop the watch.
+                    buffer = io.StringIO()
+                    try:
+                        written = generate(appconfig, buffer, cache)
+                        exit_code = 0
+                    except click.exceptions.Exit as ex:
+                        written = None
+                        exit_code = ex.exit_code
+                    if output_path is None:
+                        output_file.write(buffer.getvalue())
+                        output_file.flush()
+                    elif buffer.getvalue():
+                        with open(output_path, "w") as output:
+                            output.write(buffer.getvalue())
+                except (click.ClickException, yaml.YAMLError, ValueError) as ex:
+                    message = (
+                        ex.format_message()
+                        if isinstance(ex, click.ClickException)
+                        else str(ex)
+                    )
+                    click.echo(f"Error: {message}", err=True)
+                    continue
+
+                fingerprint = new_fingerprint
+                elapsed = (time.perf_counter() - start) * 1000
+                if exit_code:
+                    click.echo(
+                        f"Regenerated in {elapsed:.0f}ms, with exit status {exit_code}",
+                        err=True,
+                    )
+                else:
+                    click.echo(
+                        f"Regenerated {written} template(s) in {elapsed:.0f}ms",
+                        err=True,
+                    )
+        except KeyboardInterrupt:
+            pass
+
+        # Exit with the status of the last regeneration
+        if exit_code:
+            click.get_current_context().exit(exit_code)
+
+    processor.is_watch_processor = True
+    processor.command_name = "watch"
+    return processor
+
+
+@run_ssmash.command("diff", options_metavar="--previous TEMPLATE")
+@click.option(
+    "--previous",
+    "previous_path",
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+    help="The previously generated CloudFormation template to compare against.",
+    metavar="TEMPLATE",
+)
+@output_processor
+def diff_parameters(output, appconfig, stack, context, previous_path):
+    """Compare the SSM parameters against a previous template, instead of
+    writing a new template.
+
+    Only hashes of the parameter values are reported. Exits with a non-zero
+    status if anything has changed.
+    """
+    import yaml
+
+    from ssmash.diff import diff_templates
+    from ssmash.diff import index_stack
+    from ssmash.diff import index_template
+    from ssmash.diff import load_template
+
+    with open(previous_path) as previous_file:
+        previous = index_template(load_template(previous_file))
+    diff = diff_templates(previous, index_stack(stack))
+
+    yaml.safe_dump(diff.as_report(), output, default_flow_style=False, sort_keys=False)
+
+    if diff.has_changes:
+        click.get_current_context().exit(1)
+
+
+@run_ssmash.command("apply")
+@click.option(
+    "--region",
+    type=str,
+    default=None,
+    help="The AWS region to write the parameters to. Defaults to the normal "
+    "AWS configuration.",
+)
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=4,
+    help="The number of parameters to write concurrently.",
+)
+@click.option(
+    "--max-rate",
+    type=click.FloatRange(min=0.1),
+    default=10.0,
+    help="The maximum number of parameters to write per second. The rate is "
+    "automatically reduced if SSM throttles us.",
+)
+@output_processor
+def apply_parameters_directly(
+    output, appconfig, stack, context, region, max_workers: int, max_rate: float
+):
+    """Write the SSM parameters directly to the Parameter Store, instead of
+    writing a CloudFormation template.
+
+    Parameters that already have the correct value are skipped. No
+    invalidations are performed, and parameters that have been removed from
+    the configuration are not deleted. Exits with a non-zero status if any
+    parameters could not be written.
+    """
+    import yaml
+
+    from ssmash.apply import apply_parameters
+    from ssmash.apply import create_ssm_client
+    from ssmash.apply import get_parameters_from_stack
+
+    try:
+        result = apply_parameters(
+            create_ssm_client(region),
+            get_parameters_from_stack(stack),
+            max_workers=max_workers,
+            max_rate=max_rate,
+        )
+    except ValueError as ex:
+        raise click.ClickException(str(ex)) from ex
+
+    yaml.safe_dump(
+        result.as_report(), output, default_flow_style=False, sort_keys=False
+    )
+
+    if result.failed:
+        click.get_current_context().exit(1)
+
+
 @run_ssmash.command(
     "invalidate-ecs",
     options_metavar="(--cluster-name|--cluster-import) CLUSTER "
-    "(--service-name|--service-import) SERVICE "
+    "(--service-name|--service-import) SERVICE... "
     "(--role-name|--role-import) ROLE ",
 )
 @click.option(
@@ -120,15 +823,17 @@ def appconfig_processor(func: Callable) -> Callable:
 @click.option(
     "--service-name",
     type=str,
-    default=None,
-    help="The ECS Service that depends on this configuration (as a name or ARN).",
+    multiple=True,
+    help="The ECS Service that depends on this configuration (as a name or ARN). "
+    "May be repeated to restart several services in the same cluster together.",
     metavar="ARN",
 )
 @click.option(
     "--service-import",
     type=str,
-    default=None,
-    help=("Alternatively, specify the ECS Service as a CloudFormation export."),
+    multiple=True,
+    help="Alternatively, specify the ECS Service as a CloudFormation export. "
+    "May be repeated.",
     metavar="EXPORT_NAME",
 )
 @click.option(
@@ -145,20 +850,31 @@ def appconfig_processor(func: Callable) -> Callable:
     help="Alternatively, specify the IAM role as a CloudFormation export.",
     metavar="EXPORT_NAME",
 )
+@click.option(
+    "--asynchronous",
+    is_flag=True,
+    default=False,
+    help="Use a CloudFormation WaitCondition to wait for the restart to "
+    "finish, instead of waiting inside a Lambda Function.",
+)
 @appconfig_processor
 def invalidate_ecs_service(
     appconfig,
     stack,
+    context,
     cluster_name,
     cluster_import,
     service_name,
     service_import,
     role_name,
     role_import,
+    asynchronous,
 ):
-    """Invalidate the cache in an ECS Service that uses these parameters,
-    by restarting the service.
+    """Invalidate the cache in ECS Services that use these parameters,
+    by restarting the services.
     """
+    from ssmash.loader import EcsServiceInvalidator
+
     invalidator = EcsServiceInvalidator(
         cluster_name=cluster_name,
         cluster_import=cluster_import,
@@ -166,13 +882,11 @@ def invalidate_ecs_service(
         service_import=service_import,
         role_name=role_name,
         role_import=role_import,
+        asynchronous=asynchronous,
     )
 
-    all_parameters = [
-        r for r in stack.Resources.values() if isinstance(r, SSMParameter)
-    ]
     stack.merge_stack(
-        invalidator.create_resources(all_parameters).with_prefixed_names(
+        invalidator.create_resources(context.parameters).with_prefixed_names(
             "InvalidateEcs"
         )
     )
@@ -180,21 +894,40 @@ def invalidate_ecs_service(
 
 @run_ssmash.command(
     "invalidate-lambda",
-    options_metavar="(--function-name|--function-import) FUNCTION "
+    options_metavar="(--function-name|--function-import) FUNCTION... "
+    "(--stack-name|--stack-import) STACK... "
     "(--role-name|--role-import) ROLE ",
 )
 @click.option(
     "--function-name",
     type=str,
-    default=None,
-    help="The Lambda Function to invalidate (as a name or ARN).",
+    multiple=True,
+    help="The Lambda Function to invalidate (as a name or ARN). May be "
+    "repeated to invalidate several Functions together.",
     metavar="ARN",
 )
 @click.option(
     "--function-import",
     type=str,
-    default=None,
-    help="Alternatively, specify the Lambda Function as a CloudFormation import.",
+    multiple=True,
+    help="Alternatively, specify the Lambda Function as a CloudFormation import. "
+    "May be repeated.",
+    metavar="EXPORT_NAME",
+)
+@click.option(
+    "--stack-name",
+    type=str,
+    multiple=True,
+    help="Invalidate every Lambda Function in this CloudFormation stack "
+    "(as a name or ID). May be repeated.",
+    metavar="NAME",
+)
+@click.option(
+    "--stack-import",
+    type=str,
+    multiple=True,
+    help="Alternatively, specify the CloudFormation stack as a CloudFormation "
+    "import. May be repeated.",
     metavar="EXPORT_NAME",
 )
 @click.option(
@@ -211,55 +944,100 @@ def invalidate_ecs_service(
     help=("Alternatively, specify the IAM role as a CloudFormation export."),
     metavar="EXPORT_NAME",
 )
+@click.option(
+    "--prewarm-concurrency",
+    type=click.IntRange(min=0),
+    default=0,
+    help="The number of concurrent invocations to make after invalidating "
+    "each Lambda Function, so that real traffic doesn't wait for cold starts.",
+    metavar="COUNT",
+)
+@click.option(
+    "--prewarm-payload",
+    type=str,
+    default=None,
+    help="The JSON event to send when pre-warming the Lambda Functions.",
+    metavar="JSON",
+)
 @appconfig_processor
 def invalidate_lambda(
-    appconfig, stack, function_name, function_import, role_name, role_import
+    appconfig,
+    stack,
+    context,
+    function_name,
+    function_import,
+    stack_name,
+    stack_import,
+    role_name,
+    role_import,
+    prewarm_concurrency,
+    prewarm_payload,
 ):
-    """Invalidate the cache in a Lambda Function that uses these parameters,
+    """Invalidate the cache in Lambda Functions that use these parameters,
     by restarting the Lambda Execution Context.
     """
-    # TODO be able to invalidate all lambda functions in an entire stack
+    from ssmash.invalidation import create_lambda_invalidation_stack
+    from ssmash.loader import get_cfn_resource_from_options
+    from ssmash.loader import get_cfn_resources_from_options
 
     # Unpack the resource references
-    function = get_cfn_resource_from_options("function", function_name, function_import)
+    stacks = get_cfn_resources_from_options(
+        "stack", stack_name, stack_import, required=False
+    )
+    functions = get_cfn_resources_from_options(
+        "function", function_name, function_import, required=not stacks
+    )
     role = get_cfn_resource_from_options("role", role_name, role_import)
+    if prewarm_payload is not None:
+        try:
+            json.loads(prewarm_payload)
+        except ValueError as ex:
+            raise ValueError(f"The pre-warming payload must be JSON: {ex}") from ex
 
     # Use a custom Lambda to invalidate the function iff it's dependent resources
     # have changed
     stack.merge_stack(
         create_lambda_invalidation_stack(
-            function=function,
-            dependencies=[
-                r for r in stack.Resources.values() if isinstance(r, SSMParameter)
-            ],
+            function=functions[0] if len(functions) == 1 else functions,
+            stacks=stacks,
+            dependencies=context.parameters,
             role=role,
+            prewarm_concurrency=prewarm_concurrency,
+            prewarm_payload=prewarm_payload,
         ).with_prefixed_names("InvalidateLambda")
     )
 
 
-def _create_ssm_parameters(appconfig: dict, stack: Stack):
+def _create_ssm_parameters(appconfig: dict, stack: "Stack", context: "PipelineContext"):
     """Create SSM parameters for every item in the application configuration"""
-    clean_config = dict(appconfig)
-    clean_config.pop(".ssmash-config", None)
-    stack.merge_stack(
-        convert_hierarchy_to_ssm(clean_config).with_prefixed_names("SSMParam")
-    )
+    stack.merge_stack(context.parameter_stack)
 
 
-def _create_embedded_invalidations(appconfig: dict, stack: Stack):
+def _create_embedded_invalidations(
+    appconfig: dict, stack: "Stack", context: "PipelineContext"
+):
     """Invalidate the cache in applications that use some of these parameters
     (by restarting the application), as specified by configuration embedded
     inline in the input file.
     """
-    invalidatable_services = appconfig.get(".ssmash-config", {}).get("invalidations")
+    from ssmash.invalidation import limit_concurrent_invalidations
+    from ssmash.util import clean_logical_name
+
+    ssmash_config = context.ssmash_config
+    invalidatable_services = ssmash_config.get("invalidations")
     if not invalidatable_services:
         return
 
-    clean_config = dict(appconfig)
-    clean_config.pop(".ssmash-config", None)
-    invalidated_resources = _get_invalidated_resources(clean_config)
+    max_concurrent = ssmash_config.get("max-concurrent-restarts")
+    if max_concurrent is not None and (
+        not isinstance(max_concurrent, int)
+        or isinstance(max_concurrent, bool)
+        or max_concurrent < 1
+    ):
+        raise ValueError("max-concurrent-restarts must be a positive integer")
 
-    for appname, appresources in invalidated_resources.items():
+    invalidations = dict()
+    for appname, appresources in context.invalidated_resources.items():
         invalidator = invalidatable_services.get(appname)
         if not invalidator:
             # TODO this error message is a bit fragile
@@ -267,34 +1045,52 @@ def _create_embedded_invalidations(appconfig: dict, stack: Stack):
                 f"Parameter {appresources[0].Properties.Name} invalidates service {appname}, but that service is not defined."
             )
 
-        stack.merge_stack(
-            invalidator.create_resources(appresources).with_prefixed_names(
-                "Invalidate" + clean_logical_name(appname)
-            )
-        )
+        invalidations[appname] = invalidator.create_resources(
+            appresources
+        ).with_prefixed_names("Invalidate" + clean_logical_name(appname))
 
+    if max_concurrent is not None:
+        # Sort the applications, so that the template is stable
+        limit_concurrent_invalidations(
+            [invalidations[name] for name in sorted(invalidations)], max_concurrent
+        )
+    for invalidation in invalidations.values():
+        stack.merge_stack(invalidation)
 
-def _get_invalidated_resources(appconfig: dict) -> Dict[str, List[Resource]]:
-    """Lookup which applications are associated with resources.
 
-    Returns:
-        A dictionary of {application_name: [cfn_resource]}
+def _share_invalidation_functions(
+    appconfig: dict, stack: "Stack", context: "PipelineContext"
+):
+    """Use a single Lambda Function for all identical invalidations, if
+    enabled by the embedded configuration.
     """
-    result = dict()
+    from ssmash.invalidation import deduplicate_invalidation_functions
+
+    share_functions = context.ssmash_config.get("share-invalidation-functions", False)
+    if not isinstance(share_functions, bool):
+        raise ValueError("share-invalidation-functions must be true or false")
+    if share_functions:
+        deduplicate_invalidation_functions(stack)
 
-    for key, value in appconfig.items():
-        if isinstance(key, InvalidatingConfigKey):
-            for appname in key.invalidated_applications:
-                result.setdefault(appname, []).extend(key.dependent_resources)
-        if isinstance(value, dict):
-            for appname, appresources in _get_invalidated_resources(value).items():
-                result.setdefault(appname, []).extend(appresources)
 
-    return result
+def _limit_parallel_parameters(
+    max_parallel: int, appconfig: dict, stack: "Stack", context: "PipelineContext"
+):
+    from ssmash.converter import limit_parallel_parameter_creation
+
+    limit_parallel_parameter_creation(stack, max_parallel)
 
 
-def _initialise_stack(description: str) -> Stack:
+def _retain_parameters(appconfig: dict, stack: "Stack", context: "PipelineContext"):
+    from ssmash.converter import retain_parameters
+
+    retain_parameters(stack)
+
+
+def _initialise_stack(description: str) -> "Stack":
     """Create a basic Flying Circus stack, customised for ssmash"""
+    from flyingcircus.core import Stack
+
     stack = Stack(Description=description)
 
     from ssmash import __version__
@@ -308,6 +1104,10 @@ def _initialise_stack(description: str) -> Stack:
 
 def _load_appconfig_from_yaml(input) -> dict:
     """Load a YAML description of the application configuration"""
+    import yaml
+
+    from ssmash.yamlhelper import SsmashYamlLoader
+
     appconfig = yaml.load(input, SsmashYamlLoader)
 
     # Note that PyYAML returns None for an empty file, rather than an empty
@@ -318,7 +1118,9 @@ def _load_appconfig_from_yaml(input) -> dict:
     return appconfig
 
 
-def _write_cfn_template(output, appconfig: dict, stack: Stack):
+def _write_cfn_template(
+    output, appconfig: dict, stack: "Stack", context: "PipelineContext"
+):
     """Write the CloudFormation template"""
     output.write(stack.export("yaml"))
 
@@ -0,0 +1,118 @@
+"""A thin client for sending conversions to a running `ssmash serve` process.
+
+This module only uses the standard library, so that the client starts as
+quickly as possible.
+"""
+
+import argparse
+import json
+import socket
+import sys
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+
+class ConversionResult(NamedTuple):
+    """The outcome of a conversion performed by the server."""
+
+    exit_code: int
+    output: str
+    error: Optional[str] = None
+
+
+def convert(socket_path: str, input: str, args: List[str]) -> ConversionResult:
+    """Ask a running server to convert some application configuration.
+
+    Parameters:
+        socket_path: The Unix socket that the server is listening on.
+        input: The application configuration YAML.
+        args: Extra command line arguments for the conversion, exactly as
+            they would be given to `ssmash` (eg. chained commands).
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        with connection.makefile("rwb") as stream:
+            write_message(stream, {"input": input, "args": args})
+            response = read_message(stream)
+
+    return ConversionResult(
+        exit_code=response["exit_code"],
+        output=response["output"],
+        error=response.get("error"),
+    )
+
+
+def read_message(stream) -> dict:
+    """Read a single JSON message from a binary stream.
+
+    Raises:
+        ValueError: If the message is missing or malformed.
+    """
+    line = stream.readline()
+    if not line:
+        raise ValueError("The connection was closed without a message")
+    message = json.loads(line.decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("Messages must be JSON objects")
+    return message
+
+
+def write_message(stream, message: dict):
+    """Write a single JSON message to a binary stream."""
+    stream.write(json.dumps(message).encode("utf-8") + b"\n")
+    stream.flush()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="ssmash-client",
+        allow_abbrev=False,
+        description="Convert application configuration using a running "
+        "`ssmash serve` process. Any other arguments are passed to ssmash.",
+    )
+    parser.add_argument(
+        "--socket",
+        required=True,
+        help="The Unix socket that the server is listening on.",
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        default="-",
+        help="Where to read the application configuration YAML file.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help="Where to write the CloudFormation template file.",
+    )
+    args, ssmash_args = parser.parse_known_args(argv)
+    if ssmash_args[:1] == ["--"]:
+        ssmash_args = ssmash_args[1:]
+
+    if args.input == "-":
+        input = sys.stdin.read()
+    else:
+        with open(args.input) as fp:
+            input = fp.read()
+
+    try:
+        result = convert(args.socket, input, ssmash_args)
+    except (OSError, ValueError) as ex:
+        print(f"Error: Can't use the ssmash server: {ex}", file=sys.stderr)
+        return 1
+
+    if result.error:
+        print(f"Error: {result.error}", file=sys.stderr)
+    if args.output == "-":
+        sys.stdout.write(result.output)
+    elif result.exit_code == 0 or result.output:
+        with open(args.output, "w") as fp:
+            fp.write(result.output)
+    return result.exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,11 @@ import re
 from typing import Any
 from typing import List
 
+from flyingcircus.core import LogicalName
 from flyingcircus.core import Stack
 from flyingcircus.service.ssm import SSMParameter
 from flyingcircus.service.ssm import SSMParameterProperties
+from ssmash.stack import get_resources
 from ssmash.util import clean_logical_name
 
 
@@ -25,6 +27,33 @@ def convert_hierarchy_to_ssm(appconfig: dict) -> Stack:
     return stack
 
 
+def limit_parallel_parameter_creation(stack: Stack, max_parallel: int) -> None:
+    """Limit the number of SSM Parameters that CloudFormation creates at once.
+
+    SSM throttles CloudFormation if it creates too many parameters
+    concurrently. We avoid that by dividing the parameters into
+    `max_parallel` chains, where each parameter depends on the previous
+    parameter in the same chain.
+    """
+    if max_parallel < 1:
+        raise ValueError("Must allow at least one parameter to be created at a time")
+
+    parameters = get_resources(stack, SSMParameter)
+    for previous, resource in zip(parameters, parameters[max_parallel:]):
+        resource.DependsOn.append(LogicalName(previous))
+
+
+def retain_parameters(stack: Stack) -> None:
+    """Keep the SSM Parameters when CloudFormation deletes their resources.
+
+    This lets a parameter move to a different resource (eg. when switching
+    to bulk parameters) without CloudFormation deleting it when it cleans up
+    the old resource.
+    """
+    for resource in get_resources(stack, SSMParameter):
+        resource.DeletionPolicy = "Retain"
+
+
 def create_params_from_dict(
     stack: Stack, appconfig: dict, path_components: List[str] = None
 ) -> None:
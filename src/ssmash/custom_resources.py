@@ -4,54 +4,288 @@
 # NB: Don't put imports here for Lambda function handlers. They should be self-contained
 
 
-# TODO tests
-
 # FIXME multiple problems with the shipped cfnresponse module:
-#   - doesn't let us set the `Reason` in the response
-#   - uses the log stream name as the physical ID on error
+#   - older versions don't let us set the `Reason` in the response
+#   - uses the log stream name as the physical ID on error, unless we supply one
 #   - consider bringing the module in locally as a pseudo-dependency, so that we can reference it.
 
 
+def emit_embedded_metrics(metrics, logical_id):
+    """Log metrics for each target, in CloudWatch Embedded Metric Format.
+
+    This is included in the inline code of the handlers that use it. Metrics
+    are best-effort, so failures are only logged.
+    """
+    import json
+    import logging
+    import time
+
+    try:
+        # Worker threads may still be updating the metrics, so use a copy
+        for target, values in list(metrics.items()):
+            values = dict(values)
+            emf = {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": "ssmash",
+                        "Dimensions": [["Target"]],
+                        "Metrics": [
+                            {
+                                "Name": n,
+                                "Unit": "Milliseconds" if n[-4:] == "Time" else "Count",
+                            }
+                            for n in values
+                        ],
+                    }
+                ],
+            }
+            # Print directly, since the logging module adds a prefix
+            print(
+                json.dumps(
+                    dict(values, _aws=emf, Target=target, LogicalResourceId=logical_id)
+                )
+            )
+    except Exception:
+        logging.getLogger("metrics").warning("Unable to log metrics", exc_info=True)
+
+
 def replace_lambda_context_resource_handler(event, context):
-    """Lambda handler function to replace the execution context for a Lambda function, as a CloudFormation resource.
+    """Lambda handler function to replace the execution context for Lambda functions, as a CloudFormation resource.
 
     This is intended to be used in an inline deployment. The physical ID is
-    the Revision ID of the Lambda Function
+    the Revision ID of the Lambda Function, or a digest of all the Revision
+    IDs if there are several Functions. Functions can also be discovered
+    from CloudFormation stacks.
+
+    We record a digest of the dependent parameters in each Function's
+    environment, and leave the Function alone if the digest already matches
+    (eg. when CloudFormation retries a request).
+
+    Updated Functions can optionally be pre-warmed with several concurrent
+    invocations. Pre-warming is best-effort, so it's failures are only logged.
+
+    The time taken to update each Function is logged as a CloudWatch metric.
     """
     # The `cfnresponse` module is injected at runtime if you are executing a Custom Resource handler
     # noinspection PyUnresolvedReferences
     import cfnresponse
 
+    import hashlib
     import logging
-    from datetime import datetime
+    import random
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures import wait
 
     logging.basicConfig(level=logging.DEBUG)
     LOGGER = logging.getLogger("replacer")
+
+    #: Metrics for each target, which are logged in CloudWatch Embedded Metric Format
+    metrics = {}
+
+    def emit_metrics():
+        emit_embedded_metrics(metrics, event.get("LogicalResourceId"))
+
+    response = {}
+    physical_id = event.get("PhysicalResourceId")
+
+    def send_response(status, reason=None):
+        emit_metrics()
+        try:
+            cfnresponse.send(
+                event, context, status, response, physical_id, reason=reason
+            )
+        except TypeError:
+            # Older versions of the cfnresponse module don't accept a reason
+            cfnresponse.send(event, context, status, response, physical_id)
+
     try:
         import boto3
 
         lambdaclient = boto3.client("lambda")
-        response = {}
-        physical_id = event.get("PhysicalResourceId")
 
-        if event["RequestType"] in ["Create", "Update"]:
-            properties = event["ResourceProperties"]
-            old_config = lambdaclient.get_function_configuration(
-                FunctionName=properties["FunctionName"]
-            )
+        # Leave enough time to send a response before the Lambda times out
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - 5
 
-            new_environment = old_config["Environment"]["Variables"]
-            new_environment["SSMASH_UPDATED_TIMESTAMP"] = datetime.isoformat(
-                datetime.utcnow()
-            )
+        def get_config_digest(properties):
+            digest = hashlib.sha256()
+            for name, value in sorted(
+                zip(
+                    properties.get("IgnoredParameterNames", []),
+                    properties.get("IgnoredParameterKeys", []),
+                )
+            ):
+                digest.update("{}\0{}\0".format(name, value).encode("utf-8"))
+            return digest.hexdigest()
+
+        config_digest = get_config_digest(event["ResourceProperties"])
+        prewarm_concurrency = int(
+            event["ResourceProperties"].get("PrewarmConcurrency", 0)
+        )
+        prewarm_payload = event["ResourceProperties"].get("PrewarmPayload", "{}")
 
-            response = lambdaclient.update_function_configuration(
-                FunctionName=properties["FunctionName"],
-                Environment={"Variables": new_environment},
-                RevisionId=old_config["RevisionId"],
+        def prewarm(function_name, start):
+            # Wait for the update to finish, so that new execution contexts
+            # use the new configuration.
+            polls = 0
+            while True:
+                polls += 1
+                config = lambdaclient.get_function_configuration(
+                    FunctionName=function_name
+                )
+                status = config.get("LastUpdateStatus", "Successful")
+                if status != "InProgress" or time.monotonic() + 1 > deadline:
+                    break
+                time.sleep(1)
+            metrics[function_name]["Polls"] = polls
+            if status == "Failed":
+                # The function still has it's old configuration
+                raise RuntimeError(
+                    "Update to {} failed: {}".format(
+                        function_name, config.get("LastUpdateStatusReason")
+                    )
+                )
+            if status == "Successful":
+                metrics[function_name]["StabilityTime"] = (
+                    time.monotonic() - start
+                ) * 1000
+            if status != "Successful":
+                LOGGER.warning(
+                    "Not pre-warming %s, because it's update is %s",
+                    function_name,
+                    status,
+                )
+                return
+
+            # Synchronous invocations overlap, so each one needs it's own
+            # execution context
+            executor = ThreadPoolExecutor(prewarm_concurrency)
+            futures = [
+                executor.submit(
+                    lambdaclient.invoke,
+                    FunctionName=function_name,
+                    InvocationType="RequestResponse",
+                    Payload=prewarm_payload.encode("utf-8"),
+                )
+                for _ in range(prewarm_concurrency)
+            ]
+            done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+            executor.shutdown(wait=False)
+            failed = len(not_done) + len(
+                [f for f in done if f.exception() or "FunctionError" in f.result()]
             )
+            if failed:
+                LOGGER.warning(
+                    "%d of %d pre-warming invocations of %s failed",
+                    failed,
+                    prewarm_concurrency,
+                    function_name,
+                )
+
+        def replace_context(function_name):
+            # Another update to the function may race with ours, so we retry
+            # if the revision has changed underneath us.
+            start = time.monotonic()
+            throttles = 0
+            for attempt in range(10):
+                old_config = lambdaclient.get_function_configuration(
+                    FunctionName=function_name
+                )
+
+                new_environment = old_config.get("Environment", {}).get("Variables", {})
+
+                # Only replace the context if the function hasn't already
+                # seen these parameter values.
+                if new_environment.get("SSMASH_CONFIG_DIGEST") == config_digest:
+                    LOGGER.info("Context is up to date for %s", function_name)
+                    return old_config
+
+                # Earlier versions used a timestamp, which forced a new
+                # context on every update
+                new_environment.pop("SSMASH_REQUEST_ID", None)
+                new_environment.pop("SSMASH_UPDATED_TIMESTAMP", None)
+                new_environment["SSMASH_CONFIG_DIGEST"] = config_digest
 
-            physical_id = response["RevisionId"]
+                try:
+                    new_config = lambdaclient.update_function_configuration(
+                        FunctionName=function_name,
+                        Environment={"Variables": new_environment},
+                        RevisionId=old_config["RevisionId"],
+                    )
+                except Exception as ex:
+                    code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+                    if code not in (
+                        "PreconditionFailedException",
+                        "ResourceConflictException",
+                        "TooManyRequestsException",
+                    ):
+                        raise
+                    if code == "TooManyRequestsException":
+                        throttles += 1
+                    delay = random.uniform(0, min(5.0, 0.2 * 2 ** attempt))
+                    if time.monotonic() + delay > deadline:
+                        raise
+                    LOGGER.info("Retrying update to %s after %s", function_name, code)
+                    time.sleep(delay)
+                    continue
+
+                # boto3 retries throttled requests itself, as well
+                metrics[function_name] = {
+                    "UpdateTime": (time.monotonic() - start) * 1000,
+                    "ThrottleRetries": throttles
+                    + new_config.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+                }
+                if prewarm_concurrency:
+                    prewarm(function_name, start)
+                return new_config
+            raise RuntimeError("Too many conflicting updates to " + function_name)
+
+        def get_stack_functions(stack_name):
+            cloudformation = boto3.client("cloudformation")
+            paginator = cloudformation.get_paginator("list_stack_resources")
+            for page in paginator.paginate(StackName=stack_name):
+                for resource in page["StackResourceSummaries"]:
+                    if resource["ResourceType"] != "AWS::Lambda::Function":
+                        continue
+                    # Functions that are still being created don't have a
+                    # physical ID yet, and don't need to be replaced
+                    physical_id = resource.get("PhysicalResourceId")
+                    if not physical_id:
+                        continue
+                    # Don't replace our own context while we are running
+                    if physical_id == context.function_name:
+                        continue
+                    yield physical_id
+
+        if event["RequestType"] in ["Create", "Update"]:
+            properties = event["ResourceProperties"]
+            function_names = list(properties.get("FunctionNames", []))
+            if "FunctionName" in properties:
+                function_names.append(properties["FunctionName"])
+            for stack_name in properties.get("StackNames", []):
+                function_names.extend(get_stack_functions(stack_name))
+            LOGGER.info("Replacing context for %d functions", len(function_names))
+
+            executor = ThreadPoolExecutor(max(1, min(len(function_names), 10)))
+            futures = [executor.submit(replace_context, f) for f in function_names]
+            done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+            executor.shutdown(wait=False)
+            if not_done:
+                raise RuntimeError(
+                    "Timed out replacing the context for {} functions".format(
+                        len(not_done)
+                    )
+                )
+
+            revisions = [f.result()["RevisionId"] for f in futures]
+            if len(revisions) == 1:
+                response = futures[0].result()
+                physical_id = revisions[0]
+            else:
+                physical_id = hashlib.sha256(
+                    ",".join(revisions).encode("utf-8")
+                ).hexdigest()
         elif event["RequestType"] == "Delete":
             # Doesn't make any sense to delete a deployment - just return
             LOGGER.info(
@@ -60,59 +294,277 @@ def replace_lambda_context_resource_handler(event, context):
             )
         else:
             raise ValueError("Unknown CloudFormation request type")
-        cfnresponse.send(event, context, cfnresponse.SUCCESS, response, physical_id)
+        send_response(cfnresponse.SUCCESS)
     except Exception as ex:
-        LOGGER.exception("argh!")  # TODO
-        cfnresponse.send(event, context, cfnresponse.FAILED, {})
+        LOGGER.exception("Unable to replace Lambda execution contexts")
+        send_response(cfnresponse.FAILED, "{}: {}".format(type(ex).__name__, ex))
 
 
 def restart_ecs_service_resource_handler(event, context):
-    """Lambda handler function to restart an ECS service, as a CloudFormation resource.
+    """Lambda handler function to restart ECS services, as a CloudFormation resource.
 
     This is intended to be used in an inline deployment. The physical ID is
-    the ID of the ECS service deployment
+    the ID of the ECS service deployment, or a digest of all the deployment
+    IDs if there are several services.
+
+    We poll the services until they are stable, backing off gradually. If
+    they are still not stable shortly before the Lambda would time out, then
+    we report a failure (so that CloudFormation doesn't wait an hour for us).
+
+    If a service is already part way through a deployment that ssmash started
+    after our parameters were written (eg. because several configuration
+    stacks are deployed together), then we join that deployment rather than
+    starting another one.
+
+
+    The time taken to restart each service, and for it to become stable, is
+    logged as a CloudWatch metric.
     """
     # The `cfnresponse` module is injected at runtime if you are executing a Custom Resource handler
     # noinspection PyUnresolvedReferences
     import cfnresponse
 
+    import hashlib
     import logging
+    import random
+    import time
+    from concurrent.futures import ThreadPoolExecutor
 
     logging.basicConfig(level=logging.DEBUG)
     LOGGER = logging.getLogger("restarter")  # TODO
+
+    #: Metrics for each target, which are logged in CloudWatch Embedded Metric Format
+    metrics = {}
+
+    def emit_metrics():
+        emit_embedded_metrics(metrics, event.get("LogicalResourceId"))
+
+    #: Seconds to leave for sending the response before the Lambda times out
+    RESPONSE_MARGIN = 10
+    #: Seconds between the first polls for stability, and the maximum interval
+    INITIAL_POLL_INTERVAL = 5
+    MAX_POLL_INTERVAL = 30
+
+    response = {}
+    physical_id = event.get("PhysicalResourceId")
+
+    def send_response(status, reason=None):
+        emit_metrics()
+        try:
+            cfnresponse.send(
+                event, context, status, response, physical_id, reason=reason
+            )
+        except TypeError:
+            # Older versions of the cfnresponse module don't accept a reason
+            cfnresponse.send(event, context, status, response, physical_id)
+
     try:
         import boto3
 
-        # TODO is there a way to make this idempotent on event["RequestId"]? OR just hope it only gets called once...
-
         ecs = boto3.client("ecs")
-        response = {}
-        physical_id = event.get("PhysicalResourceId")
+        deadline = (
+            time.monotonic()
+            + context.get_remaining_time_in_millis() / 1000
+            - RESPONSE_MARGIN
+        )
+
+        def describe_services(cluster, services, **kwargs):
+            # DescribeServices accepts at most 10 services per call
+            described = []
+            for i in range(0, len(services), 10):
+                result = ecs.describe_services(
+                    cluster=cluster, services=services[i : i + 10], **kwargs
+                )
+                if result.get("failures"):
+                    raise ValueError(
+                        "Unable to describe ECS services: {}".format(result["failures"])
+                    )
+                described.extend(result["services"])
+            return described
+
+        def is_stable(service):
+            return (
+                len(service["deployments"]) == 1
+                and service["runningCount"] == service["desiredCount"]
+            )
+
+        parameters_modified = []
+
+        def get_parameters_modified_time():
+            # Find when our parameters were last written, or None if we
+            # can't tell. This is only looked up once, and only if needed.
+            if parameters_modified:
+                return parameters_modified[0]
+
+            names = event["ResourceProperties"].get("IgnoredParameterNames") or []
+            latest = None
+            try:
+                ssm = boto3.client("ssm")
+                for i in range(0, len(names), 10):
+                    result = ssm.get_parameters(Names=names[i : i + 10])
+                    if result.get("InvalidParameters"):
+                        latest = None
+                        break
+                    for param in result["Parameters"]:
+                        if latest is None or param["LastModifiedDate"] > latest:
+                            latest = param["LastModifiedDate"]
+            except Exception:
+                LOGGER.warning(
+                    "Unable to find when parameters were modified", exc_info=True
+                )
+                latest = None
+
+            parameters_modified.append(latest)
+            return latest
+
+        def find_joinable_deployment(service, ssmash_deployment_id):
+            # We can join a deployment that ssmash started, as long as it
+            # is still in progress, and it started after our parameters were
+            # written (so that every new task will see the new values).
+            deployment = service["deployments"][0]
+            if deployment["id"] != ssmash_deployment_id or is_stable(service):
+                return None
+
+            modified = get_parameters_modified_time()
+            if modified is None or deployment["createdAt"] <= modified:
+                return None
+            return deployment
+
+        def restart_service(cluster, service):
+            # CloudFormation may retry a request, but we only want to restart
+            # once. So we tag the service with the request that restarted it.
+            tags = {t["key"]: t["value"] for t in service.get("tags", [])}
+            if tags.get("ssmash:request-id") == event["RequestId"]:
+                LOGGER.info("Already restarted %s", service["serviceArn"])
+                return tags.get("ssmash:deployment-id")
+
+            start = time.monotonic()
+            deployment = find_joinable_deployment(
+                service, tags.get("ssmash:deployment-id")
+            )
+            if deployment:
+                LOGGER.info(
+                    "Joining deployment %s of %s",
+                    deployment["id"],
+                    service["serviceArn"],
+                )
+            else:
+                # Restarting many services at once can be throttled, even
+                # after boto3 has retried
+                throttles = 0
+                for attempt in range(8):
+                    try:
+                        update_result = ecs.update_service(
+                            cluster=cluster,
+                            service=service["serviceArn"],
+                            forceNewDeployment=True,
+                        )
+                        break
+                    except Exception as ex:
+                        code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+                        if code != "ThrottlingException" or attempt == 7:
+                            raise
+                        throttles += 1
+                        delay = random.uniform(0, min(5.0, 0.2 * 2 ** attempt))
+                        if time.monotonic() + delay > deadline:
+                            raise
+                        LOGGER.info(
+                            "Retrying restart of %s after %s",
+                            service["serviceArn"],
+                            code,
+                        )
+                        time.sleep(delay)
+
+                # Get the deployment ID, which is first in the list. TODO pluck out newest using deployment["createdAt"]
+                deployment = update_result["service"]["deployments"][0]
+                # assert deployment["status"] == "PRIMARY" #TODO real error or don't bother
+
+                # boto3 retries throttled requests itself, as well
+                metrics[service["serviceArn"]] = {
+                    "UpdateTime": (time.monotonic() - start) * 1000,
+                    "ThrottleRetries": throttles
+                    + update_result.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+                }
+
+            # The service has already been restarted, so failing to tag it
+            # only means that a retried request will restart it again.
+            try:
+                ecs.tag_resource(
+                    resourceArn=service["serviceArn"],
+                    tags=[
+                        {"key": "ssmash:request-id", "value": event["RequestId"]},
+                        {"key": "ssmash:deployment-id", "value": deployment["id"]},
+                    ],
+                )
+            except Exception:
+                LOGGER.warning(
+                    "Unable to tag %s, so a retry will restart it again",
+                    service["serviceArn"],
+                    exc_info=True,
+                )
+            return deployment["id"]
+
+        def get_unstable_services(cluster, services):
+            return [
+                service["serviceArn"]
+                for service in describe_services(cluster, services)
+                if not is_stable(service)
+            ]
+
+        def wait_until_stable(cluster, services):
+            # Poll frequently at first, since small services restart quickly,
+            # then back off exponentially. The final poll happens just
+            # before the deadline.
+            pending = list(services)
+            interval = INITIAL_POLL_INTERVAL
+            start = time.monotonic()
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        "ECS services were not stable before the Lambda timeout: "
+                        "{}".format(", ".join(pending))
+                    )
+                time.sleep(min(interval, remaining))
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+                unstable = get_unstable_services(cluster, pending)
+                for service in pending:
+                    values = metrics.setdefault(service, {})
+                    values["Polls"] = values.get("Polls", 0) + 1
+                    if service not in unstable:
+                        values["StabilityTime"] = (time.monotonic() - start) * 1000
+                pending = unstable
+                if not pending:
+                    return
+                LOGGER.info("Waiting for %d ECS services to be stable", len(pending))
 
         if event["RequestType"] in ["Create", "Update"]:
-            # Restart the ECS service
-            #   FIXME this breaks if multiple restarts get scheduled
-            # FIXME Not sure how best to deal with timeouts... don't forget context.get_remaining_time_in_millis()
+            # Restart the ECS services concurrently
             properties = event["ResourceProperties"]
-            update_result = ecs.update_service(
-                cluster=properties["ClusterArn"],
-                service=properties["ServiceArn"],
-                forceNewDeployment=True,
+            cluster = properties["ClusterArn"]
+            services = describe_services(
+                cluster,
+                properties.get("ServiceArns") or [properties["ServiceArn"]],
+                include=["TAGS"],
             )
 
-            # Get the deployment ID, which is first in the list. TODO pluck out newest using deployment["createdAt"]
-            deployment = update_result["service"]["deployments"][0]
-            # assert deployment["status"] == "PRIMARY" #TODO real error or don't bother
-            physical_id = deployment["id"]
+            with ThreadPoolExecutor(min(len(services), 10)) as executor:
+                deployment_ids = list(
+                    executor.map(lambda s: restart_service(cluster, s), services)
+                )
+            services = [service["serviceArn"] for service in services]
 
-            # Poll until the ECS service reaches a steady state
-            ecs.get_waiter("services_stable").wait(
-                cluster=properties["ClusterArn"],
-                services=[properties["ServiceArn"]],
-                # TODO use WaiterConfig to timeout inside out expected timeout
-            )
+            if len(deployment_ids) == 1:
+                physical_id = deployment_ids[0]
+            else:
+                physical_id = hashlib.sha256(
+                    ",".join(deployment_ids).encode("utf-8")
+                ).hexdigest()
 
-            # FIXME check result from ecs waiter
+            # A WaitCondition may be waiting for the deployment instead of us
+            if str(properties.get("WaitForStability", "true")).lower() != "false":
+                wait_until_stable(cluster, services)
         elif event["RequestType"] == "Delete":
             # Doesn't make any sense to delete an ECS deployment - just return
             LOGGER.info(
@@ -120,8 +572,184 @@ def restart_ecs_service_resource_handler(event, context):
             )
         else:
             raise ValueError("Unknown CloudFormation request type")
-        cfnresponse.send(event, context, cfnresponse.SUCCESS, response, physical_id)
-        # TODO notify (optional) CFN waiter
+        send_response(cfnresponse.SUCCESS)
+    except Exception as ex:
+        LOGGER.exception("Unable to restart ECS services")
+        send_response(cfnresponse.FAILED, "{}: {}".format(type(ex).__name__, ex))
+
+
+def signal_ecs_deployment_handler(event, context):
+    """Lambda handler function to signal a CloudFormation WaitCondition when an ECS deployment finishes.
+
+    This is intended to be used in an inline deployment, as the target for
+    "ECS Deployment State Change" events. The services to watch and the
+    WaitCondition handle are supplied as environment variables.
+    """
+    import json
+    import logging
+    import os
+    import urllib.request
+
+    logging.basicConfig(level=logging.DEBUG)
+    LOGGER = logging.getLogger("signaller")
+
+    services = os.environ["SSMASH_SERVICES"].split(",")
+    service_arn = (event.get("resources") or [""])[0]
+    if not any(service_arn == s or service_arn.endswith("/" + s) for s in services):
+        LOGGER.info("Ignoring deployment event for service %s", service_arn)
+        return
+
+    event_name = event["detail"]["eventName"]
+    if event_name == "SERVICE_DEPLOYMENT_COMPLETED":
+        status = "SUCCESS"
+    elif event_name == "SERVICE_DEPLOYMENT_FAILED":
+        status = "FAILURE"
+    else:
+        LOGGER.info("Ignoring %s event for service %s", event_name, service_arn)
+        return
+
+    # Each service signals once, so the WaitCondition can count them
+    body = json.dumps(
+        {
+            "Status": status,
+            "Reason": "{} for {}".format(event_name, service_arn),
+            "UniqueId": service_arn,
+            "Data": event["detail"].get("deploymentId", ""),
+        }
+    ).encode("utf-8")
+    request = urllib.request.Request(
+        os.environ["SSMASH_WAIT_HANDLE_URL"],
+        data=body,
+        method="PUT",
+        headers={"Content-Type": ""},
+    )
+    with urllib.request.urlopen(request) as response:
+        LOGGER.info(
+            "Sent %s signal for %s (HTTP %s)", status, service_arn, response.status
+        )
+
+
+def write_ssm_parameters_resource_handler(event, context):
+    """Lambda handler function to write a shard of SSM parameters, as a CloudFormation resource.
+
+    This is intended to be used in an inline deployment. The physical ID is
+    derived from the stack and logical ID, and doesn't change. Parameters
+    that are removed from the shard are deleted, unless the shard was
+    deployed with `RetainParameters`.
+    """
+    # The `cfnresponse` module is injected at runtime if you are executing a Custom Resource handler
+    # noinspection PyUnresolvedReferences
+    import cfnresponse
+
+    import logging
+    import random
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures import wait
+
+    logging.basicConfig(level=logging.DEBUG)
+    LOGGER = logging.getLogger("writer")
+
+    physical_id = event.get("PhysicalResourceId") or "{}-{}".format(
+        event["StackId"].split("/")[1], event["LogicalResourceId"]
+    )
+
+    def send_response(status, reason=None):
+        try:
+            cfnresponse.send(event, context, status, {}, physical_id, reason=reason)
+        except TypeError:
+            # Older versions of the cfnresponse module don't accept a reason
+            cfnresponse.send(event, context, status, {}, physical_id)
+
+    try:
+        import boto3
+
+        ssm = boto3.client("ssm")
+
+        # Leave enough time to send a response before the Lambda times out
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - 5
+
+        def call_with_retry(func, **kwargs):
+            # SSM has a low rate limit for writes, so we expect to be throttled
+            for attempt in range(8):
+                try:
+                    return func(**kwargs)
+                except Exception as ex:
+                    code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+                    if code not in ("ThrottlingException", "TooManyUpdates"):
+                        raise
+                    if attempt == 7:
+                        raise
+                    delay = random.uniform(0, min(10.0, 0.2 * 2 ** attempt))
+                    if time.monotonic() + delay > deadline:
+                        raise
+                    time.sleep(delay)
+
+        def get_parameters(properties):
+            return {p["Name"]: p for p in properties.get("Parameters", [])}
+
+        if event["RequestType"] in ["Create", "Update"]:
+            properties = event["ResourceProperties"]
+            new_params = get_parameters(properties)
+            old_params = get_parameters(event.get("OldResourceProperties", {}))
+        elif event["RequestType"] == "Delete":
+            properties = event["ResourceProperties"]
+            new_params = {}
+            old_params = get_parameters(properties)
+        else:
+            raise ValueError("Unknown CloudFormation request type")
+
+        # Write new and changed parameters concurrently
+        changed_params = [
+            p for name, p in sorted(new_params.items()) if old_params.get(name) != p
+        ]
+        executor = ThreadPoolExecutor(int(properties.get("MaxConcurrency", 5)))
+        futures = [
+            executor.submit(
+                call_with_retry,
+                ssm.put_parameter,
+                Name=p["Name"],
+                Type=p["Type"],
+                Value=p["Value"],
+                Overwrite=True,
+            )
+            for p in changed_params
+        ]
+        done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+        for future in not_done:
+            future.cancel()
+        executor.shutdown(wait=False)
+        if not_done:
+            raise TimeoutError(
+                "Only wrote {} of {} parameters before the Lambda timeout".format(
+                    len(done), len(futures)
+                )
+            )
+        for future in futures:
+            future.result()
+
+        # Delete parameters that have been removed, in batches. Like a
+        # DeletionPolicy, this is decided by the previously deployed template.
+        removed_names = sorted(set(old_params).difference(new_params))
+        deployed = event.get("OldResourceProperties") or properties
+        if str(deployed.get("RetainParameters", "false")).lower() == "true":
+            LOGGER.info("Retaining %d removed parameters", len(removed_names))
+            removed_names = []
+        for i in range(0, len(removed_names), 10):
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    "Only deleted {} of {} parameters before the Lambda timeout".format(
+                        i, len(removed_names)
+                    )
+                )
+            call_with_retry(ssm.delete_parameters, Names=removed_names[i : i + 10])
+
+        LOGGER.info(
+            "Wrote %d parameters and deleted %d parameters",
+            len(changed_params),
+            len(removed_names),
+        )
+        send_response(cfnresponse.SUCCESS)
     except Exception as ex:
-        LOGGER.exception("argh!")  # TODO
-        cfnresponse.send(event, context, cfnresponse.FAILED, {})
+        LOGGER.exception("Unable to write SSM parameters")
+        send_response(cfnresponse.FAILED, "{}: {}".format(type(ex).__name__, ex))
@@ -0,0 +1,242 @@
+"""Tools for comparing the parameters in two versions of a template."""
+
+import hashlib
+import json
+import os
+from typing import Any
+from typing import Dict
+from typing import FrozenSet
+from typing import NamedTuple
+from typing import Tuple
+
+import yaml
+from flyingcircus.core import AmazonCFNDumper
+from flyingcircus.core import Stack
+from flyingcircus.intrinsic_function import Ref
+from flyingcircus.service.ssm import SSMParameter
+
+from ssmash.bulk import BULK_PARAMETERS_RESOURCE_TYPE
+from ssmash.yamlhelper import CfnTemplateYamlLoader
+
+#: The custom resources that invalidate an application, and the names of the
+#: properties that can specify the target application(s).
+INVALIDATION_TARGET_PROPERTIES = {
+    "Custom::ReplaceLambdaContext": ("FunctionName", "FunctionNames", "StackNames"),
+    "Custom::RestartEcsService": ("ServiceArn", "ServiceArns"),
+}
+
+#: A random key for hashing parameter values. Both templates are hashed in the
+#: same run, so the hashes only need to be comparable within a single run.
+_HASH_KEY = os.urandom(16)
+
+
+class Invalidation(NamedTuple):
+    """Summary of a custom resource that invalidates an application."""
+
+    resource_type: str
+    target: Any
+    dependencies: FrozenSet[str]
+
+
+class TemplateIndex(NamedTuple):
+    """Index of the parts of a template that matter for a comparison."""
+
+    #: Hash of every parameter's type and value, indexed by parameter name
+    parameters: Dict[str, str]
+
+    #: The invalidations in this template, indexed by their logical name
+    invalidations: Dict[str, Invalidation]
+
+
+class TemplateDiff(NamedTuple):
+    """The differences between two templates."""
+
+    added: Dict[str, str]
+    removed: Dict[str, str]
+    changed: Dict[str, Tuple[str, str]]
+    invalidations: Dict[str, Invalidation]
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.removed or self.changed or self.invalidations)
+
+    def as_report(self) -> dict:
+        """Describe the differences as plain data, suitable for output."""
+        return {
+            "added": [
+                {"name": name, "hash": value_hash}
+                for name, value_hash in sorted(self.added.items())
+            ],
+            "removed": [
+                {"name": name, "hash": value_hash}
+                for name, value_hash in sorted(self.removed.items())
+            ],
+            "changed": [
+                {"name": name, "old_hash": old_hash, "new_hash": new_hash}
+                for name, (old_hash, new_hash) in sorted(self.changed.items())
+            ],
+            "invalidations": [
+                {
+                    "resource": logical_name,
+                    "type": invalidation.resource_type,
+                    "target": invalidation.target,
+                }
+                for logical_name, invalidation in sorted(self.invalidations.items())
+            ],
+        }
+
+
+def diff_templates(old: TemplateIndex, new: TemplateIndex) -> TemplateDiff:
+    """Compare the parameters and invalidations in two templates."""
+    old_names = old.parameters.keys()
+    new_names = new.parameters.keys()
+
+    added = {name: new.parameters[name] for name in new_names - old_names}
+    removed = {name: old.parameters[name] for name in old_names - new_names}
+    changed = {
+        name: (old.parameters[name], new.parameters[name])
+        for name in new_names & old_names
+        if old.parameters[name] != new.parameters[name]
+    }
+
+    # An invalidation fires whenever CloudFormation sees a change in the
+    # custom resource, which includes any change to the parameters it
+    # depends upon.
+    invalidations = {
+        logical_name: invalidation
+        for logical_name, invalidation in new.invalidations.items()
+        if old.invalidations.get(logical_name) != invalidation
+        or not invalidation.dependencies.isdisjoint(changed)
+    }
+
+    return TemplateDiff(
+        added=added, removed=removed, changed=changed, invalidations=invalidations
+    )
+
+
+def index_stack(stack: Stack) -> TemplateIndex:
+    """Create an index of a Flying Circus stack, for comparison purposes."""
+    parameters = dict()
+    names_by_ref = dict()
+
+    for resource in stack.Resources.values():
+        if isinstance(resource, SSMParameter):
+            name = resource.Properties.Name
+            parameters[name] = hash_parameter_value(
+                resource.Properties.Type, resource.Properties.Value
+            )
+            names_by_ref[Ref(resource)] = name
+        elif _is_bulk_parameters(resource):
+            parameters.update(_index_bulk_parameters(resource))
+
+    invalidations = dict()
+    for logical_name, resource in stack.Resources.items():
+        if not isinstance(resource, dict):
+            continue
+        resource_type = resource.get("Type")
+        if resource_type not in INVALIDATION_TARGET_PROPERTIES:
+            continue
+
+        properties = resource["Properties"]
+        invalidations[logical_name] = Invalidation(
+            resource_type=resource_type,
+            target=_as_plain_data(_get_invalidation_target(resource_type, properties)),
+            dependencies=frozenset(
+                ref if isinstance(ref, str) else names_by_ref[ref]
+                for ref in properties.get("IgnoredParameterNames", [])
+                if isinstance(ref, str) or ref in names_by_ref
+            ),
+        )
+
+    return TemplateIndex(parameters=parameters, invalidations=invalidations)
+
+
+def index_template(template: dict) -> TemplateIndex:
+    """Create an index of a CloudFormation template that has been loaded as plain data."""
+    resources = (template or {}).get("Resources") or {}
+
+    parameters = dict()
+    names_by_logical_name = dict()
+
+    for logical_name, resource in resources.items():
+        if resource.get("Type") == "AWS::SSM::Parameter":
+            properties = resource["Properties"]
+            name = properties["Name"]
+            parameters[name] = hash_parameter_value(
+                properties["Type"], properties["Value"]
+            )
+            names_by_logical_name[logical_name] = name
+        elif _is_bulk_parameters(resource):
+            parameters.update(_index_bulk_parameters(resource))
+
+    invalidations = dict()
+    for logical_name, resource in resources.items():
+        resource_type = resource.get("Type")
+        if resource_type not in INVALIDATION_TARGET_PROPERTIES:
+            continue
+
+        properties = resource["Properties"]
+        dependencies = set()
+        for ref in properties.get("IgnoredParameterNames", []):
+            if isinstance(ref, str):
+                dependencies.add(ref)
+            elif isinstance(ref, dict) and ref.get("Ref") in names_by_logical_name:
+                dependencies.add(names_by_logical_name[ref["Ref"]])
+
+        invalidations[logical_name] = Invalidation(
+            resource_type=resource_type,
+            target=_get_invalidation_target(resource_type, properties),
+            dependencies=frozenset(dependencies),
+        )
+
+    return TemplateIndex(parameters=parameters, invalidations=invalidations)
+
+
+def load_template(input) -> dict:
+    """Load a CloudFormation template from a YAML (or JSON) file."""
+    return yaml.load(input, CfnTemplateYamlLoader)
+
+
+def hash_parameter_value(parameter_type: str, value: Any) -> str:
+    """Get a hash of a parameter value that can be safely displayed.
+
+    The hash is keyed with a secret that changes every run, so that a value
+    can't be found by guessing it and comparing the hashes. This means the
+    hashes from different runs can't be compared with each other.
+    """
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True)
+    data = f"{parameter_type}\0{value}".encode("utf-8")
+    return hashlib.blake2b(data, digest_size=8, key=_HASH_KEY).hexdigest()
+
+
+def _get_invalidation_target(resource_type: str, properties: dict) -> Any:
+    """Get the resource(s) that an invalidation acts upon."""
+    for name in INVALIDATION_TARGET_PROPERTIES[resource_type]:
+        if name in properties:
+            return properties[name]
+    return None
+
+
+def _is_bulk_parameters(resource: Any) -> bool:
+    return (
+        isinstance(resource, dict)
+        and resource.get("Type") == BULK_PARAMETERS_RESOURCE_TYPE
+    )
+
+
+def _index_bulk_parameters(resource: dict) -> Dict[str, str]:
+    """Get the hashed parameter values from a bulk parameters custom resource."""
+    return {
+        param["Name"]: hash_parameter_value(param["Type"], param["Value"])
+        for param in resource["Properties"]["Parameters"]
+    }
+
+
+def _as_plain_data(value: Any) -> Any:
+    """Convert a value in a Flying Circus stack into the plain data that
+    would be seen in the exported template.
+    """
+    if isinstance(value, str):
+        return value
+    return load_template(yaml.dump(value, Dumper=AmazonCFNDumper))
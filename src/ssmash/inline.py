@@ -0,0 +1,97 @@
+"""Tools to create inline Lambda Functions from the custom resource handlers."""
+
+import inspect
+import io
+import tokenize
+from typing import Callable
+from typing import Sequence
+
+from flyingcircus.service.lambda_ import Function
+
+#: The number of spaces used for each level of indentation in our source code
+SOURCE_INDENT = 4
+
+
+def create_inline_function(
+    handler: Callable, role, helpers: Sequence[Callable] = ()
+) -> Function:
+    """Create a Lambda Function with the source code of a handler inline.
+
+    CloudFormation limits the size of a template, and every invalidation has
+    it's own copy of the code. So the code is minified, and any helper
+    functions that the handler uses are included once alongside it.
+    """
+    function = Function.create_from_python_function(handler=handler, Role=role)
+    source = "\n".join(inspect.getsource(f) for f in list(helpers) + [handler])
+    function.Properties.Code["ZipFile"] = minify_source(source)
+    return function
+
+
+def minify_source(source: str) -> str:
+    """Make Python source code smaller, without changing what it does.
+
+    Comments, docstrings and blank lines are removed, lines inside brackets
+    are joined together, and each level of indentation is reduced to a single
+    space.
+    """
+    lines = source.splitlines()
+    removed = set()
+    protected = set()
+    string_starts = set()
+    continued = set()
+    comments = dict()
+
+    # A string on it's own is a docstring (or does nothing anyway)
+    previous = tokenize.NEWLINE
+    candidate = None
+    depth = 0
+    line_number = 0
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        if token.start[0] != line_number:
+            line_number = token.start[0]
+            if depth:
+                continued.add(line_number)
+        if token.type == tokenize.OP and token.string in "([{":
+            depth += 1
+        elif token.type == tokenize.OP and token.string in ")]}":
+            depth -= 1
+
+        if token.type in (tokenize.NL, tokenize.COMMENT):
+            if token.type == tokenize.COMMENT:
+                comments[token.start[0]] = token.start[1]
+            continue
+
+        if candidate and token.type == tokenize.NEWLINE:
+            removed.update(range(candidate.start[0], candidate.end[0] + 1))
+        candidate = None
+
+        if token.type == tokenize.STRING:
+            if token.end[0] > token.start[0]:
+                # Don't change the content of multi-line strings
+                string_starts.add(token.start[0])
+                protected.update(range(token.start[0] + 1, token.end[0] + 1))
+            if previous in (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT):
+                candidate = token
+        previous = token.type
+
+    result = []
+    for number, line in enumerate(lines, 1):
+        if number in removed:
+            continue
+        if number in protected:
+            result.append(line)
+            continue
+        if number in comments:
+            line = line[: comments[number]]
+        stripped = line.lstrip(" ")
+        if number not in string_starts:
+            stripped = stripped.rstrip()
+        if not stripped:
+            continue
+        if number in continued and result:
+            separator = "" if result[-1][-1] in "([{" or stripped[0] in ")]}" else " "
+            result[-1] += separator + stripped
+        else:
+            indent = (len(line) - len(line.lstrip(" "))) // SOURCE_INDENT
+            result.append(" " * indent + stripped)
+    return "\n".join(result) + "\n"
@@ -1,15 +1,44 @@
 """Tools to invalidate applications that depend on the parameters."""
 
+import hashlib
+from typing import Any
+from typing import Dict
 from typing import List
+from typing import Optional
+from typing import Set
 
+import yaml
+from flyingcircus.core import AmazonCFNDumper
+from flyingcircus.core import AWSObject
+from flyingcircus.core import LogicalName
 from flyingcircus.core import Stack
 from flyingcircus.intrinsic_function import GetAtt
+from flyingcircus.intrinsic_function import Join
 from flyingcircus.intrinsic_function import Ref
+from flyingcircus.service.cloudformation import WaitCondition
+from flyingcircus.service.cloudformation import WaitConditionHandle
+from flyingcircus.service.cloudformation import WaitConditionProperties
+from flyingcircus.service.events import Rule
+from flyingcircus.service.events import RuleProperties
 from flyingcircus.service.lambda_ import Function
+from flyingcircus.service.lambda_ import Permission
+from flyingcircus.service.lambda_ import PermissionProperties
 from flyingcircus.service.ssm import SSMParameter
 
+from ssmash.custom_resources import emit_embedded_metrics
 from ssmash.custom_resources import replace_lambda_context_resource_handler
 from ssmash.custom_resources import restart_ecs_service_resource_handler
+from ssmash.custom_resources import signal_ecs_deployment_handler
+from ssmash.inline import create_inline_function
+
+#: The event sent to a Lambda Function to pre-warm it, unless otherwise specified
+DEFAULT_PREWARM_PAYLOAD = '{"ssmash": "prewarm"}'
+
+#: CloudFormation types for the custom resources that invalidate applications
+INVALIDATION_RESOURCE_TYPES = {
+    "Custom::RestartEcsService",
+    "Custom::ReplaceLambdaContext",
+}
 
 
 def create_ecs_service_invalidation_stack(
@@ -18,8 +47,9 @@ def create_ecs_service_invalidation_stack(
     dependencies: List[SSMParameter],
     restart_role,
     timeout: int = 8 * 60,
+    asynchronous: bool = False,
 ) -> Stack:
-    """Create CloudFormation resources to invalidate a single ECS service.
+    """Create CloudFormation resources to invalidate one or more ECS services.
 
     This is accomplished by restarting the ECS service, which will force it to
     use the new parameters.
@@ -27,7 +57,9 @@ def create_ecs_service_invalidation_stack(
     Parameters:
         cluster: CloudFormation reference (eg. an ARN) to the cluster the service is in
         dependencies: SSM Parameters that this service uses
-        service: CloudFormation reference (eg. an ARN) to the ECS service to invalidate
+        service: CloudFormation reference (eg. an ARN) to the ECS service to
+            invalidate, or a list of references to several services in the
+            same cluster that should be restarted together.
         restart_role: CloudFormation reference (eg. an ARN) to an IAM role
             that will be used to restart the ECS service.
         timeout: Number of seconds to wait for the ECS service to detect the
@@ -35,24 +67,26 @@ def create_ecs_service_invalidation_stack(
             timeout it is presumed that the updated parameters are broken,
             and the changes will be rolled back. The default is 5 minutes,
             which should be enough for most services.
+        asynchronous: If set, the restart Lambda returns as soon as the
+            deployment has started, and a WaitCondition waits for ECS to
+            report that the deployment has finished. This means the timeout
+            is not limited by the maximum Lambda duration.
     """
     # TODO make restart_role optional, and create it on-the-fly if not provided
-    # TODO find a way to share role and lambda between multiple calls in the same stack? can de-dupe/cache based on identity in the final stack
-    # TODO get Lambda handler to have an internal timeout as well?
 
     stack = Stack(Description="Invalidate ECS service after parameter update")
 
     # Create an inline Lambda that can restart an ECS service, since this
     # isn't built-in CloudFormation functionality.
-    stack.Resources[
-        "RestartLambda"
-    ] = restart_service_lambda = Function.create_from_python_function(
-        handler=restart_ecs_service_resource_handler, Role=restart_role
+    stack.Resources["RestartLambda"] = restart_service_lambda = create_inline_function(
+        restart_ecs_service_resource_handler,
+        restart_role,
+        helpers=[emit_embedded_metrics],
     )
 
     # The Lambda timeout should be a bit longer than the restart timeout,
-    # to give some leeway.
-    restart_service_lambda.Properties.Timeout = timeout + 15
+    # to give some leeway. An asynchronous restart doesn't wait at all.
+    restart_service_lambda.Properties.Timeout = 60 if asynchronous else timeout + 15
 
     # Create a custom resource to restart the ECS service.
     #
@@ -67,21 +101,103 @@ def create_ecs_service_invalidation_stack(
         Properties=dict(
             ServiceToken=GetAtt(restart_service_lambda, "Arn"),
             ClusterArn=cluster,
-            ServiceArn=service,
             IgnoredParameterNames=[Ref(p) for p in dependencies],
             IgnoredParameterKeys=[GetAtt(p, "Value") for p in dependencies],
         ),
     )
+    if isinstance(service, list):
+        stack.Resources["Restarter"]["Properties"]["ServiceArns"] = service
+    else:
+        stack.Resources["Restarter"]["Properties"]["ServiceArn"] = service
 
-    # TODO consider creating a waiter anyway, so that the timeout is strictly reliable
+    if asynchronous:
+        stack.Resources["Restarter"]["Properties"]["WaitForStability"] = "false"
+        _add_ecs_deployment_waiter(stack, service, dependencies, restart_role, timeout)
 
     return stack
 
 
+def _add_ecs_deployment_waiter(
+    stack: Stack, service, dependencies: List[SSMParameter], role, timeout: int
+):
+    """Wait for ECS to report that the restarted services have been deployed.
+
+    ECS emits an event when each deployment finishes, which we forward to a
+    Lambda that signals a WaitCondition.
+    """
+    services = service if isinstance(service, list) else [service]
+    restarter = stack.Resources["Restarter"]
+
+    # A WaitCondition only waits when it is created, so we need a new
+    # WaitCondition (and handle) every time the parameters change.
+    suffix = _get_dependency_digest(dependencies)
+    stack.Resources[f"RestartHandle{suffix}"] = handle = WaitConditionHandle()
+    stack.Resources[f"RestartWaitCondition{suffix}"] = WaitCondition(
+        Properties=WaitConditionProperties(
+            Count=len(services), Handle=Ref(handle), Timeout=str(timeout)
+        ),
+        DependsOn=[LogicalName(restarter)],
+    )
+
+    # Create an inline Lambda that signals the WaitCondition
+    stack.Resources["SignalLambda"] = signal_lambda = create_inline_function(
+        signal_ecs_deployment_handler, role
+    )
+    signal_lambda.Properties.Timeout = 30
+    signal_lambda.Properties.Environment = dict(
+        Variables=dict(
+            SSMASH_SERVICES=services[0] if len(services) == 1 else Join(",", services),
+            SSMASH_WAIT_HANDLE_URL=Ref(handle),
+        )
+    )
+
+    # Forward deployment events from ECS to the signal Lambda
+    stack.Resources["DeploymentRule"] = rule = Rule(
+        Properties=RuleProperties(
+            Description="Signal ssmash when ECS services have been restarted",
+            EventPattern={
+                "source": ["aws.ecs"],
+                "detail-type": ["ECS Deployment State Change"],
+                "detail": {
+                    "eventName": [
+                        "SERVICE_DEPLOYMENT_COMPLETED",
+                        "SERVICE_DEPLOYMENT_FAILED",
+                    ]
+                },
+            },
+            Targets=[dict(Arn=GetAtt(signal_lambda, "Arn"), Id="SignalLambda")],
+        )
+    )
+    stack.Resources["DeploymentRulePermission"] = permission = Permission(
+        Properties=PermissionProperties(
+            Action="lambda:InvokeFunction",
+            FunctionName=GetAtt(signal_lambda, "Arn"),
+            Principal="events.amazonaws.com",
+            SourceArn=GetAtt(rule, "Arn"),
+        )
+    )
+
+    # Don't restart the services until we can hear about the deployment
+    restarter["DependsOn"] = [LogicalName(rule), LogicalName(permission)]
+
+
+def _get_dependency_digest(dependencies: List[SSMParameter]) -> str:
+    """Get a short digest that changes whenever the dependencies change."""
+    digest = hashlib.blake2b(digest_size=6)
+    for param in sorted(dependencies, key=lambda p: p.Properties.Name):
+        digest.update(f"{param.Properties.Name}\0{param.Properties.Value}\0".encode())
+    return digest.hexdigest()
+
+
 def create_lambda_invalidation_stack(
-    function: str, dependencies: List[SSMParameter], role
+    function,
+    dependencies: List[SSMParameter],
+    role,
+    stacks=None,
+    prewarm_concurrency: int = 0,
+    prewarm_payload: Optional[str] = None,
 ) -> Stack:
-    """Create CloudFormation resources to invalidate a single AWS Lambda Function.
+    """Create CloudFormation resources to invalidate one or more AWS Lambda Functions.
 
     This is accomplished by adding a meaningless environment variable to the
     Function, which will force it to re-deploy into a new execution context
@@ -90,12 +206,20 @@ def create_lambda_invalidation_stack(
     Parameters:
         dependencies: SSM Parameters that this Function uses
         function: CloudFormation reference to the Lambda Function
-            (eg. an unversioned ARN, or the name)
+            (eg. an unversioned ARN, or the name), or a list of references
+            to several Functions that should be invalidated together.
         role: CloudFormation reference (eg. an ARN) to an IAM role
             that will be used to modify the Function.
+        stacks: Optional list of CloudFormation references to stacks (eg.
+            the name). Every Lambda Function in these stacks is invalidated
+            as well.
+        prewarm_concurrency: The number of concurrent invocations to make
+            after each Function has been invalidated, so that real traffic
+            doesn't have to wait for cold starts.
+        prewarm_payload: The JSON event to send in the pre-warming
+            invocations.
     """
     # TODO make role optional, and create it on-the-fly if not provided
-    # TODO find a way to share role and lambda between multiple calls in the same stack? can de-dupe/cache based on identity in the final stack
     # TODO get Lambda handler to have an internal timeout as well?
 
     stack = Stack(Description="Invalidate Lambda Function after parameter update")
@@ -104,13 +228,21 @@ def create_lambda_invalidation_stack(
     # isn't built-in CloudFormation functionality.
     stack.Resources[
         "ReplacementLambda"
-    ] = replace_lambda_context_lambda = Function.create_from_python_function(
-        handler=replace_lambda_context_resource_handler, Role=role
+    ] = replace_lambda_context_lambda = create_inline_function(
+        replace_lambda_context_resource_handler, role, helpers=[emit_embedded_metrics]
     )
 
     # Set the Lambda Replacer's timeout to a fixed value. This should be
-    # universal, so we don't let callers specify it.
-    replace_lambda_context_lambda.Properties.Timeout = 20
+    # universal, so we don't let callers specify it. Several Functions are
+    # updated concurrently, but may need to be retried.
+    functions = function if isinstance(function, list) else [function]
+    functions = [f for f in functions if f is not None]
+    stacks = stacks or []
+    if not functions and not stacks:
+        raise ValueError("At least one Lambda Function must be invalidated")
+    replace_lambda_context_lambda.Properties.Timeout = (
+        20 if len(functions) == 1 and not stacks else 60
+    )
 
     # Create a custom resource to replace the Lambda's execution context.
     #
@@ -125,12 +257,165 @@ def create_lambda_invalidation_stack(
         Type="Custom::ReplaceLambdaContext",
         Properties=dict(
             ServiceToken=GetAtt(replace_lambda_context_lambda, "Arn"),
-            FunctionName=function,
             IgnoredParameterNames=[Ref(p) for p in dependencies],
             IgnoredParameterKeys=[GetAtt(p, "Value") for p in dependencies],
         ),
     )
+    if len(functions) == 1:
+        stack.Resources["Replacer"]["Properties"]["FunctionName"] = functions[0]
+    elif functions:
+        stack.Resources["Replacer"]["Properties"]["FunctionNames"] = functions
+    if stacks:
+        stack.Resources["Replacer"]["Properties"]["StackNames"] = stacks
+    if prewarm_concurrency:
+        # Pre-warming has to wait for the update to finish, then for the
+        # Function to run.
+        replace_lambda_context_lambda.Properties.Timeout = 5 * 60
+        stack.Resources["Replacer"]["Properties"].update(
+            PrewarmConcurrency=str(prewarm_concurrency),
+            PrewarmPayload=prewarm_payload or DEFAULT_PREWARM_PAYLOAD,
+        )
 
     # TODO consider creating a waiter anyway, so that the timeout is strictly reliable
 
     return stack
+
+
+def limit_concurrent_invalidations(
+    invalidations: List[Stack], max_concurrent: int
+) -> None:
+    """Limit the number of invalidations that CloudFormation performs at once.
+
+    Restarting many applications at the same time can exhaust the capacity
+    of a shared cluster. We avoid that by dividing the invalidation stacks
+    into `max_concurrent` chains, where each invalidation waits for the
+    previous invalidation in the same chain to finish. If an invalidation
+    waits for it's restart with a WaitCondition, then the WaitCondition is
+    what finishes the invalidation. The stacks are modified in place.
+    """
+    if max_concurrent < 1:
+        raise ValueError("Must allow at least one invalidation at a time")
+
+    for previous, current in zip(invalidations, invalidations[max_concurrent:]):
+        finished = [
+            r for r in previous.Resources.values() if isinstance(r, WaitCondition)
+        ] or _get_invalidation_resources(previous)
+        for resource in _get_invalidation_resources(current):
+            resource.setdefault("DependsOn", []).extend(
+                LogicalName(r) for r in finished
+            )
+
+
+def _get_invalidation_resources(stack: Stack) -> List[dict]:
+    """Get the custom resources that perform an invalidation."""
+    return [
+        r
+        for r in stack.Resources.values()
+        if isinstance(r, dict) and r.get("Type") in INVALIDATION_RESOURCE_TYPES
+    ]
+
+
+def deduplicate_invalidation_functions(stack: Stack) -> None:
+    """Share a single Lambda Function between all the custom resources in a
+    stack that would otherwise use identical Functions.
+
+    Each invalidation stack creates it's own inline Lambda Function, so a
+    stack with many invalidations carries many copies of the same code.
+    Functions are identical if they have the same code, handler, role and
+    timeout. Only Functions that are used solely as the ServiceToken of a
+    custom resource are shared, since anything else (eg. an event rule
+    target) may depend on the Function's own configuration. The stack is
+    modified in place.
+
+    CloudFormation doesn't allow the ServiceToken of a custom resource to
+    change, so each shared Function gets a logical name derived from it's
+    properties. This means that custom resources keep using the same
+    Function when other invalidations are added, removed or reordered.
+    """
+    # Find Functions that are referenced by something other than a ServiceToken
+    referenced: Set = set()
+    for resource in stack.Resources.values():
+        if isinstance(resource, dict):
+            properties = dict(resource.get("Properties", {}))
+            properties.pop("ServiceToken", None)
+            _find_references(properties, referenced)
+        elif isinstance(resource, AWSObject):
+            _find_references(resource.Properties, referenced)
+
+    # Find the first Function with each distinct set of properties
+    replacements = dict()
+    originals: Dict[tuple, Function] = dict()
+    for logical_name, resource in list(stack.Resources.items()):
+        if not isinstance(resource, Function):
+            continue
+        if GetAtt(resource, "Arn") in referenced or Ref(resource) in referenced:
+            continue
+
+        key = _get_function_key(resource)
+        original = originals.setdefault(key, resource)
+        if original is not resource:
+            replacements[GetAtt(resource, "Arn")] = GetAtt(original, "Arn")
+        del stack.Resources[logical_name]
+
+    # Give the remaining Functions a stable name
+    for function in originals.values():
+        stack.Resources[
+            "InvalidationLambda" + _get_function_digest(stack, function)
+        ] = function
+
+    # Point custom resources at the remaining Functions
+    for resource in stack.Resources.values():
+        if isinstance(resource, dict):
+            properties = resource.get("Properties", {})
+            if properties.get("ServiceToken") in replacements:
+                properties["ServiceToken"] = replacements[properties["ServiceToken"]]
+
+
+def _get_function_key(function: Function) -> tuple:
+    """Get the properties that determine whether two inline Functions are identical."""
+    properties = function.Properties
+    return (
+        properties.Code.get("ZipFile"),
+        properties.Handler,
+        properties.Role,
+        properties.Runtime,
+        properties.Timeout,
+        properties.Description,
+    )
+
+
+def _get_function_digest(stack: Stack, function: Function) -> str:
+    """Get a short digest that identifies a shared inline Function.
+
+    The code isn't included, so that upgrading ssmash updates the existing
+    Function rather than replacing it. The other properties are digested as
+    they would be exported to CloudFormation, so that the digest is the same
+    every time the template is generated.
+    """
+
+    class StackDumper(AmazonCFNDumper):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.cfn_stack = stack
+
+    properties = function.Properties
+    exported = yaml.dump(
+        [properties.Handler, properties.Role, properties.Timeout], Dumper=StackDumper
+    )
+    return hashlib.blake2b(exported.encode(), digest_size=6).hexdigest()
+
+
+def _find_references(value: Any, found: Set):
+    """Recursively find the references to objects in a value."""
+    if isinstance(value, (Ref, GetAtt)):
+        found.add(value)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _find_references(v, found)
+    elif isinstance(value, list):
+        for v in value:
+            _find_references(v, found)
+    elif isinstance(value, AWSObject):
+        for key in value:
+            if value.is_attribute_set(key):
+                _find_references(value[key], found)
@@ -1,5 +1,6 @@
 """Tools for loading the configuration data."""
 
+from typing import Iterable
 from typing import List
 from typing import Optional
 from typing import Union
@@ -12,24 +13,27 @@ from ssmash.invalidation import create_ecs_service_invalidation_stack
 
 
 class EcsServiceInvalidator:
-    """Invalidates an ECS Service"""
+    """Invalidates one or more ECS Services in the same cluster"""
 
     def __init__(
         self,
         cluster_name: Optional[str] = None,
         cluster_import: Optional[str] = None,
-        service_name: Optional[str] = None,
-        service_import: Optional[str] = None,
+        service_name: Union[str, List[str], None] = None,
+        service_import: Union[str, List[str], None] = None,
         role_name: Optional[str] = None,
         role_import: Optional[str] = None,
+        asynchronous: bool = False,
     ):
         self.cluster = get_cfn_resource_from_options(
             "cluster", cluster_name, cluster_import
         )
-        self.service = get_cfn_resource_from_options(
-            "service", service_name, service_import
+        services = get_cfn_resources_from_options(
+            "service", _as_list(service_name), _as_list(service_import)
         )
+        self.service = services[0] if len(services) == 1 else services
         self.role = get_cfn_resource_from_options("role", role_name, role_import)
+        self.asynchronous = asynchronous
 
     def create_resources(self, dependencies: List[SSMParameter]) -> Stack:
         """Create CloudFormation resources to invalidate this ECS service,
@@ -40,6 +44,7 @@ class EcsServiceInvalidator:
             service=self.service,
             dependencies=dependencies,
             restart_role=self.role,
+            asynchronous=self.asynchronous,
         )
 
 
@@ -72,3 +77,39 @@ def get_cfn_resource_from_options(
             f"The {option_name} must be specified using either a name/ARN, or a CloudFormation Export."
         )
     return result
+
+
+def get_cfn_resources_from_options(
+    option_name: str,
+    arns: Iterable[str],
+    export_names: Iterable[str],
+    required: bool = True,
+) -> List[Union[str, ImportValue]]:
+    """Get one or more CloudFormation resources from several ways to specify them.
+
+    Parameters:
+        arns: The physical names or ARNs of the underlying resources
+        export_names: The names of CloudFormation Exports that can be
+            dereferenced to access the resources.
+        option_name: The name of the option, used in CLI error messages.
+        required: Whether at least one resource must be supplied.
+
+    Raises:
+        ValueError: If no resources are supplied.
+    """
+    result = list(arns or []) + [ImportValue(name) for name in export_names or []]
+
+    if required and not result:
+        raise ValueError(
+            f"The {option_name} must be specified using either a name/ARN, or a CloudFormation Export."
+        )
+    return result
+
+
+def _as_list(value) -> list:
+    """Normalise an option that may have one or many values."""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
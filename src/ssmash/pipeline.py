@@ -0,0 +1,94 @@
+"""Tools for sharing work between the processors in the ssmash pipeline."""
+
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from flyingcircus.core import Resource
+from flyingcircus.core import Stack
+from flyingcircus.service.ssm import SSMParameter
+
+from ssmash.config import InvalidatingConfigKey
+from ssmash.converter import convert_hierarchy_to_ssm
+from ssmash.stack import get_resources
+
+#: The key for ssmash's own configuration, embedded in the application configuration
+SSMASH_CONFIG_KEY = ".ssmash-config"
+
+
+class PipelineContext:
+    """Products derived from the application configuration, which are
+    shared by every processor in the pipeline.
+
+    Each product is computed the first time it is used, and then cached. The
+    application configuration shouldn't be changed after the pipeline starts.
+    """
+
+    def __init__(self, appconfig: dict, stack: Stack):
+        self.appconfig = appconfig
+        self.stack = stack
+
+        self._clean_config: Optional[dict] = None
+        self._parameter_stack: Optional[Stack] = None
+        self._parameters: Optional[List[SSMParameter]] = None
+        self._invalidated_resources: Optional[Dict[str, List[Resource]]] = None
+
+    @property
+    def ssmash_config(self) -> dict:
+        """The configuration for ssmash itself, embedded in the application configuration."""
+        return self.appconfig.get(SSMASH_CONFIG_KEY) or {}
+
+    @property
+    def clean_config(self) -> dict:
+        """The application configuration, without ssmash's own configuration."""
+        if self._clean_config is None:
+            self._clean_config = dict(self.appconfig)
+            self._clean_config.pop(SSMASH_CONFIG_KEY, None)
+        return self._clean_config
+
+    @property
+    def parameter_stack(self) -> Stack:
+        """A stack with an SSM Parameter for every item in the application configuration."""
+        if self._parameter_stack is None:
+            self._parameter_stack = convert_hierarchy_to_ssm(
+                self.clean_config
+            ).with_prefixed_names("SSMParam")
+        return self._parameter_stack
+
+    @property
+    def parameters(self) -> List[SSMParameter]:
+        """The SSM Parameters for the application configuration."""
+        if self._parameters is None:
+            self._parameters = get_resources(self.parameter_stack, SSMParameter)
+        return self._parameters
+
+    @property
+    def invalidated_resources(self) -> Dict[str, List[Resource]]:
+        """The resources that invalidate each application, as a dictionary of
+        {application_name: [cfn_resource]}
+        """
+        if self._invalidated_resources is None:
+            # Converting the configuration associates each key with it's
+            # resources, so it has to happen first
+            _ = self.parameter_stack
+            self._invalidated_resources = get_invalidated_resources(self.clean_config)
+        return self._invalidated_resources
+
+
+def get_invalidated_resources(appconfig: dict) -> Dict[str, List[Resource]]:
+    """Lookup which applications are associated with resources.
+
+    Returns:
+        A dictionary of {application_name: [cfn_resource]}
+    """
+    result = dict()
+
+    for key, value in appconfig.items():
+        if isinstance(key, InvalidatingConfigKey):
+            for appname in key.invalidated_applications:
+                result.setdefault(appname, []).extend(key.dependent_resources)
+        if isinstance(value, dict):
+            for appname, appresources in get_invalidated_resources(value).items():
+                result.setdefault(appname, []).extend(appresources)
+
+    return result
@@ -0,0 +1,108 @@
+"""Tools to measure how long each stage of the ssmash pipeline takes."""
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any
+from typing import Dict
+from typing import List
+
+
+class PipelineProfiler:
+    """Record the wall time and peak memory of each stage in the pipeline,
+    along with counts of what was produced.
+
+    Peak memory is the most memory that was allocated during a stage, above
+    what was already allocated when it started. Tracing memory allocations
+    makes everything slower, so the wall times are only useful relative to
+    each other.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: List[Dict[str, Any]] = []
+        self.counts: Dict[str, int] = dict(
+            leaves=0, parameters=0, invalidated_applications=0, template_bytes=0
+        )
+
+    @contextmanager
+    def stage(self, name: str, **labels):
+        """Measure a single stage of the pipeline.
+
+        Labels are included in the report for this stage.
+        """
+        baseline = self._reset_peak_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start
+            peak_memory = tracemalloc.get_traced_memory()[1] - baseline
+            self.stages.append(
+                dict(
+                    name=name,
+                    **labels,
+                    wall_time=round(wall_time, 6),
+                    peak_memory=peak_memory,
+                )
+            )
+
+    def count_output(self, output) -> "CountingWriter":
+        """Wrap an output stream, so that the bytes written to it are counted."""
+        return CountingWriter(output, self.counts)
+
+    def add_counts(self, **counts):
+        for name, value in counts.items():
+            self.counts[name] += value
+
+    def finish(self) -> dict:
+        """Stop profiling, and get a report of the measurements.
+
+        The total wall time runs from when the profiler was created, so it
+        includes any time spent between the stages.
+        """
+        wall_time = time.perf_counter() - self.start
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return {
+            "stages": self.stages,
+            "wall_time": round(wall_time, 6),
+            "counts": self.counts,
+        }
+
+    @staticmethod
+    def _reset_peak_memory() -> int:
+        """Start measuring the peak memory again, and get the memory that is
+        currently allocated.
+        """
+        if hasattr(tracemalloc, "reset_peak") and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        else:
+            # Before Python 3.9, the only way to reset the peak is to start
+            # tracing again
+            tracemalloc.stop()
+            tracemalloc.start()
+        return tracemalloc.get_traced_memory()[0]
+
+
+class CountingWriter:
+    """A text stream that counts the bytes written to it."""
+
+    def __init__(self, output, counts: Dict[str, int]):
+        self.output = output
+        self.counts = counts
+
+    def write(self, text: str) -> int:
+        self.counts["template_bytes"] += len(text.encode("utf-8"))
+        return self.output.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.output, name)
+
+
+def count_leaves(appconfig: dict) -> int:
+    """Count the configuration values (that aren't themselves dictionaries)."""
+    return sum(
+        count_leaves(value) if isinstance(value, dict) else 1
+        for value in appconfig.values()
+    )
@@ -0,0 +1,139 @@
+"""A long-lived server that converts application configuration on request.
+
+Each conversion runs in the same process, so it doesn't pay the cost of
+starting Python and importing ssmash. Clients connect over a Unix socket
+(see `ssmash.client`).
+"""
+
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+from typing import List
+
+from ssmash.batch import BatchEntry
+from ssmash.batch import run_batch_entry
+from ssmash.client import read_message
+from ssmash.client import write_message
+
+#: A trivial configuration that is converted when the server starts, so that
+#: every module used by a conversion is already imported.
+WARM_UP_INPUT = "ssmash:\n  warm-up: true\n"
+
+#: Commands that a client can't run, because they replace the conversion (or
+#: never finish).
+UNSUPPORTED_COMMANDS = ("batch", "serve", "watch")
+
+#: Options that a client can't use, because they trace memory for the whole
+#: process (which every concurrent conversion shares).
+UNSUPPORTED_OPTIONS = ("--profile", "--profile-stats")
+
+
+class ConversionRequestHandler(socketserver.StreamRequestHandler):
+    """Perform a single conversion for a client."""
+
+    def handle(self):
+        try:
+            request = read_message(self.rfile)
+            input = request.get("input")
+            args = request.get("args") or []
+            if not isinstance(input, str):
+                raise ValueError("The input must be a string")
+            if not isinstance(args, list) or not all(
+                isinstance(arg, str) for arg in args
+            ):
+                raise ValueError("The args must be a list of strings")
+            for command in UNSUPPORTED_COMMANDS:
+                if command in args:
+                    raise ValueError(f"The {command} command can't be used")
+            for option in UNSUPPORTED_OPTIONS:
+                if any(a == option or a.startswith(option + "=") for a in args):
+                    raise ValueError(f"The {option} option can't be used")
+        except ValueError as ex:
+            response = {"exit_code": 2, "output": "", "error": f"Bad request: {ex}"}
+        else:
+            response = convert(input, args)
+
+        try:
+            write_message(self.wfile, response)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client has gone away (eg. it was only checking that we are
+            # listening)
+            pass
+
+
+class ConversionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serve conversions to many concurrent clients, using a thread for each."""
+
+    daemon_threads = True
+
+
+def convert(input: str, args: List[str]) -> dict:
+    """Convert application configuration, as though ssmash had been run on the command line.
+
+    Returns:
+        A response message for the client.
+    """
+    with tempfile.TemporaryDirectory(prefix="ssmash-") as workdir:
+        input_path = os.path.join(workdir, "input.yaml")
+        output_path = os.path.join(workdir, "output")
+        with open(input_path, "w") as fp:
+            fp.write(input)
+
+        result = run_batch_entry(BatchEntry(input_path, output_path, args))
+
+        output = ""
+        if os.path.exists(output_path):
+            with open(output_path) as fp:
+                output = fp.read()
+
+    return {"exit_code": result.exit_code, "output": output, "error": result.error}
+
+
+def create_server(socket_path: str) -> ConversionServer:
+    """Create a server that listens on a Unix socket.
+
+    A stale socket left behind by a server that has stopped is replaced.
+    Only the current user can connect to the socket.
+
+    Raises:
+        ValueError: If another server is already listening on the socket,
+            or the path is not a socket.
+    """
+    if os.path.exists(socket_path):
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            raise ValueError(f"{socket_path} exists, and is not a socket")
+        if _is_listening(socket_path):
+            raise ValueError(f"Another server is already listening on {socket_path}")
+        os.unlink(socket_path)
+
+    # Create the socket without any access for other users, so that there
+    # is no moment when they could connect to it
+    old_umask = os.umask(0o177)
+    try:
+        server = ConversionServer(socket_path, ConversionRequestHandler)
+    finally:
+        os.umask(old_umask)
+
+    convert(WARM_UP_INPUT, [])
+    return server
+
+
+def serve(server: ConversionServer):
+    """Handle requests until the server is shut down."""
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(server.server_address):
+            os.unlink(server.server_address)
+
+
+def _is_listening(socket_path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(socket_path)
+        except ConnectionRefusedError:
+            return False
+    return True
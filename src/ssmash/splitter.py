@@ -0,0 +1,94 @@
+"""Tools for splitting the configuration into independently deployable parts."""
+
+from typing import Dict
+from typing import Iterable
+from typing import Set
+from typing import Tuple
+
+from ssmash.config import InvalidatingConfigKey
+
+#: The path for the subtree that holds configuration values which are above
+#: the split depth.
+ROOT_SUBTREE_PATH = ()
+
+
+def split_appconfig(appconfig: dict, depth: int) -> Dict[Tuple[str, ...], dict]:
+    """Split a configuration hierarchy into separate subtrees at the given depth.
+
+    Each subtree retains the full hierarchy above it, so the SSM parameters
+    created from a subtree have the same names that they would have if the
+    configuration was not split. Leaf values that are above the split depth
+    are gathered together into a single subtree, with an empty path.
+
+    Returns:
+        A dictionary of {path_components: subtree_config}, in the order that
+        the subtrees first appear in the configuration.
+    """
+    if depth < 1:
+        raise ValueError("The split depth must be at least 1")
+
+    result = dict()
+    _collect_subtrees(appconfig, depth, (), result)
+    return result
+
+
+def _collect_subtrees(
+    appconfig: dict,
+    depth: int,
+    path_components: Tuple[str, ...],
+    result: Dict[Tuple[str, ...], dict],
+):
+    for key, value in appconfig.items():
+        item_path_components = path_components + (key,)
+
+        if isinstance(value, dict) and len(item_path_components) < depth:
+            _collect_subtrees(value, depth, item_path_components, result)
+        elif isinstance(value, dict):
+            subtree = result.setdefault(item_path_components, dict())
+            _insert_into_hierarchy(subtree, item_path_components, value)
+        else:
+            subtree = result.setdefault(ROOT_SUBTREE_PATH, dict())
+            _insert_into_hierarchy(subtree, item_path_components, value)
+
+
+def _insert_into_hierarchy(
+    target: dict, path_components: Tuple[str, ...], value
+) -> None:
+    """Insert a value into a nested dictionary, creating intermediate nodes as required."""
+    for key in path_components[:-1]:
+        target = target.setdefault(_copy_config_key(key), dict())
+    target[_copy_config_key(path_components[-1])] = value
+
+
+def _copy_config_key(key: str) -> str:
+    """Copy a configuration key, so that it can be used in another subtree.
+
+    An invalidating key tracks the resources created underneath it, so each
+    subtree needs it's own copy of any key that is shared between subtrees.
+    Otherwise the invalidations for one subtree would refer to parameters
+    that belong to another template.
+    """
+    if isinstance(key, InvalidatingConfigKey):
+        return InvalidatingConfigKey.construct(
+            str(key), invalidates=sorted(key.invalidated_applications)
+        )
+    return key
+
+
+def get_subtree_filename(
+    path_components: Iterable[str], existing_filenames: Set[str]
+) -> str:
+    """Get a unique filename for the template created from a subtree.
+
+    The chosen name is added to the set of existing filenames.
+    """
+    basename = "-".join(path_components) or "root"
+
+    result = basename + ".yaml"
+    suffix = 1
+    while result in existing_filenames:
+        suffix += 1
+        result = f"{basename}-{suffix}.yaml"
+
+    existing_filenames.add(result)
+    return result
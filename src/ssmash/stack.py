@@ -0,0 +1,14 @@
+"""Tools for finding resources in a CloudFormation stack."""
+
+from typing import List
+from typing import Type
+from typing import TypeVar
+
+from flyingcircus.core import Stack
+
+T = TypeVar("T")
+
+
+def get_resources(stack: Stack, resource_type: Type[T]) -> List[T]:
+    """Get every resource in a stack with a type (or a subclass of it)."""
+    return [r for r in stack.Resources.values() if isinstance(r, resource_type)]
@@ -0,0 +1,77 @@
+"""Tools to regenerate templates when the application configuration changes."""
+
+import hashlib
+import os
+import time
+from typing import Any
+from typing import Callable
+from typing import Optional
+from typing import Tuple
+
+from ssmash.config import InvalidatingConfigKey
+
+
+class FileWatcher:
+    """Detect changes to a file by polling it's modification time and size.
+
+    Polling is used (rather than filesystem notifications) so that watching
+    works the same way on every platform, without any extra dependencies.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        interval: float = 0.5,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.path = path
+        self.interval = interval
+        self.sleep = sleep
+        self._signature = None
+
+    def has_changed(self) -> bool:
+        """Check whether the file has changed since the last check.
+
+        The first check always reports a change.
+        """
+        signature = self._get_signature()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        return True
+
+    def wait_for_change(self):
+        """Block until the file changes."""
+        while not self.has_changed():
+            self.sleep(self.interval)
+
+    def _get_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+
+def get_config_fingerprint(value: Any) -> str:
+    """Get a digest that changes whenever some application configuration changes.
+
+    Unlike a plain comparison, this includes the applications that each
+    configuration key invalidates, and the settings of invalidation helpers.
+    """
+    return hashlib.sha256(repr(_canonicalise(value)).encode("utf-8")).hexdigest()
+
+
+def _canonicalise(value: Any) -> Any:
+    if isinstance(value, InvalidatingConfigKey):
+        return ["key", str(value), sorted(value.invalidated_applications)]
+    if isinstance(value, dict):
+        return [
+            "dict",
+            [[_canonicalise(k), _canonicalise(v)] for k, v in value.items()],
+        ]
+    if isinstance(value, (list, tuple)):
+        return ["list", [_canonicalise(item) for item in value]]
+    if hasattr(value, "__dict__"):
+        return [type(value).__name__, _canonicalise(vars(value))]
+    return [type(value).__name__, value]
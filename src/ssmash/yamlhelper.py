@@ -31,6 +31,7 @@ def _ecs_service_constructor(loader, node) -> EcsServiceInvalidator:
             "service_import",
             "role_name",
             "role_import",
+            "asynchronous",
         }
     )
     if unknown_parameters:
@@ -51,3 +52,39 @@ class SsmashYamlLoader(yaml.SafeLoader):
 
 
 SsmashYamlLoader.register_extra_constructors()
+
+
+#: Use the fast LibYAML parser to load templates, if it is available. Large
+#: templates take a long time to parse in pure Python.
+_TemplateLoaderBase = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _cfn_function_constructor(loader, tag_suffix: str, node) -> dict:
+    """Construct the long form of a CloudFormation intrinsic function from a short-form YAML tag."""
+    name = "Ref" if tag_suffix == "Ref" else "Fn::" + tag_suffix
+
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+        if tag_suffix == "GetAtt":
+            value = value.split(".", 1)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+
+    return {name: value}
+
+
+class CfnTemplateYamlLoader(_TemplateLoaderBase):
+    """YAML Loader for CloudFormation templates.
+
+    The short-form YAML tags for intrinsic functions (eg. ``!Ref``) are
+    loaded as plain data using the equivalent long-form JSON syntax.
+    """
+
+    @classmethod
+    def register_extra_constructors(cls):
+        cls.add_multi_constructor("!", _cfn_function_constructor)
+
+
+CfnTemplateYamlLoader.register_extra_constructors()
@@ -0,0 +1,188 @@
+from unittest.mock import Mock
+
+import pytest
+
+from ssmash.apply import AdaptiveRateLimiter
+from ssmash.apply import ParameterValue
+from ssmash.apply import apply_parameters
+from ssmash.apply import get_parameter_snapshot
+from ssmash.apply import get_parameters_from_stack
+from ssmash.converter import convert_hierarchy_to_ssm
+from .fakes import FakeClientError
+from .fakes import FakeClock
+from .fakes import FakeSsmClient
+
+
+def _no_sleep(seconds):
+    pass
+
+
+class TestGetParameterSnapshot:
+    def test_should_only_fetch_named_parameters(self):
+        # Setup
+        client = FakeSsmClient(
+            {
+                "/acme/a/x": ("String", "1"),
+                "/other/b": ("String", "2"),
+                "/other/c": ("String", "3"),
+            }
+        )
+
+        # Exercise
+        snapshot = get_parameter_snapshot(client, ["/acme/a/x", "/other/b"])
+
+        # Verify
+        assert sorted(snapshot) == ["/acme/a/x", "/other/b"]
+        assert [c[0] for c in client.calls] == ["GetParameters"]
+
+    def test_should_fetch_parameters_in_batches(self):
+        # Setup
+        names = [f"/acme/{i:02}" for i in range(25)]
+        client = FakeSsmClient({name: ("String", "x") for name in names[::2]})
+
+        # Exercise
+        snapshot = get_parameter_snapshot(client, names)
+
+        # Verify
+        assert sorted(snapshot) == names[::2]
+        assert client.count_calls("GetParameters") == 3
+
+    def test_should_report_access_denied(self):
+        # Setup
+        client = FakeSsmClient()
+        client.get_parameters = Mock(
+            side_effect=FakeClientError("AccessDeniedException", "GetParameters")
+        )
+
+        # Exercise & Verify
+        with pytest.raises(ValueError, match="AccessDeniedException"):
+            get_parameter_snapshot(client, ["/acme/a"])
+
+    def test_should_include_single_parameter(self):
+        # Setup
+        client = FakeSsmClient({"/acme/a": ("String", "1")})
+
+        # Exercise
+        snapshot = get_parameter_snapshot(client, ["/acme/a"])
+
+        # Verify
+        assert snapshot == {"/acme/a": ParameterValue("/acme/a", "String", "1")}
+
+
+class TestApplyParameters:
+    def test_should_write_parameters_from_converter(self):
+        # Setup
+        client = FakeSsmClient()
+        stack = convert_hierarchy_to_ssm({"a": {"b": 1, "c": ["x", "y"]}})
+
+        # Exercise
+        result = apply_parameters(client, get_parameters_from_stack(stack))
+
+        # Verify
+        assert sorted(result.created) == ["/a/b", "/a/c"]
+        assert not result.updated
+        assert not result.failed
+        assert client.parameters == {
+            "/a/b": ("String", "1"),
+            "/a/c": ("StringList", "x,y"),
+        }
+
+    def test_should_skip_unchanged_parameters(self):
+        # Setup
+        client = FakeSsmClient(
+            {"/a/same": ("String", "1"), "/a/different": ("String", "old")}
+        )
+        parameters = [
+            ParameterValue("/a/same", "String", "1"),
+            ParameterValue("/a/different", "String", "new"),
+            ParameterValue("/a/new", "String", "2"),
+        ]
+
+        # Exercise
+        result = apply_parameters(client, parameters)
+
+        # Verify
+        assert result.unchanged == ["/a/same"]
+        assert result.updated == ["/a/different"]
+        assert result.created == ["/a/new"]
+        assert client.count_calls("PutParameter") == 2
+
+    def test_should_retry_throttled_writes(self):
+        # Setup
+        client = FakeSsmClient(throttle_count=5)
+        parameters = [ParameterValue(f"/a/{i}", "String", str(i)) for i in range(20)]
+        limiter = AdaptiveRateLimiter(max_rate=1000, sleep=_no_sleep)
+
+        # Exercise
+        result = apply_parameters(
+            client, parameters, rate_limiter=limiter, sleep=_no_sleep
+        )
+
+        # Verify
+        assert not result.failed
+        assert len(result.created) == 20
+        assert len(client.parameters) == 20
+        assert client.count_calls("PutParameter") == 25
+
+    def test_should_report_failures(self):
+        # Setup
+        client = FakeSsmClient(throttle_count=100)
+        limiter = AdaptiveRateLimiter(max_rate=1000, sleep=_no_sleep)
+
+        # Exercise
+        result = apply_parameters(
+            client,
+            [ParameterValue("/a", "String", "1")],
+            max_attempts=3,
+            rate_limiter=limiter,
+            sleep=_no_sleep,
+        )
+
+        # Verify
+        assert list(result.failed) == ["/a"]
+        assert client.count_calls("PutParameter") == 3
+
+    def test_should_not_retry_other_errors(self):
+        # Setup
+        client = FakeSsmClient()
+
+        def put_parameter(**kwargs):
+            raise FakeClientError("AccessDeniedException", "PutParameter")
+
+        client.put_parameter = put_parameter
+
+        # Exercise
+        result = apply_parameters(client, [ParameterValue("/a", "String", "1")])
+
+        # Verify
+        assert list(result.failed) == ["/a"]
+        assert "AccessDenied" in result.failed["/a"]
+
+
+class TestAdaptiveRateLimiter:
+    def test_should_space_requests_at_maximum_rate(self):
+        # Setup
+        clock = FakeClock()
+        limiter = AdaptiveRateLimiter(max_rate=4, clock=clock, sleep=clock.sleep)
+
+        # Exercise
+        for _ in range(9):
+            limiter.acquire()
+
+        # Verify
+        assert clock.now == pytest.approx(2.0)
+
+    def test_should_slow_down_when_throttled_and_recover(self):
+        # Setup
+        limiter = AdaptiveRateLimiter(max_rate=8, min_rate=1, increase=1)
+
+        # Exercise & Verify
+        limiter.on_throttle()
+        assert limiter.rate == 4
+        for _ in range(10):
+            limiter.on_throttle()
+        assert limiter.rate == 1
+
+        for _ in range(20):
+            limiter.on_success()
+        assert limiter.rate == 8
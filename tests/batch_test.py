@@ -0,0 +1,165 @@
+from io import StringIO
+from textwrap import dedent
+
+import pytest
+from click.testing import CliRunner
+
+from ssmash import cli
+from ssmash.batch import BatchEntry
+from ssmash.batch import load_batch_manifest
+from ssmash.batch import run_batch_entry
+
+
+def _write_manifest(tmp_path, entries: str):
+    (tmp_path / "a.yaml").write_text("acme:\n  greeting: hello\n")
+    (tmp_path / "b.yaml").write_text("acme:\n  limit: 1000\n")
+    manifest = tmp_path / "manifest.yaml"
+    manifest.write_text(dedent(entries))
+    return manifest
+
+
+class TestLoadBatchManifest:
+    def test_should_resolve_paths_relative_to_manifest(self):
+        # Setup
+        manifest = StringIO(
+            dedent(
+                """
+                entries:
+                  - input: a.yaml
+                    output: out/a.cfn.yaml
+                    args: [--description, Team A]
+                  - input: /abs/b.yaml
+                    output: b.cfn.yaml
+                """
+            )
+        )
+
+        # Exercise
+        entries = load_batch_manifest(manifest, base_dir="configs")
+
+        # Verify
+        assert entries == [
+            BatchEntry(
+                "configs/a.yaml", "configs/out/a.cfn.yaml", ["--description", "Team A"]
+            ),
+            BatchEntry("/abs/b.yaml", "configs/b.cfn.yaml", []),
+        ]
+
+    @pytest.mark.parametrize(
+        "manifest",
+        [
+            "",
+            "entries: a.yaml",
+            "entries: [{input: a.yaml}]",
+            "entries: [{input: a.yaml, output: b.yaml, args: --description}]",
+        ],
+    )
+    def test_should_reject_malformed_manifest(self, manifest):
+        with pytest.raises(ValueError):
+            load_batch_manifest(StringIO(manifest))
+
+
+class TestRunBatchEntry:
+    def test_should_write_template(self, tmp_path):
+        # Setup
+        _write_manifest(tmp_path, "")
+        output = tmp_path / "a.cfn.yaml"
+
+        # Exercise
+        result = run_batch_entry(
+            BatchEntry(
+                str(tmp_path / "a.yaml"), str(output), ["--description", "Team A"]
+            )
+        )
+
+        # Verify
+        assert result.succeeded
+        assert result.error is None
+        template = output.read_text()
+        assert "Team A" in template
+        assert "/acme/greeting" in template
+
+    def test_should_report_usage_error(self, tmp_path):
+        # Setup
+        _write_manifest(tmp_path, "")
+
+        # Exercise
+        result = run_batch_entry(
+            BatchEntry(
+                str(tmp_path / "a.yaml"),
+                str(tmp_path / "a.cfn.yaml"),
+                ["invalidate-lambda", "--role-name", "arn:role"],
+            )
+        )
+
+        # Verify
+        assert not result.succeeded
+        assert "function" in result.error
+
+
+class TestBatchCommand:
+    def test_should_generate_every_template(self, tmp_path):
+        # Setup
+        manifest = _write_manifest(
+            tmp_path,
+            """
+            entries:
+              - input: a.yaml
+                output: a.cfn.yaml
+              - input: b.yaml
+                output: b.cfn.yaml
+                args: [invalidate-lambda, --function-name, fn, --role-name, arn:role]
+            """,
+        )
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash,
+            args=["batch", "--workers", "2", str(manifest)],
+            catch_exceptions=False,
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        assert "2 succeeded, 0 failed" in result.stdout
+        assert "/acme/greeting" in (tmp_path / "a.cfn.yaml").read_text()
+        assert "Custom::ReplaceLambdaContext" in (tmp_path / "b.cfn.yaml").read_text()
+
+    def test_should_fail_if_any_entry_fails(self, tmp_path):
+        # Setup
+        manifest = _write_manifest(
+            tmp_path,
+            """
+            entries:
+              - input: a.yaml
+                output: a.cfn.yaml
+              - input: missing.yaml
+                output: missing.cfn.yaml
+            """,
+        )
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(cli.run_ssmash, args=["batch", str(manifest)])
+
+        # Verify
+        assert result.exit_code == 1
+        assert "1 succeeded, 1 failed" in result.stdout
+        assert "FAILED" in result.stdout
+        assert (tmp_path / "a.cfn.yaml").exists()
+
+    def test_should_not_chain_with_other_commands(self, tmp_path):
+        # Setup
+        manifest = _write_manifest(tmp_path, "entries: []")
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash,
+            args=["batch", str(manifest), "invalidate-lambda", "--function-name", "fn"],
+        )
+
+        # Verify
+        assert result.exit_code != 0
+        assert "can't be chained" in result.stdout
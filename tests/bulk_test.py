@@ -0,0 +1,101 @@
+from io import StringIO
+
+from flyingcircus.core import Stack
+from flyingcircus.intrinsic_function import GetAtt
+from flyingcircus.intrinsic_function import ImportValue
+
+from ssmash.bulk import BULK_PARAMETERS_RESOURCE_TYPE
+from ssmash.bulk import bundle_ssm_parameters
+from ssmash.bulk import create_bulk_parameter_stack
+from ssmash.bulk import get_shard_index
+from ssmash.converter import convert_hierarchy_to_ssm
+from ssmash.diff import index_stack
+from ssmash.diff import index_template
+from ssmash.diff import load_template
+from ssmash.invalidation import create_ecs_service_invalidation_stack
+
+
+def _get_shards(stack: Stack) -> dict:
+    return {
+        name: resource
+        for name, resource in stack.Resources.items()
+        if isinstance(resource, dict)
+        and resource["Type"] == BULK_PARAMETERS_RESOURCE_TYPE
+    }
+
+
+class TestCreateBulkParameterStack:
+    def test_should_put_every_parameter_in_exactly_one_shard(self):
+        # Setup
+        parameters = list(
+            convert_hierarchy_to_ssm(
+                {"a": {str(i): i for i in range(100)}}
+            ).Resources.values()
+        )
+
+        # Exercise
+        stack = create_bulk_parameter_stack(parameters, role="role-arn", shard_count=4)
+
+        # Verify
+        shards = _get_shards(stack)
+        assert 1 < len(shards) <= 4
+
+        names = [
+            p["Name"] for s in shards.values() for p in s["Properties"]["Parameters"]
+        ]
+        assert sorted(names) == sorted(p.Properties.Name for p in parameters)
+
+        writer = stack.Resources["WriterLambda"]
+        for shard in shards.values():
+            assert shard["Properties"]["ServiceToken"] == GetAtt(writer, "Arn")
+
+    def test_shard_index_should_be_stable(self):
+        # Verify
+        assert get_shard_index("/a/b", 7) == get_shard_index("/a/b", 7)
+        assert 0 <= get_shard_index("/a/b", 7) < 7
+
+
+class TestBundleSsmParameters:
+    def test_should_replace_parameter_resources(self):
+        # Setup
+        stack = convert_hierarchy_to_ssm({"a": {"b": 1, "c": ["x", "y"]}})
+
+        # Exercise
+        bundle_ssm_parameters(stack, role="role-arn", shard_count=2)
+
+        # Verify
+        assert all(
+            name.startswith("SSMParam") for name in stack.Resources
+        ), "Parameter resources should have been removed"
+        assert (
+            index_stack(stack).parameters
+            == index_stack(
+                convert_hierarchy_to_ssm({"a": {"b": 1, "c": ["x", "y"]}})
+            ).parameters
+        )
+
+    def test_should_make_invalidations_depend_on_shards(self):
+        # Setup
+        stack = convert_hierarchy_to_ssm({"a": {"b": 1, "c": 2}})
+        dependencies = [r for r in stack.Resources.values()]
+        stack.merge_stack(
+            create_ecs_service_invalidation_stack(
+                cluster="cluster",
+                service=ImportValue("service-export"),
+                dependencies=dependencies,
+                restart_role="role-arn",
+            ).with_prefixed_names("InvalidateService")
+        )
+        expected_index = index_stack(stack)
+
+        # Exercise
+        bundle_ssm_parameters(stack, role="role-arn", shard_count=1)
+
+        # Verify
+        template = load_template(StringIO(stack.export("yaml")))
+        restarter = template["Resources"]["InvalidateServiceRestarter"]
+        assert restarter["Properties"]["IgnoredParameterNames"] == ["/a/b", "/a/c"]
+        assert restarter["DependsOn"] == ["SSMParamShard0"]
+
+        # The template should still describe the same change
+        assert index_template(template) == expected_index
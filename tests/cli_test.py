@@ -1,12 +1,15 @@
 """Tests for the command line interface."""
 
+import json
 import os.path
+import pstats
 import re
 from contextlib import contextmanager
 from datetime import datetime
 from datetime import timezone
 from textwrap import dedent
 from unittest.mock import ANY
+from unittest.mock import Mock
 from unittest.mock import patch
 
 import pytest
@@ -20,6 +23,9 @@ from freezegun import freeze_time
 from ssmash import cli
 from ssmash.invalidation import create_ecs_service_invalidation_stack
 from ssmash.invalidation import create_lambda_invalidation_stack
+from ssmash.yamlhelper import CfnTemplateYamlLoader
+from .fakes import FakeClientError
+from .fakes import FakeSsmClient
 
 SIMPLE_INPUT = """foo: bar"""
 SIMPLE_OUTPUT_LINE = "Name: /foo"
@@ -28,15 +34,16 @@ SIMPLE_OUTPUT_LINE = "Name: /foo"
 class Patchers:
     """Collection of helpers to patch ssmash internal functions.
 
-    Note that we usually have to patch the object imported into the `cli`
-    module, not the original function definition in the `invalidation` module
+    Note that the `cli` module imports most functions when they are used, so
+    we patch the original function definition (eg. in the `invalidation`
+    module).
     """
 
     @staticmethod
     @contextmanager
     def create_lambda_invalidation_stack():
         with patch(
-            "ssmash.cli.create_lambda_invalidation_stack",
+            "ssmash.invalidation.create_lambda_invalidation_stack",
             wraps=create_lambda_invalidation_stack,
         ) as mocked:
             yield mocked
@@ -252,7 +259,11 @@ class TestEcsServiceInvalidation:
         assert result.exit_code == 0
 
         invalidation_mock.assert_called_with(
-            cluster=cluster, service=service, dependencies=ANY, restart_role=role
+            cluster=cluster,
+            service=service,
+            dependencies=ANY,
+            restart_role=role,
+            asynchronous=False,
         )
 
         assert cluster in result.stdout
@@ -286,6 +297,7 @@ class TestEcsServiceInvalidation:
             service=ImportValue(service_export),
             dependencies=ANY,
             restart_role=ImportValue(role_export),
+            asynchronous=False,
         )
 
     @pytest.mark.parametrize(
@@ -308,7 +320,7 @@ class TestEcsServiceInvalidation:
         assert result.exit_code != 0
         invalidation_mock.assert_not_called()
 
-    @pytest.mark.parametrize("param_name", ["cluster", "service", "role"])
+    @pytest.mark.parametrize("param_name", ["cluster", "role"])
     def test_should_error_if_both_name_and_import_specified(self, param_name):
         # Setup
         cluster = "arn:cluster"
@@ -328,6 +340,49 @@ class TestEcsServiceInvalidation:
         assert result.exit_code != 0
         invalidation_mock.assert_not_called()
 
+    def test_should_wait_for_restart_asynchronously(self):
+        # Exercise
+        result = self.run_script_with_invalidation_params(
+            "arn:cluster", "arn:service", "arn:role", extra_args=["--asynchronous"]
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        assert "Type: AWS::CloudFormation::WaitCondition" in result.stdout
+        assert "WaitForStability: 'false'" in result.stdout
+
+    def test_should_restart_multiple_services_together(self):
+        # Setup
+        cluster = "arn:cluster"
+        role = "arn:role"
+
+        # Exercise
+        with Patchers.create_ecs_service_invalidation_stack() as invalidation_mock:
+            result = self.run_script_with_invalidation_params(
+                cluster,
+                "service-a",
+                role,
+                extra_args=[
+                    "--service-name",
+                    "service-b",
+                    "--service-import",
+                    "service-export",
+                ],
+            )
+
+        # Verify
+        assert result.exit_code == 0
+
+        invalidation_mock.assert_called_once_with(
+            cluster=cluster,
+            service=["service-a", "service-b", ImportValue("service-export")],
+            dependencies=ANY,
+            restart_role=role,
+            asynchronous=False,
+        )
+        assert result.stdout.count("Type: Custom::RestartEcsService") == 1
+        assert "ServiceArns:" in result.stdout
+
 
 class TestLambdaInvalidation:
     def run_script_with_invalidation_params(
@@ -365,7 +420,12 @@ class TestLambdaInvalidation:
         assert result.exit_code == 0
 
         invalidation_mock.assert_called_with(
-            function=function, role=role, dependencies=ANY
+            function=function,
+            role=role,
+            dependencies=ANY,
+            stacks=[],
+            prewarm_concurrency=0,
+            prewarm_payload=None,
         )
 
         assert function in result.stdout
@@ -394,6 +454,9 @@ class TestLambdaInvalidation:
             function=ImportValue(function_export),
             dependencies=ANY,
             role=ImportValue(role_export),
+            stacks=[],
+            prewarm_concurrency=0,
+            prewarm_payload=None,
         )
 
     @pytest.mark.parametrize(
@@ -408,8 +471,7 @@ class TestLambdaInvalidation:
         assert result.exit_code != 0
         invalidation_mock.assert_not_called()
 
-    @pytest.mark.parametrize("param_name", ["function", "role"])
-    def test_should_error_if_both_name_and_import_specified(self, param_name):
+    def test_should_error_if_both_role_name_and_import_specified(self):
         # Setup
         function = "function-name"
         role = "arn:role"
@@ -417,13 +479,115 @@ class TestLambdaInvalidation:
         # Exercise
         with Patchers.create_lambda_invalidation_stack() as invalidation_mock:
             result = self.run_script_with_invalidation_params(
-                function,
+                function, role, extra_args=["--role-import", "some-import-name"]
+            )
+
+        # Verify
+        assert result.exit_code != 0
+        invalidation_mock.assert_not_called()
+
+    def test_should_invalidate_functions_in_stack(self):
+        # Setup
+        role = "arn:role"
+
+        # Exercise
+        with Patchers.create_lambda_invalidation_stack() as invalidation_mock:
+            result = self.run_script_with_invalidation_params(
+                role=role,
+                extra_args=[
+                    "--stack-name",
+                    "stack-a",
+                    "--stack-import",
+                    "stack-export",
+                ],
+            )
+
+        # Verify
+        assert result.exit_code == 0
+
+        invalidation_mock.assert_called_once_with(
+            function=[],
+            role=role,
+            dependencies=ANY,
+            stacks=["stack-a", ImportValue("stack-export")],
+            prewarm_concurrency=0,
+            prewarm_payload=None,
+        )
+        assert "StackNames:" in result.stdout
+
+    def test_should_invalidate_multiple_functions_together(self):
+        # Setup
+        role = "arn:role"
+
+        # Exercise
+        with Patchers.create_lambda_invalidation_stack() as invalidation_mock:
+            result = self.run_script_with_invalidation_params(
+                "function-a",
                 role,
-                extra_args=[f"--{param_name}-import", "some-import-name"],
+                extra_args=[
+                    "--function-name",
+                    "function-b",
+                    "--function-import",
+                    "function-export",
+                ],
+            )
+
+        # Verify
+        assert result.exit_code == 0
+
+        invalidation_mock.assert_called_once_with(
+            function=["function-a", "function-b", ImportValue("function-export")],
+            role=role,
+            dependencies=ANY,
+            stacks=[],
+            prewarm_concurrency=0,
+            prewarm_payload=None,
+        )
+        assert result.stdout.count("Type: Custom::ReplaceLambdaContext") == 1
+        assert "FunctionNames:" in result.stdout
+
+    def test_should_prewarm_functions(self):
+        # Setup
+        role = "arn:role"
+
+        # Exercise
+        with Patchers.create_lambda_invalidation_stack() as invalidation_mock:
+            result = self.run_script_with_invalidation_params(
+                "function-a",
+                role,
+                extra_args=[
+                    "--prewarm-concurrency",
+                    "5",
+                    "--prewarm-payload",
+                    '{"warm": true}',
+                ],
+            )
+
+        # Verify
+        assert result.exit_code == 0
+
+        invalidation_mock.assert_called_once_with(
+            function="function-a",
+            role=role,
+            dependencies=ANY,
+            stacks=[],
+            prewarm_concurrency=5,
+            prewarm_payload='{"warm": true}',
+        )
+        assert "PrewarmConcurrency:" in result.stdout
+
+    def test_should_reject_invalid_prewarm_payload(self):
+        # Exercise
+        with Patchers.create_lambda_invalidation_stack() as invalidation_mock:
+            result = self.run_script_with_invalidation_params(
+                "function-a",
+                "arn:role",
+                extra_args=["--prewarm-concurrency", "5", "--prewarm-payload", "{"],
             )
 
         # Verify
         assert result.exit_code != 0
+        assert "JSON" in result.stdout
         invalidation_mock.assert_not_called()
 
 
@@ -519,7 +683,11 @@ class TestEmbeddedInvalidation:
         assert not result.stderr_bytes
 
         invalidation_mock.assert_called_once_with(
-            cluster=cluster, service=service, dependencies=ANY, restart_role=role
+            cluster=cluster,
+            service=service,
+            dependencies=ANY,
+            restart_role=role,
+            asynchronous=False,
         )
 
         dependency_names = sorted(
@@ -531,3 +699,923 @@ class TestEmbeddedInvalidation:
         assert cluster in result.stdout
         assert service in result.stdout
         assert role in result.stdout
+
+    def test_should_restart_list_of_services_together(self):
+        # Setup
+        param_input = dedent(
+            """---
+            ? !item {invalidates: [servicea], key: first}
+            : 1
+            .ssmash-config:
+                invalidations:
+                    servicea: !ecs-invalidation
+                        cluster_name: fake-cluster-name
+                        service_name: [service-a, service-b]
+                        role_name: fake-role-name
+        """
+        )
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash, input=param_input, catch_exceptions=False
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        template = yaml.load(result.stdout, Loader=CfnTemplateYamlLoader)
+        (restarter,) = [
+            r
+            for r in template["Resources"].values()
+            if r["Type"] == "Custom::RestartEcsService"
+        ]
+        assert restarter["Properties"]["ServiceArns"] == ["service-a", "service-b"]
+
+    def test_should_restart_asynchronously(self):
+        # Setup
+        param_input = dedent(
+            """---
+            ? !item {invalidates: [servicea], key: first}
+            : 1
+            .ssmash-config:
+                invalidations:
+                    servicea: !ecs-invalidation
+                        cluster_name: fake-cluster-name
+                        service_name: service-a
+                        role_name: fake-role-name
+                        asynchronous: true
+        """
+        )
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash, input=param_input, catch_exceptions=False
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        assert "Type: AWS::CloudFormation::WaitCondition" in result.stdout
+
+    def test_should_share_restart_function_between_services(self):
+        # Setup
+        param_input = dedent(
+            """---
+            first:
+                ? !item {invalidates: [servicea], key: a}
+                : 1
+                ? !item {invalidates: [serviceb], key: b}
+                : 2
+            .ssmash-config:
+                share-invalidation-functions: true
+                invalidations:
+                    servicea: !ecs-invalidation
+                        cluster_name: fake-cluster-name
+                        service_name: service-a
+                        role_name: fake-role-name
+                    serviceb: !ecs-invalidation
+                        cluster_name: fake-cluster-name
+                        service_name: service-b
+                        role_name: fake-role-name
+        """
+        )
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash, input=param_input, catch_exceptions=False
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        assert result.stdout.count("Type: AWS::Lambda::Function") == 1
+        assert result.stdout.count("Type: Custom::RestartEcsService") == 2
+
+    def test_should_not_share_restart_function_by_default(self):
+        # Setup
+        param_input = dedent(
+            """---
+            first:
+                ? !item {invalidates: [servicea], key: a}
+                : 1
+                ? !item {invalidates: [serviceb], key: b}
+                : 2
+            .ssmash-config:
+                invalidations:
+                    servicea: !ecs-invalidation
+                        cluster_name: fake-cluster-name
+                        service_name: service-a
+                        role_name: fake-role-name
+                    serviceb: !ecs-invalidation
+                        cluster_name: fake-cluster-name
+                        service_name: service-b
+                        role_name: fake-role-name
+        """
+        )
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash, input=param_input, catch_exceptions=False
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        assert result.stdout.count("Type: AWS::Lambda::Function") == 2
+
+    def test_should_limit_concurrent_restarts(self):
+        # Setup
+        param_input = dedent(
+            """---
+            ? !item {invalidates: [servicea, serviceb, servicec], key: region}
+            : us-west-2
+            .ssmash-config:
+                max-concurrent-restarts: 2
+                invalidations:
+                    servicea: !ecs-invalidation
+                        cluster_name: fake-cluster-name
+                        service_name: service-a
+                        role_name: fake-role-name
+                    serviceb: !ecs-invalidation
+                        cluster_name: fake-cluster-name
+                        service_name: service-b
+                        role_name: fake-role-name
+                    servicec: !ecs-invalidation
+                        cluster_name: fake-cluster-name
+                        service_name: service-c
+                        role_name: fake-role-name
+        """
+        )
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash, input=param_input, catch_exceptions=False
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        template = yaml.load(result.stdout, Loader=CfnTemplateYamlLoader)
+        resources = template["Resources"]
+        assert "DependsOn" not in resources["InvalidateServiceaRestarter"]
+        assert "DependsOn" not in resources["InvalidateServicebRestarter"]
+        assert resources["InvalidateServicecRestarter"]["DependsOn"] == [
+            "InvalidateServiceaRestarter"
+        ]
+
+    def test_should_reject_invalid_concurrent_restarts(self):
+        # Setup
+        param_input = dedent(
+            """---
+            ? !item {invalidates: [servicea], key: region}
+            : us-west-2
+            .ssmash-config:
+                max-concurrent-restarts: 0
+                invalidations:
+                    servicea: !ecs-invalidation
+                        cluster_name: fake-cluster-name
+                        service_name: service-a
+                        role_name: fake-role-name
+        """
+        )
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(cli.run_ssmash, input=param_input)
+
+        # Verify
+        assert result.exit_code != 0
+        assert "max-concurrent-restarts" in str(result.exception)
+
+
+class TestSplitByDepth:
+    SPLIT_INPUT = dedent(
+        """---
+        top-value: aaa
+        acme:
+            common:
+                ? !item {invalidates: [servicea], key: region}
+                : us-west-2
+            ? !item {invalidates: [servicea], key: shipping}
+            :
+                greeting: hello
+                limit: 1000
+            warehouse:
+                substitute: birdseed
+        .ssmash-config:
+            invalidations:
+                servicea: !ecs-invalidation
+                    cluster_name: fake-cluster-name
+                    service_name: fake-service-name
+                    role_name: fake-role-name
+    """
+    )
+
+    def run_script_with_split(self, output_dir, extra_args=None):
+        args = ["--split-by-depth", "2", "--output-dir", output_dir]
+        if extra_args:
+            args.extend(extra_args)
+
+        runner = CliRunner()
+        return runner.invoke(
+            cli.run_ssmash, input=self.SPLIT_INPUT, args=args, catch_exceptions=False
+        )
+
+    def test_should_write_template_for_each_subtree(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Exercise
+            result = self.run_script_with_split("templates")
+
+            # Verify
+            assert result.exit_code == 0
+            assert not result.stdout
+            assert sorted(os.listdir("templates")) == [
+                "acme-common.yaml",
+                "acme-shipping.yaml",
+                "acme-warehouse.yaml",
+                "manifest.yaml",
+                "root.yaml",
+            ]
+
+            with open(os.path.join("templates", "acme-shipping.yaml")) as fp:
+                shipping_template = fp.read()
+            assert "Name: /acme/shipping/greeting" in shipping_template
+            assert "Name: /acme/shipping/limit" in shipping_template
+            assert "/acme/common/region" not in shipping_template
+
+    def test_should_create_separate_invalidations_for_each_subtree(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Exercise
+            with Patchers.create_ecs_service_invalidation_stack() as invalidation_mock:
+                result = self.run_script_with_split("templates")
+
+            # Verify
+            assert result.exit_code == 0
+            assert invalidation_mock.call_count == 2
+
+            dependency_names = sorted(
+                sorted(param.Properties.Name for param in call[1]["dependencies"])
+                for call in invalidation_mock.call_args_list
+            )
+            assert dependency_names == [
+                ["/acme/common/region"],
+                ["/acme/shipping/greeting", "/acme/shipping/limit"],
+            ]
+
+            with open(os.path.join("templates", "acme-warehouse.yaml")) as fp:
+                warehouse_template = fp.read()
+            assert "Custom::RestartEcsService" not in warehouse_template
+
+    def test_should_write_manifest(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Exercise
+            result = self.run_script_with_split("templates")
+
+            # Verify
+            assert result.exit_code == 0
+
+            with open(os.path.join("templates", "manifest.yaml")) as fp:
+                manifest = yaml.safe_load(fp)
+
+            assert manifest["ssmash"]["split_depth"] == 2
+            assert manifest["templates"] == [
+                {
+                    "template": "root.yaml",
+                    "path": "/",
+                    "parameters": 1,
+                    "invalidates": [],
+                },
+                {
+                    "template": "acme-common.yaml",
+                    "path": "/acme/common",
+                    "parameters": 1,
+                    "invalidates": ["servicea"],
+                },
+                {
+                    "template": "acme-shipping.yaml",
+                    "path": "/acme/shipping",
+                    "parameters": 2,
+                    "invalidates": ["servicea"],
+                },
+                {
+                    "template": "acme-warehouse.yaml",
+                    "path": "/acme/warehouse",
+                    "parameters": 1,
+                    "invalidates": [],
+                },
+            ]
+
+    def test_should_apply_chained_commands_to_each_subtree(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Exercise
+            with Patchers.create_lambda_invalidation_stack() as invalidation_mock:
+                result = self.run_script_with_split(
+                    "templates",
+                    extra_args=[
+                        "invalidate-lambda",
+                        "--function-name",
+                        "function-name",
+                        "--role-name",
+                        "arn:role",
+                    ],
+                )
+
+            # Verify
+            assert result.exit_code == 0
+            assert invalidation_mock.call_count == 4
+
+    @pytest.mark.parametrize(
+        "args", [["--split-by-depth", "2"], ["--output-dir", "templates"]]
+    )
+    def test_should_require_both_split_options(self, args):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Exercise
+            result = runner.invoke(cli.run_ssmash, input=SIMPLE_INPUT, args=args)
+
+            # Verify
+            assert result.exit_code != 0
+            assert not os.path.exists("templates")
+
+
+class ScriptedWatcher:
+    """Fake file watcher that makes a sequence of edits to the watched file.
+
+    After the last edit, it stops watching as though Ctrl+C was pressed.
+    """
+
+    def __init__(self, edits):
+        self.edits = list(edits)
+        self.first = True
+
+    def __call__(self, path, interval):
+        self.path = path
+        return self
+
+    def wait_for_change(self):
+        if self.first:
+            self.first = False
+            return
+        if not self.edits:
+            raise KeyboardInterrupt()
+        with open(self.path, "w") as fp:
+            fp.write(self.edits.pop(0))
+
+
+class TestWatch:
+    def run_watch(self, watcher, args):
+        with open("config.yaml", "w") as fp:
+            fp.write(TestSplitByDepth.SPLIT_INPUT)
+
+        runner = CliRunner(mix_stderr=False)
+        with patch("ssmash.watch.FileWatcher", watcher):
+            return runner.invoke(
+                cli.run_ssmash,
+                args=["--input", "config.yaml"] + args + ["watch"],
+                catch_exceptions=False,
+            )
+
+    def test_should_regenerate_template_when_input_changes(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Setup
+            watcher = ScriptedWatcher(
+                [TestSplitByDepth.SPLIT_INPUT.replace("aaa", "zzz")]
+            )
+
+            # Exercise
+            result = self.run_watch(watcher, ["--output", "template.yaml"])
+
+            # Verify
+            assert result.exit_code == 0
+            assert result.stderr.count("Regenerated 1 template(s)") == 2
+            with open("template.yaml") as fp:
+                template = fp.read()
+            assert "Value: zzz" in template
+            assert "Name: /acme/shipping/limit" in template
+
+    def test_should_skip_unchanged_input(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Setup
+            watcher = ScriptedWatcher(
+                [TestSplitByDepth.SPLIT_INPUT + "# Just a comment\n"]
+            )
+
+            # Exercise
+            with Patchers.write_cfn_template() as writer_mock:
+                result = self.run_watch(watcher, ["--output", "template.yaml"])
+
+            # Verify
+            assert result.exit_code == 0
+            assert writer_mock.call_count == 1
+
+    def test_should_keep_watching_after_error(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Setup
+            watcher = ScriptedWatcher(
+                ["foo: [unclosed", TestSplitByDepth.SPLIT_INPUT.replace("aaa", "zzz")]
+            )
+
+            # Exercise
+            result = self.run_watch(watcher, ["--output", "template.yaml"])
+
+            # Verify
+            assert result.exit_code == 0
+            assert "Error:" in result.stderr
+            assert result.stderr.count("Regenerated 1 template(s)") == 2
+            with open("template.yaml") as fp:
+                assert "Value: zzz" in fp.read()
+
+    def test_should_only_regenerate_changed_subtrees(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Setup
+            watcher = ScriptedWatcher(
+                [
+                    TestSplitByDepth.SPLIT_INPUT.replace(
+                        "substitute: birdseed", "substitute: dynamite"
+                    )
+                ]
+            )
+
+            # Exercise
+            result = self.run_watch(
+                watcher, ["--split-by-depth", "2", "--output-dir", "templates"]
+            )
+
+            # Verify
+            assert result.exit_code == 0
+            assert "Regenerated 4 template(s)" in result.stderr
+            assert "Regenerated 1 template(s)" in result.stderr
+            with open(os.path.join("templates", "acme-warehouse.yaml")) as fp:
+                assert "dynamite" in fp.read()
+            with open(os.path.join("templates", "manifest.yaml")) as fp:
+                manifest = yaml.safe_load(fp)
+            assert len(manifest["templates"]) == 4
+
+    def test_should_keep_watching_when_diff_finds_changes(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Setup
+            with open("previous.yaml", "w") as fp:
+                result = runner.invoke(
+                    cli.run_ssmash,
+                    input=TestSplitByDepth.SPLIT_INPUT,
+                    catch_exceptions=False,
+                )
+                fp.write(result.stdout)
+            watcher = ScriptedWatcher(
+                [
+                    TestSplitByDepth.SPLIT_INPUT.replace("aaa", "zzz"),
+                    TestSplitByDepth.SPLIT_INPUT,
+                ]
+            )
+
+            # Exercise
+            result = self.run_watch(watcher, ["diff", "--previous", "previous.yaml"])
+
+            # Verify
+            assert result.exit_code == 0, "The last regeneration found no changes"
+            assert result.stderr.count("Regenerated") == 3
+            assert result.stderr.count("with exit status 1") == 1
+            assert result.stdout.count("added:") == 3
+            assert result.stdout.count("name: /top-value") == 1
+
+    def test_should_keep_watching_when_apply_fails(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Setup
+            client = FakeSsmClient()
+            client.put_parameter = Mock(side_effect=RuntimeError("Access denied"))
+            watcher = ScriptedWatcher(
+                [TestSplitByDepth.SPLIT_INPUT.replace("aaa", "zzz")]
+            )
+
+            # Exercise
+            with patch("ssmash.apply.create_ssm_client", return_value=client):
+                result = self.run_watch(watcher, ["apply", "--max-rate", "1000"])
+
+            # Verify
+            assert result.exit_code == 1
+            assert result.stderr.count("with exit status 1") == 2
+
+    def test_should_require_input_file(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            # Exercise
+            result = runner.invoke(cli.run_ssmash, input=SIMPLE_INPUT, args=["watch"])
+
+            # Verify
+            assert result.exit_code != 0
+            assert "--input" in result.output
+
+
+class TestProfile:
+    def test_should_report_stages_as_json(self):
+        runner = CliRunner(mix_stderr=False)
+        with runner.isolated_filesystem():
+            with open("config.yaml", "w") as fp:
+                fp.write(TestSplitByDepth.SPLIT_INPUT)
+
+            # Exercise
+            result = runner.invoke(
+                cli.run_ssmash,
+                args=[
+                    "--input",
+                    "config.yaml",
+                    "--profile",
+                    "invalidate-lambda",
+                    "--function-name",
+                    "function-name",
+                    "--role-name",
+                    "arn:role",
+                ],
+                catch_exceptions=False,
+            )
+
+        # Verify
+        assert result.exit_code == 0
+        assert SIMPLE_OUTPUT_LINE not in result.stderr
+        report = json.loads(result.stderr)
+        assert [s["name"] for s in report["stages"]] == [
+            "load",
+            "convert",
+            "invalidate-lambda",
+            "embedded-invalidations",
+            "share-invalidation-functions",
+            "export",
+        ]
+        assert all(
+            s["wall_time"] >= 0 and s["peak_memory"] >= 0 for s in report["stages"]
+        )
+        assert report["counts"] == {
+            "leaves": 5,
+            "parameters": 5,
+            "invalidated_applications": 1,
+            "template_bytes": len(result.stdout.encode("utf-8")),
+        }
+
+    def test_should_label_stages_for_each_template(self):
+        runner = CliRunner(mix_stderr=False)
+        with runner.isolated_filesystem():
+            # Exercise
+            result = runner.invoke(
+                cli.run_ssmash,
+                input=TestSplitByDepth.SPLIT_INPUT,
+                args=[
+                    "--split-by-depth",
+                    "2",
+                    "--output-dir",
+                    "templates",
+                    "--profile",
+                ],
+                catch_exceptions=False,
+            )
+
+        # Verify
+        assert result.exit_code == 0
+        report = json.loads(result.stderr)
+        export_templates = [
+            s["template"] for s in report["stages"] if s["name"] == "export"
+        ]
+        assert export_templates == [
+            "root.yaml",
+            "acme-common.yaml",
+            "acme-shipping.yaml",
+            "acme-warehouse.yaml",
+        ]
+        assert report["counts"]["parameters"] == 5
+
+    def test_should_write_cprofile_stats(self):
+        runner = CliRunner(mix_stderr=False)
+        with runner.isolated_filesystem():
+            # Exercise
+            result = runner.invoke(
+                cli.run_ssmash,
+                input=SIMPLE_INPUT,
+                args=["--profile-stats", "ssmash.prof"],
+                catch_exceptions=False,
+            )
+
+            # Verify
+            assert result.exit_code == 0
+            assert SIMPLE_OUTPUT_LINE in result.stdout
+            assert not result.stderr
+            stats = pstats.Stats("ssmash.prof")
+            assert any(
+                function == "_write_cfn_template"
+                for (_, _, function) in stats.stats.keys()
+            )
+
+    def test_should_report_when_diff_finds_changes(self):
+        runner = CliRunner(mix_stderr=False)
+        with runner.isolated_filesystem():
+            with open("previous.yaml", "w") as fp:
+                result = runner.invoke(
+                    cli.run_ssmash, input="foo: old", catch_exceptions=False
+                )
+                fp.write(result.stdout)
+
+            # Exercise
+            result = runner.invoke(
+                cli.run_ssmash,
+                input="foo: new",
+                args=["--profile", "diff", "--previous", "previous.yaml"],
+                catch_exceptions=False,
+            )
+
+        # Verify
+        assert result.exit_code == 1
+        report = json.loads(result.stderr)
+        assert [s["name"] for s in report["stages"]][-1] == "diff"
+
+    def test_should_not_profile_watch(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open("config.yaml", "w") as fp:
+                fp.write(SIMPLE_INPUT)
+
+            # Exercise
+            result = runner.invoke(
+                cli.run_ssmash, args=["-i", "config.yaml", "--profile", "watch"]
+            )
+
+            # Verify
+            assert result.exit_code != 0
+            assert "watch" in result.output
+
+
+class TestMaxParallelParams:
+    def test_should_chain_parameter_creation(self):
+        # Setup
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash,
+            input="a: 1\nb: 2\nc: 3\n",
+            args=["--max-parallel-params", "2"],
+            catch_exceptions=False,
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        template = yaml.load(result.stdout, Loader=CfnTemplateYamlLoader)
+        assert {
+            name: resource.get("DependsOn")
+            for name, resource in template["Resources"].items()
+        } == {"SSMParamA": None, "SSMParamB": None, "SSMParamC": ["SSMParamA"]}
+
+    def test_should_reject_zero(self):
+        # Setup
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash, input=SIMPLE_INPUT, args=["--max-parallel-params", "0"]
+        )
+
+        # Verify
+        assert result.exit_code != 0
+
+
+class TestRetainParameters:
+    def test_should_retain_parameter_resources(self):
+        # Setup
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash,
+            input=SIMPLE_INPUT,
+            args=["--retain-parameters"],
+            catch_exceptions=False,
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        template = yaml.load(result.stdout, Loader=CfnTemplateYamlLoader)
+        assert template["Resources"]["SSMParamFoo"]["DeletionPolicy"] == "Retain"
+
+
+class TestBulkParameters:
+    def test_should_write_parameters_with_custom_resource(self):
+        # Setup
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash,
+            input=SIMPLE_INPUT,
+            args=["bulk-parameters", "--shards", "3", "--role-name", "role-arn"],
+            catch_exceptions=False,
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        assert "Type: AWS::SSM::Parameter" not in result.stdout
+        assert "Type: Custom::WriteSsmParameters" in result.stdout
+        assert "Name: /foo" in result.stdout
+
+    def test_should_depend_on_shards_from_embedded_invalidation(self):
+        # Setup
+        input = dedent(
+            """
+            foo:
+                ? !item {invalidates: [app], key: bar}
+                : baz
+            .ssmash-config:
+                invalidations:
+                    app: !ecs-invalidation
+                        cluster_name: cluster
+                        service_name: service
+                        role_name: arn:role
+            """
+        )
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash,
+            input=input,
+            args=["bulk-parameters", "--role-name", "role-arn"],
+            catch_exceptions=False,
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        template = yaml.load(result.stdout, Loader=CfnTemplateYamlLoader)
+        (invalidation,) = [
+            r
+            for r in template["Resources"].values()
+            if r["Type"] == "Custom::RestartEcsService"
+        ]
+        assert invalidation["Properties"]["IgnoredParameterNames"] == ["/foo/bar"]
+        assert len(invalidation["DependsOn"]) == 1
+        assert invalidation["DependsOn"][0].startswith("SSMParamShard")
+
+    @pytest.mark.parametrize(
+        ("args", "retained"), [([], None), (["--retain-parameters"], "true")]
+    )
+    def test_should_retain_parameters_when_requested(self, args, retained):
+        # Setup
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash,
+            input=SIMPLE_INPUT,
+            args=args + ["bulk-parameters", "--role-name", "role-arn"],
+            catch_exceptions=False,
+        )
+
+        # Verify
+        assert result.exit_code == 0
+        template = yaml.load(result.stdout, Loader=CfnTemplateYamlLoader)
+        (shard,) = [
+            r
+            for r in template["Resources"].values()
+            if r["Type"] == "Custom::WriteSsmParameters"
+        ]
+        assert shard["Properties"].get("RetainParameters") == retained
+        assert "DeletionPolicy" not in shard
+
+    def test_should_require_role(self):
+        # Setup
+        runner = CliRunner()
+
+        # Exercise
+        result = runner.invoke(
+            cli.run_ssmash, input=SIMPLE_INPUT, args=["bulk-parameters"]
+        )
+
+        # Verify
+        assert result.exit_code != 0
+
+
+class TestDiff:
+    def run_script_with_diff(self, previous_input, current_input):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open("previous.yaml", "w") as fp:
+                result = runner.invoke(
+                    cli.run_ssmash, input=previous_input, catch_exceptions=False
+                )
+                fp.write(result.stdout)
+
+            return runner.invoke(
+                cli.run_ssmash,
+                input=current_input,
+                args=["diff", "--previous", "previous.yaml"],
+                catch_exceptions=False,
+            )
+
+    def test_should_exit_cleanly_when_nothing_changed(self):
+        # Exercise
+        result = self.run_script_with_diff(SIMPLE_INPUT, SIMPLE_INPUT)
+
+        # Verify
+        assert result.exit_code == 0
+        assert yaml.safe_load(result.stdout) == {
+            "added": [],
+            "removed": [],
+            "changed": [],
+            "invalidations": [],
+        }
+
+    def test_should_report_changes_without_values(self):
+        # Exercise
+        result = self.run_script_with_diff(
+            "foo: bar\nold: value", "foo: secret-value\nnew: value"
+        )
+
+        # Verify
+        assert result.exit_code == 1
+        assert "secret-value" not in result.stdout
+
+        report = yaml.safe_load(result.stdout)
+        assert [item["name"] for item in report["added"]] == ["/new"]
+        assert [item["name"] for item in report["removed"]] == ["/old"]
+        assert [item["name"] for item in report["changed"]] == ["/foo"]
+
+    def test_should_not_write_template(self):
+        # Exercise
+        with Patchers.write_cfn_template() as write_mock:
+            result = self.run_script_with_diff(SIMPLE_INPUT, SIMPLE_INPUT)
+
+        # Verify
+        assert result.exit_code == 0
+        assert write_mock.call_count == 1, "Only the previous template is written"
+        assert SIMPLE_OUTPUT_LINE not in result.stdout
+
+
+class TestApply:
+    def run_script_with_apply(self, client, input=SIMPLE_INPUT):
+        runner = CliRunner()
+        with patch("ssmash.apply.create_ssm_client", return_value=client):
+            return runner.invoke(
+                cli.run_ssmash,
+                input=input,
+                args=["apply", "--max-rate", "1000"],
+                catch_exceptions=False,
+            )
+
+    def test_should_write_parameters_instead_of_template(self):
+        # Setup
+        client = FakeSsmClient()
+
+        # Exercise
+        result = self.run_script_with_apply(client)
+
+        # Verify
+        assert result.exit_code == 0
+        assert SIMPLE_OUTPUT_LINE not in result.stdout
+        assert client.parameters == {"/foo": ("String", "bar")}
+
+        report = yaml.safe_load(result.stdout)
+        assert report["created"] == ["/foo"]
+
+    def test_should_skip_unchanged_parameters(self):
+        # Setup
+        client = FakeSsmClient({"/foo": ("String", "bar")})
+
+        # Exercise
+        result = self.run_script_with_apply(client)
+
+        # Verify
+        assert result.exit_code == 0
+        assert client.count_calls("PutParameter") == 0
+        assert yaml.safe_load(result.stdout)["unchanged"] == 1
+
+    def test_should_exit_with_error_if_parameters_cannot_be_read(self):
+        # Setup
+        client = FakeSsmClient()
+        client.get_parameters = Mock(
+            side_effect=FakeClientError("AccessDeniedException", "GetParameters")
+        )
+
+        # Exercise
+        result = self.run_script_with_apply(client)
+
+        # Verify
+        assert result.exit_code != 0
+        assert "AccessDeniedException" in result.output
+        assert client.count_calls("PutParameter") == 0
+
+    def test_should_exit_with_error_if_parameters_fail(self):
+        # Setup
+        client = FakeSsmClient(throttle_count=1000)
+
+        # Exercise
+        with patch("ssmash.apply.time.sleep"):
+            result = self.run_script_with_apply(client)
+
+        # Verify
+        assert result.exit_code != 0
+        assert yaml.safe_load(result.stdout)["failed"][0]["name"] == "/foo"
@@ -2,11 +2,15 @@ import re
 
 import hypothesis.strategies as st
 import pytest
+import yaml
 from flyingcircus.core import Stack
 from flyingcircus.service.ssm import SSMParameter
 from hypothesis import given
 
 from ssmash.converter import convert_hierarchy_to_ssm
+from ssmash.converter import limit_parallel_parameter_creation
+from ssmash.converter import retain_parameters
+from ssmash.yamlhelper import CfnTemplateYamlLoader
 from .strategies import aws_logical_name_strategy
 from .strategies import parameter_name_strategy
 
@@ -187,3 +191,76 @@ class TestConvertHierarchyToSsm:
         self._verify_stack_has_parameter(
             stack, "/someValue", "bbb", "SomeValueDupeDupeDupeDupeDupe"
         )
+
+
+class TestLimitParallelParameterCreation:
+    """Tests for limit_parallel_parameter_creation."""
+
+    def _get_dependency_graph(self, stack: Stack) -> dict:
+        template = yaml.load(stack.export("yaml"), Loader=CfnTemplateYamlLoader)
+        return {
+            name: resource.get("DependsOn", [])
+            for name, resource in template.get("Resources", {}).items()
+        }
+
+    def test_should_create_independent_chains(self):
+        # Setup
+        stack = convert_hierarchy_to_ssm({f"p{i}": i for i in range(7)})
+
+        # Exercise
+        limit_parallel_parameter_creation(stack, 3)
+
+        # Verify
+        assert self._get_dependency_graph(stack) == {
+            "P0": [],
+            "P1": [],
+            "P2": [],
+            "P3": ["P0"],
+            "P4": ["P1"],
+            "P5": ["P2"],
+            "P6": ["P3"],
+        }
+
+    @given(
+        st.integers(min_value=1, max_value=20), st.integers(min_value=0, max_value=50)
+    )
+    def test_should_never_allow_more_than_limit_in_flight(self, limit, count):
+        # Setup
+        stack = convert_hierarchy_to_ssm({f"p{i}": i for i in range(count)})
+
+        # Exercise
+        limit_parallel_parameter_creation(stack, limit)
+
+        # Verify
+        graph = self._get_dependency_graph(stack)
+        roots = [name for name, deps in graph.items() if not deps]
+        assert len(roots) == min(limit, count)
+
+        # Every resource is in a single chain
+        dependents = [d for deps in graph.values() for d in deps]
+        assert all(len(deps) <= 1 for deps in graph.values())
+        assert len(dependents) == len(set(dependents))
+
+    def test_should_reject_invalid_limit(self):
+        # Setup
+        stack = convert_hierarchy_to_ssm({"a": 1})
+
+        # Exercise & Verify
+        with pytest.raises(ValueError):
+            limit_parallel_parameter_creation(stack, 0)
+
+
+class TestRetainParameters:
+    def test_should_retain_every_parameter(self):
+        # Setup
+        stack = convert_hierarchy_to_ssm({"a": 1, "b": {"c": 2}})
+
+        # Exercise
+        retain_parameters(stack)
+
+        # Verify
+        template = yaml.load(stack.export("yaml"), Loader=CfnTemplateYamlLoader)
+        assert [r["DeletionPolicy"] for r in template["Resources"].values()] == [
+            "Retain",
+            "Retain",
+        ]
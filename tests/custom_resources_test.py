@@ -0,0 +1,925 @@
+"""Tests for the inline Lambda functions that implement custom resources."""
+
+import json
+import os
+import time
+from datetime import datetime
+from datetime import timezone
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from ssmash.custom_resources import replace_lambda_context_resource_handler
+from ssmash.custom_resources import restart_ecs_service_resource_handler
+from ssmash.custom_resources import signal_ecs_deployment_handler
+from ssmash.custom_resources import write_ssm_parameters_resource_handler
+from .fakes import FakeClientError
+from .fakes import FakeClock
+from .fakes import FakeCloudFormationClient
+from .fakes import FakeEcsClient
+from .fakes import FakeLambdaClient
+from .fakes import FakeLambdaContext
+from .fakes import FakeSsmClient
+from .fakes import fake_lambda_runtime
+
+STACK_ID = "arn:aws:cloudformation:us-east-1:123456789012:stack/mystack/guid"
+
+
+def _get_metrics(output: str) -> dict:
+    """Get the CloudWatch Embedded Metric Format records from a handler's output."""
+    result = dict()
+    for line in output.splitlines():
+        if line.startswith("{") and '"_aws"' in line:
+            record = json.loads(line)
+            (directive,) = record["_aws"]["CloudWatchMetrics"]
+            assert directive["Dimensions"] == [["Target"]]
+            result[record["Target"]] = {
+                metric["Name"]: (record[metric["Name"]], metric["Unit"])
+                for metric in directive["Metrics"]
+            }
+    return result
+
+
+def _create_event(request_type: str, names: dict, old_names: dict = None) -> dict:
+    event = {
+        "RequestType": request_type,
+        "StackId": STACK_ID,
+        "LogicalResourceId": "SSMParamShard0",
+        "ResourceProperties": {
+            "ServiceToken": "arn",
+            "Parameters": [
+                {"Name": name, "Type": "String", "Value": value}
+                for name, value in names.items()
+            ],
+        },
+    }
+    if request_type != "Create":
+        event["PhysicalResourceId"] = "mystack-SSMParamShard0"
+    if old_names is not None:
+        event["OldResourceProperties"] = _create_event("Create", old_names)[
+            "ResourceProperties"
+        ]
+    return event
+
+
+class TestWriteSsmParametersHandler:
+    def test_should_create_parameters(self):
+        # Setup
+        ssm = FakeSsmClient()
+
+        # Exercise
+        with fake_lambda_runtime(ssm=ssm) as cfnresponse:
+            write_ssm_parameters_resource_handler(
+                _create_event("Create", {"/a": "1", "/b": "2"}), FakeLambdaContext()
+            )
+
+        # Verify
+        assert cfnresponse.responses == [
+            {
+                "Status": "SUCCESS",
+                "Data": {},
+                "PhysicalResourceId": "mystack-SSMParamShard0",
+                "Reason": None,
+            }
+        ]
+        assert ssm.parameters == {"/a": ("String", "1"), "/b": ("String", "2")}
+
+    def test_should_only_write_changed_parameters_on_update(self):
+        # Setup
+        ssm = FakeSsmClient(
+            {"/a": ("String", "1"), "/b": ("String", "2"), "/c": ("String", "3")}
+        )
+        event = _create_event(
+            "Update",
+            {"/a": "1", "/b": "changed", "/d": "4"},
+            old_names={"/a": "1", "/b": "2", "/c": "3"},
+        )
+
+        # Exercise
+        with fake_lambda_runtime(ssm=ssm) as cfnresponse:
+            write_ssm_parameters_resource_handler(event, FakeLambdaContext())
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert ssm.count_calls("PutParameter") == 2
+        assert ssm.parameters == {
+            "/a": ("String", "1"),
+            "/b": ("String", "changed"),
+            "/d": ("String", "4"),
+        }
+
+    def test_should_delete_parameters(self):
+        # Setup
+        names = {f"/a/{i}": str(i) for i in range(25)}
+        ssm = FakeSsmClient({n: ("String", v) for n, v in names.items()})
+
+        # Exercise
+        with fake_lambda_runtime(ssm=ssm) as cfnresponse:
+            write_ssm_parameters_resource_handler(
+                _create_event("Delete", names), FakeLambdaContext()
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert ssm.parameters == {}
+        assert ssm.count_calls("DeleteParameters") == 3
+
+    def test_should_retain_parameters_when_requested(self):
+        # Setup
+        ssm = FakeSsmClient({"/a": ("String", "1"), "/b": ("String", "2")})
+        event = _create_event("Update", {"/a": "1"}, old_names={"/a": "1", "/b": "2"})
+        event["OldResourceProperties"]["RetainParameters"] = "true"
+        deletion = _create_event("Delete", {"/a": "1"})
+        deletion["ResourceProperties"]["RetainParameters"] = "true"
+
+        # Exercise
+        with fake_lambda_runtime(ssm=ssm) as cfnresponse:
+            write_ssm_parameters_resource_handler(event, FakeLambdaContext())
+            write_ssm_parameters_resource_handler(deletion, FakeLambdaContext())
+
+        # Verify
+        assert [r["Status"] for r in cfnresponse.responses] == ["SUCCESS", "SUCCESS"]
+        assert ssm.parameters == {"/a": ("String", "1"), "/b": ("String", "2")}
+        assert ssm.count_calls("DeleteParameters") == 0
+
+    def test_should_retry_throttled_writes(self):
+        # Setup
+        ssm = FakeSsmClient(throttle_count=3)
+
+        # Exercise
+        with fake_lambda_runtime(ssm=ssm) as cfnresponse, patch("time.sleep"):
+            write_ssm_parameters_resource_handler(
+                _create_event("Create", {"/a": "1", "/b": "2"}), FakeLambdaContext()
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert len(ssm.parameters) == 2
+
+    def test_should_report_failure(self):
+        # Setup
+        ssm = FakeSsmClient(throttle_count=1000)
+
+        # Exercise
+        with fake_lambda_runtime(ssm=ssm) as cfnresponse, patch("time.sleep"):
+            write_ssm_parameters_resource_handler(
+                _create_event("Create", {"/a": "1"}), FakeLambdaContext()
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "FAILED"
+        assert "ThrottlingException" in response["Reason"]
+        assert response["PhysicalResourceId"] == "mystack-SSMParamShard0"
+
+    def test_should_fail_with_reason_before_lambda_timeout(self):
+        # Setup
+        ssm = FakeSsmClient(throttle_count=1000)
+        clock = FakeClock()
+        context = FakeLambdaContext(remaining_millis=20 * 1000, clock=clock)
+
+        # Exercise
+        with fake_lambda_runtime(ssm=ssm) as cfnresponse, patch(
+            "time.sleep", clock.sleep
+        ), patch("time.monotonic", clock):
+            write_ssm_parameters_resource_handler(
+                _create_event("Create", {"/a": "1"}), context
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "FAILED"
+        assert "ThrottlingException" in response["Reason"]
+        assert response["PhysicalResourceId"] == "mystack-SSMParamShard0"
+        assert context.get_remaining_time_in_millis() >= 5 * 1000
+
+    def test_should_not_start_deleting_parameters_after_deadline(self):
+        # Setup
+        names = {f"/a/{i}": str(i) for i in range(25)}
+        ssm = FakeSsmClient({n: ("String", v) for n, v in names.items()})
+        clock = FakeClock()
+        context = FakeLambdaContext(remaining_millis=5 * 1000, clock=clock)
+        ssm.delete_parameters = Mock(side_effect=lambda Names: clock.sleep(1))
+
+        # Exercise
+        with fake_lambda_runtime(ssm=ssm) as cfnresponse, patch(
+            "time.monotonic", clock
+        ):
+            write_ssm_parameters_resource_handler(
+                _create_event("Delete", names), context
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "FAILED"
+        assert "Only deleted 10 of 25 parameters" in response["Reason"]
+        assert ssm.delete_parameters.call_count == 1
+
+
+class TestReplaceLambdaContextHandler:
+    def _create_event(self, **properties) -> dict:
+        return {
+            "RequestType": "Update",
+            "RequestId": "request-1",
+            "StackId": STACK_ID,
+            "LogicalResourceId": "InvalidateLambdaReplacer",
+            "PhysicalResourceId": "old-revision",
+            "ResourceProperties": dict(ServiceToken="arn", **properties),
+        }
+
+    def test_should_replace_single_function(self):
+        # Setup
+        client = FakeLambdaClient(["function-a"])
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse:
+            replace_lambda_context_resource_handler(
+                self._create_event(FunctionName="function-a"), FakeLambdaContext()
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "SUCCESS"
+        assert response["PhysicalResourceId"] == "rev-1"
+
+        variables = client.functions["function-a"]["Environment"]["Variables"]
+        assert "SSMASH_CONFIG_DIGEST" in variables
+
+    def test_should_replace_many_functions_concurrently(self):
+        # Setup
+        names = [f"function-{i}" for i in range(50)]
+        client = FakeLambdaClient(names, latency=0.05)
+
+        # Exercise
+        started = time.monotonic()
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse:
+            replace_lambda_context_resource_handler(
+                self._create_event(FunctionNames=names), FakeLambdaContext()
+            )
+        elapsed = time.monotonic() - started
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert all(f["RevisionId"] == "rev-1" for f in client.functions.values())
+        assert elapsed < 50 * 0.05 / 2, "Updates should not be serial"
+
+    def test_should_retry_when_revision_changes(self):
+        # Setup
+        client = FakeLambdaClient(["function-a", "function-b"], conflict_count=3)
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse, patch(
+            "time.sleep"
+        ):
+            replace_lambda_context_resource_handler(
+                self._create_event(FunctionNames=["function-a", "function-b"]),
+                FakeLambdaContext(),
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert client.count_calls("UpdateFunctionConfiguration") == 5
+
+    def test_should_not_update_again_when_request_is_retried(self):
+        # Setup
+        client = FakeLambdaClient(["function-a"])
+        event = self._create_event(FunctionName="function-a")
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse:
+            replace_lambda_context_resource_handler(event, FakeLambdaContext())
+            replace_lambda_context_resource_handler(event, FakeLambdaContext())
+
+        # Verify
+        first, second = cfnresponse.responses
+        assert second["Status"] == "SUCCESS"
+        assert second["PhysicalResourceId"] == first["PhysicalResourceId"]
+        assert client.count_calls("UpdateFunctionConfiguration") == 1
+
+    def test_should_only_update_when_parameter_values_change(self):
+        # Setup
+        client = FakeLambdaClient(["function-a"])
+        first = self._create_event(
+            FunctionName="function-a",
+            IgnoredParameterNames=["/a", "/b"],
+            IgnoredParameterKeys=["1", "2"],
+        )
+        replayed = dict(first, RequestId="request-2")
+        changed = self._create_event(
+            FunctionName="function-a",
+            IgnoredParameterNames=["/a", "/b"],
+            IgnoredParameterKeys=["1", "changed"],
+        )
+        changed["RequestId"] = "request-3"
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse:
+            for event in (first, replayed, changed):
+                replace_lambda_context_resource_handler(event, FakeLambdaContext())
+
+        # Verify
+        assert all(r["Status"] == "SUCCESS" for r in cfnresponse.responses)
+        assert client.count_calls("UpdateFunctionConfiguration") == 2
+
+        environment = client.functions["function-a"]["Environment"]["Variables"]
+        assert "SSMASH_UPDATED_TIMESTAMP" not in environment
+        assert "changed" not in environment["SSMASH_CONFIG_DIGEST"]
+
+    def test_should_prewarm_updated_functions(self):
+        # Setup
+        client = FakeLambdaClient(
+            ["function-a", "function-b"], latency=0.05, polls_until_updated=2
+        )
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse, patch(
+            "time.sleep"
+        ):
+            replace_lambda_context_resource_handler(
+                self._create_event(
+                    FunctionNames=["function-a", "function-b"],
+                    PrewarmConcurrency="5",
+                    PrewarmPayload='{"warm": true}',
+                ),
+                FakeLambdaContext(),
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        invocations = [c[1] for c in client.calls if c[0] == "Invoke"]
+        assert len(invocations) == 10
+        assert {i["Payload"] for i in invocations} == {b'{"warm": true}'}
+        assert client.max_concurrent_invocations > 1
+        assert client.count_calls("GetFunctionConfiguration") == 2 * (1 + 3)
+
+        # Each function is only invoked after it's update has finished
+        for name in ("function-a", "function-b"):
+            calls = [c for c in client.calls if c[1]["FunctionName"] == name]
+            first_invoke = [c[0] for c in calls].index("Invoke")
+            assert calls[first_invoke - 1][0] == "GetFunctionConfiguration"
+
+    def test_should_fail_when_update_fails(self):
+        # Setup
+        client = FakeLambdaClient(
+            ["function-a", "function-b"],
+            polls_until_updated=1,
+            failed_updates=["function-b"],
+        )
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse, patch(
+            "time.sleep"
+        ):
+            replace_lambda_context_resource_handler(
+                self._create_event(
+                    FunctionNames=["function-a", "function-b"], PrewarmConcurrency="2"
+                ),
+                FakeLambdaContext(),
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "FAILED"
+        assert "function-b" in response["Reason"]
+        assert "function-a" not in response["Reason"]
+        assert client.count_calls("Invoke") == 2, "Should only prewarm function-a"
+
+    def test_should_not_prewarm_functions_that_are_up_to_date(self):
+        # Setup
+        client = FakeLambdaClient(["function-a"])
+        event = self._create_event(FunctionName="function-a", PrewarmConcurrency="3")
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}):
+            replace_lambda_context_resource_handler(event, FakeLambdaContext())
+            replace_lambda_context_resource_handler(event, FakeLambdaContext())
+
+        # Verify
+        assert client.count_calls("Invoke") == 3
+
+    def test_should_log_update_metrics(self, capsys):
+        # Setup
+        client = FakeLambdaClient(["function-a", "function-b"], throttle_count=1)
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}), patch("time.sleep"):
+            replace_lambda_context_resource_handler(
+                self._create_event(FunctionNames=["function-a", "function-b"]),
+                FakeLambdaContext(),
+            )
+
+        # Verify
+        metrics = _get_metrics(capsys.readouterr().out)
+        assert sorted(metrics) == ["function-a", "function-b"]
+        assert metrics["function-a"]["UpdateTime"][1] == "Milliseconds"
+        assert (
+            sum(m["ThrottleRetries"][0] for m in metrics.values()) == 1
+        ), "Should count throttled requests"
+
+    def test_should_respond_when_metrics_cannot_be_logged(self):
+        # Setup
+        client = FakeLambdaClient(["function-a"])
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse, patch(
+            "json.dumps", side_effect=ValueError
+        ):
+            replace_lambda_context_resource_handler(
+                self._create_event(FunctionNames=["function-a", "missing"]),
+                FakeLambdaContext(),
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "FAILED"
+
+    def test_should_fail_when_out_of_time(self):
+        # Setup
+        client = FakeLambdaClient(["function-a"], latency=0.5)
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse:
+            replace_lambda_context_resource_handler(
+                self._create_event(FunctionName="function-a"),
+                FakeLambdaContext(remaining_millis=5100),
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "FAILED"
+
+    def test_should_fail_for_missing_function(self):
+        # Setup
+        client = FakeLambdaClient(["function-a"])
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse:
+            replace_lambda_context_resource_handler(
+                self._create_event(FunctionNames=["function-a", "missing"]),
+                FakeLambdaContext(),
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "FAILED"
+        assert "ResourceNotFoundException" in response["Reason"]
+        assert response["PhysicalResourceId"] == "old-revision"
+
+    def test_should_support_cfnresponse_without_reason(self):
+        # Setup
+        client = FakeLambdaClient(["function-a"])
+        sent = []
+
+        def send(event, context, responseStatus, responseData, physicalResourceId):
+            sent.append((responseStatus, physicalResourceId))
+
+        # Exercise
+        with fake_lambda_runtime(**{"lambda": client}) as cfnresponse:
+            cfnresponse.send = send
+            replace_lambda_context_resource_handler(
+                self._create_event(FunctionName="missing"), FakeLambdaContext()
+            )
+
+        # Verify
+        assert sent == [("FAILED", "old-revision")]
+
+    def test_should_replace_every_function_in_stacks(self):
+        # Setup
+        function_names = [f"function-{i}" for i in range(25)]
+        stack_resources = {name: "AWS::Lambda::Function" for name in function_names}
+        stack_resources["some-bucket"] = "AWS::S3::Bucket"
+        stack_resources["ssmash-handler"] = "AWS::Lambda::Function"
+
+        cloudformation = FakeCloudFormationClient(
+            {"app-stack": stack_resources}, page_size=10
+        )
+        client = FakeLambdaClient(function_names + ["other", "ssmash-handler"])
+
+        # Exercise
+        with fake_lambda_runtime(
+            cloudformation=cloudformation, **{"lambda": client}
+        ) as cfnresponse:
+            replace_lambda_context_resource_handler(
+                self._create_event(StackNames=["app-stack"], FunctionName="other"),
+                FakeLambdaContext(function_name="ssmash-handler"),
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert cloudformation.count_calls("ListStackResources") == 3
+        assert {
+            c[1]["FunctionName"]
+            for c in client.calls
+            if c[0] == "UpdateFunctionConfiguration"
+        } == set(function_names + ["other"])
+
+    def test_should_skip_functions_without_physical_id(self):
+        # Setup
+        cloudformation = FakeCloudFormationClient(
+            {
+                "app-stack": {
+                    "function-a": "AWS::Lambda::Function",
+                    None: "AWS::Lambda::Function",
+                }
+            }
+        )
+        client = FakeLambdaClient(["function-a"])
+
+        # Exercise
+        with fake_lambda_runtime(
+            cloudformation=cloudformation, **{"lambda": client}
+        ) as cfnresponse:
+            replace_lambda_context_resource_handler(
+                self._create_event(StackNames=["app-stack"]), FakeLambdaContext()
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert client.count_calls("UpdateFunctionConfiguration") == 1
+
+    def test_should_fail_for_missing_stack(self):
+        # Setup
+        cloudformation = FakeCloudFormationClient()
+        client = FakeLambdaClient()
+
+        # Exercise
+        with fake_lambda_runtime(
+            cloudformation=cloudformation, **{"lambda": client}
+        ) as cfnresponse:
+            replace_lambda_context_resource_handler(
+                self._create_event(StackNames=["missing"]), FakeLambdaContext()
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "FAILED"
+
+
+class TestRestartEcsServiceHandler:
+    def _create_event(self, **properties) -> dict:
+        return {
+            "RequestType": "Update",
+            "RequestId": "request-1",
+            "StackId": STACK_ID,
+            "LogicalResourceId": "InvalidateServiceRestarter",
+            "PhysicalResourceId": "old-deployment",
+            "ResourceProperties": dict(
+                ServiceToken="arn", ClusterArn="cluster", **properties
+            ),
+        }
+
+    def test_should_restart_single_service(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a"], polls_until_stable=3)
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch("time.sleep"):
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArn="service-a"), FakeLambdaContext()
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "SUCCESS"
+        assert response["PhysicalResourceId"] == "ecs-svc/service-a-1"
+        assert ecs.count_calls("DescribeServices") == 4
+
+    def test_should_restart_many_services_with_batched_polling(self):
+        # Setup
+        names = [f"service-{i}" for i in range(25)]
+        ecs = FakeEcsClient(names, polls_until_stable=2)
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch("time.sleep"):
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArns=names), FakeLambdaContext()
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert ecs.count_calls("UpdateService") == 25
+
+        # 25 services need 3 batches, and every service is polled twice
+        assert ecs.count_calls("DescribeServices") == 9
+        assert all(len(s["deployments"]) == 1 for s in ecs.services.values())
+
+    def test_should_back_off_while_polling(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a"], polls_until_stable=8)
+        clock = FakeClock()
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch(
+            "time.sleep", clock.sleep
+        ), patch("time.monotonic", clock):
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArn="service-a"),
+                FakeLambdaContext(remaining_millis=15 * 60 * 1000, clock=clock),
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert ecs.count_calls("DescribeServices") == 9
+        assert clock.now == 5 + 10 + 20 + 30 * 5
+
+    def test_should_fail_with_reason_before_lambda_timeout(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a", "service-b"], polls_until_stable=1000)
+        clock = FakeClock()
+        context = FakeLambdaContext(remaining_millis=8 * 60 * 1000, clock=clock)
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch(
+            "time.sleep", clock.sleep
+        ), patch("time.monotonic", clock):
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArns=["service-a", "service-b"]), context
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "FAILED"
+        assert "not stable" in response["Reason"]
+        assert "service-b" in response["Reason"]
+        assert response["PhysicalResourceId"], "Physical ID should not change"
+        assert 0 < context.get_remaining_time_in_millis() <= 10 * 1000
+
+    def test_should_log_restart_metrics(self, capsys):
+        # Setup
+        ecs = FakeEcsClient(["service-a", "service-b"], polls_until_stable=3)
+        clock = FakeClock()
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs), patch("time.sleep", clock.sleep), patch(
+            "time.monotonic", clock
+        ):
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArns=["service-a", "service-b"]),
+                FakeLambdaContext(clock=clock),
+            )
+
+        # Verify
+        metrics = _get_metrics(capsys.readouterr().out)
+        service_arn = ecs.services["service-a"]["serviceArn"]
+        assert metrics[service_arn] == {
+            "UpdateTime": (0, "Milliseconds"),
+            "ThrottleRetries": (0, "Count"),
+            "Polls": (3, "Count"),
+            "StabilityTime": ((5 + 10 + 20) * 1000, "Milliseconds"),
+        }
+
+    def test_should_respond_when_metrics_cannot_be_logged(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a"], polls_until_stable=1)
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch("time.sleep"), patch(
+            "json.dumps", side_effect=ValueError
+        ):
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArn="service-a"), FakeLambdaContext()
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "SUCCESS"
+
+    def test_should_retry_throttled_restarts(self, capsys):
+        # Setup
+        ecs = FakeEcsClient(["service-a", "service-b"], throttle_count=3)
+        clock = FakeClock()
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch(
+            "time.sleep", clock.sleep
+        ), patch("time.monotonic", clock):
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArns=["service-a", "service-b"]),
+                FakeLambdaContext(clock=clock),
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert ecs.count_calls("UpdateService") == 5
+        metrics = _get_metrics(capsys.readouterr().out)
+        assert (
+            sum(m["ThrottleRetries"][0] for m in metrics.values()) == 3
+        ), "Should count throttled requests"
+
+    def test_should_stop_retrying_throttled_restart_before_lambda_timeout(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a"], throttle_count=1000)
+        clock = FakeClock()
+        context = FakeLambdaContext(remaining_millis=15 * 1000, clock=clock)
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch(
+            "time.sleep", clock.sleep
+        ), patch("time.monotonic", clock):
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArn="service-a"), context
+            )
+
+        # Verify
+        (response,) = cfnresponse.responses
+        assert response["Status"] == "FAILED"
+        assert "ThrottlingException" in response["Reason"]
+        assert context.get_remaining_time_in_millis() >= 10 * 1000
+
+    def test_should_support_cfnresponse_without_reason(self):
+        # Setup
+        ecs = FakeEcsClient()
+        sent = []
+
+        def send(event, context, responseStatus, responseData, physicalResourceId):
+            sent.append(responseStatus)
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse:
+            cfnresponse.send = send
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArn="missing"), FakeLambdaContext()
+            )
+
+        # Verify
+        assert sent == ["FAILED"]
+
+    def test_should_not_wait_for_asynchronous_restart(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a"], polls_until_stable=1000)
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch(
+            "time.sleep"
+        ) as sleep_mock:
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArn="service-a", WaitForStability="false"),
+                FakeLambdaContext(),
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert ecs.count_calls("UpdateService") == 1
+        assert ecs.count_calls("DescribeServices") == 1
+        sleep_mock.assert_not_called()
+
+    def test_should_not_restart_again_when_request_is_retried(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a", "service-b"])
+        event = self._create_event(ServiceArns=["service-a", "service-b"])
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch("time.sleep"):
+            restart_ecs_service_resource_handler(event, FakeLambdaContext())
+            restart_ecs_service_resource_handler(event, FakeLambdaContext())
+
+        # Verify
+        first, second = cfnresponse.responses
+        assert second["Status"] == "SUCCESS"
+        assert second["PhysicalResourceId"] == first["PhysicalResourceId"]
+        assert ecs.count_calls("UpdateService") == 2
+
+    def test_should_restart_when_service_cannot_be_tagged(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a"])
+        ecs.tag_resource = Mock(
+            side_effect=FakeClientError("AccessDeniedException", "TagResource")
+        )
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch("time.sleep"):
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArn="service-a"), FakeLambdaContext()
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert ecs.count_calls("UpdateService") == 1
+
+    def _restart_twice(self, ecs, ssm):
+        """Restart a service asynchronously, then restart it again from
+        another stack while the first deployment is still in progress.
+        """
+        first = self._create_event(ServiceArn="service-a", WaitForStability="false")
+        second = self._create_event(
+            ServiceArn="service-a", IgnoredParameterNames=["/a"]
+        )
+        second["RequestId"] = "request-2"
+
+        with fake_lambda_runtime(ecs=ecs, ssm=ssm) as cfnresponse, patch("time.sleep"):
+            restart_ecs_service_resource_handler(first, FakeLambdaContext())
+            restart_ecs_service_resource_handler(second, FakeLambdaContext())
+        return cfnresponse.responses
+
+    def test_should_join_deployment_in_progress(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a"], polls_until_stable=3)
+        ssm = FakeSsmClient({"/a": ("String", "1")})
+
+        # Exercise
+        first, second = self._restart_twice(ecs, ssm)
+
+        # Verify
+        assert second["Status"] == "SUCCESS"
+        assert second["PhysicalResourceId"] == first["PhysicalResourceId"]
+        assert ecs.count_calls("UpdateService") == 1
+
+    def test_should_not_join_deployment_from_before_parameter_change(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a"], polls_until_stable=3)
+        ssm = FakeSsmClient({"/a": ("String", "1")})
+        ssm.last_modified["/a"] = datetime(2100, 1, 1, tzinfo=timezone.utc)
+
+        # Exercise
+        first, second = self._restart_twice(ecs, ssm)
+
+        # Verify
+        assert second["Status"] == "SUCCESS"
+        assert second["PhysicalResourceId"] != first["PhysicalResourceId"]
+        assert ecs.count_calls("UpdateService") == 2
+
+    def test_should_fail_for_missing_service(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a"])
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse, patch("time.sleep"):
+            restart_ecs_service_resource_handler(
+                self._create_event(ServiceArns=["service-a", "missing"]),
+                FakeLambdaContext(),
+            )
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "FAILED"
+
+    def test_should_ignore_delete(self):
+        # Setup
+        ecs = FakeEcsClient(["service-a"])
+        event = self._create_event(ServiceArn="service-a")
+        event["RequestType"] = "Delete"
+
+        # Exercise
+        with fake_lambda_runtime(ecs=ecs) as cfnresponse:
+            restart_ecs_service_resource_handler(event, FakeLambdaContext())
+
+        # Verify
+        assert cfnresponse.responses[0]["Status"] == "SUCCESS"
+        assert not ecs.calls
+
+
+class TestSignalEcsDeploymentHandler:
+    HANDLE_URL = "https://cloudformation-waitcondition.example.com/handle"
+
+    def _send_event(self, service_arn: str, event_name: str):
+        event = {
+            "source": "aws.ecs",
+            "detail-type": "ECS Deployment State Change",
+            "resources": [service_arn],
+            "detail": {"eventName": event_name, "deploymentId": "ecs-svc/123"},
+        }
+        environment = {
+            "SSMASH_SERVICES": "service-a,service-b",
+            "SSMASH_WAIT_HANDLE_URL": self.HANDLE_URL,
+        }
+        with patch.dict(os.environ, environment), patch(
+            "urllib.request.urlopen"
+        ) as urlopen_mock:
+            signal_ecs_deployment_handler(event, FakeLambdaContext())
+        return [call[0][0] for call in urlopen_mock.call_args_list]
+
+    def test_should_signal_success(self):
+        # Exercise
+        requests = self._send_event(
+            "arn:aws:ecs:us-east-1:123456789012:service/cluster/service-b",
+            "SERVICE_DEPLOYMENT_COMPLETED",
+        )
+
+        # Verify
+        (request,) = requests
+        assert request.full_url == self.HANDLE_URL
+        assert request.get_method() == "PUT"
+
+        body = json.loads(request.data)
+        assert body["Status"] == "SUCCESS"
+        assert body["UniqueId"].endswith("/service-b")
+
+    def test_should_signal_failure(self):
+        # Exercise
+        (request,) = self._send_event("service-a", "SERVICE_DEPLOYMENT_FAILED")
+
+        # Verify
+        assert json.loads(request.data)["Status"] == "FAILURE"
+
+    def test_should_ignore_other_services(self):
+        # Exercise
+        requests = self._send_event(
+            "arn:aws:ecs:us-east-1:123456789012:service/cluster/service-c",
+            "SERVICE_DEPLOYMENT_COMPLETED",
+        )
+
+        # Verify
+        assert not requests
+
+    def test_should_ignore_deployment_in_progress(self):
+        # Exercise
+        requests = self._send_event("service-a", "SERVICE_DEPLOYMENT_IN_PROGRESS")
+
+        # Verify
+        assert not requests
@@ -0,0 +1,197 @@
+import hashlib
+from io import StringIO
+from textwrap import dedent
+
+from flyingcircus.core import Stack
+from flyingcircus.intrinsic_function import ImportValue
+from flyingcircus.service.ssm import SSMParameter
+from flyingcircus.service.ssm import SSMParameterProperties
+
+from ssmash.diff import diff_templates
+from ssmash.diff import hash_parameter_value
+from ssmash.diff import index_stack
+from ssmash.diff import index_template
+from ssmash.diff import load_template
+from ssmash.invalidation import create_ecs_service_invalidation_stack
+
+
+def _create_parameter(name: str, value: str) -> SSMParameter:
+    return SSMParameter(
+        Properties=SSMParameterProperties(Name=name, Type="String", Value=value)
+    )
+
+
+def _create_stack(values: dict, invalidated_names=()) -> Stack:
+    """Create a stack with the supplied parameters, and an ECS invalidation
+    that depends on some of them.
+    """
+    stack = Stack()
+    for i, (name, value) in enumerate(values.items()):
+        stack.Resources[f"Param{i}"] = _create_parameter(name, value)
+
+    if invalidated_names:
+        dependencies = [
+            p
+            for p in stack.Resources.values()
+            if p.Properties.Name in invalidated_names
+        ]
+        stack.merge_stack(
+            create_ecs_service_invalidation_stack(
+                cluster="cluster-name",
+                service=ImportValue("service-export"),
+                dependencies=dependencies,
+                restart_role="role-arn",
+            ).with_prefixed_names("InvalidateService")
+        )
+    return stack
+
+
+def _roundtrip(stack: Stack):
+    """Export a stack, and index the template in the same way as a previous template."""
+    return index_template(load_template(StringIO(stack.export("yaml"))))
+
+
+class TestLoadTemplate:
+    def test_should_load_short_form_intrinsic_functions(self):
+        # Setup
+        template = dedent(
+            """
+            Resources:
+              Thing:
+                Properties:
+                  A: !Ref Other
+                  B: !GetAtt Other.Value
+                  C: !ImportValue some-export
+                  D: !Join [",", [a, b]]
+            """
+        )
+
+        # Exercise
+        result = load_template(StringIO(template))
+
+        # Verify
+        assert result["Resources"]["Thing"]["Properties"] == {
+            "A": {"Ref": "Other"},
+            "B": {"Fn::GetAtt": ["Other", "Value"]},
+            "C": {"Fn::ImportValue": "some-export"},
+            "D": {"Fn::Join": [",", ["a", "b"]]},
+        }
+
+
+class TestIndex:
+    def test_stack_and_exported_template_should_have_same_index(self):
+        # Setup
+        stack = _create_stack({"/a": "1", "/b": "2", "/c": "3"}, {"/a", "/b"})
+
+        # Exercise
+        stack_index = index_stack(stack)
+        template_index = _roundtrip(stack)
+
+        # Verify
+        assert stack_index == template_index
+        assert stack_index.parameters["/a"] == hash_parameter_value("String", "1")
+
+        (invalidation,) = stack_index.invalidations.values()
+        assert invalidation.dependencies == {"/a", "/b"}
+        assert invalidation.target == {"Fn::ImportValue": "service-export"}
+
+    def test_should_not_include_plaintext_values(self):
+        # Setup
+        stack = _create_stack({"/secret": "hunter2"})
+
+        # Exercise
+        index = index_stack(stack)
+
+        # Verify
+        assert "hunter2" not in repr(index)
+
+
+class TestDiffTemplates:
+    def test_should_have_no_changes_for_identical_templates(self):
+        # Setup
+        values = {"/a": "1", "/b": "2"}
+
+        # Exercise
+        diff = diff_templates(
+            _roundtrip(_create_stack(values, {"/a"})),
+            index_stack(_create_stack(values, {"/a"})),
+        )
+
+        # Verify
+        assert not diff.has_changes
+
+    def test_should_find_changed_parameters(self):
+        # Exercise
+        diff = diff_templates(
+            _roundtrip(_create_stack({"/a": "1", "/b": "2", "/c": "3"})),
+            index_stack(_create_stack({"/b": "2", "/c": "changed", "/d": "4"})),
+        )
+
+        # Verify
+        assert diff.has_changes
+        assert set(diff.added) == {"/d"}
+        assert set(diff.removed) == {"/a"}
+        assert set(diff.changed) == {"/c"}
+
+        old_hash, new_hash = diff.changed["/c"]
+        assert old_hash == hash_parameter_value("String", "3")
+        assert new_hash == hash_parameter_value("String", "changed")
+
+    def test_should_fire_invalidation_when_dependency_changes(self):
+        # Exercise
+        diff = diff_templates(
+            _roundtrip(_create_stack({"/a": "1", "/b": "2"}, {"/a"})),
+            index_stack(_create_stack({"/a": "changed", "/b": "2"}, {"/a"})),
+        )
+
+        # Verify
+        assert list(diff.invalidations) == ["InvalidateServiceRestarter"]
+
+    def test_should_not_fire_invalidation_when_other_parameter_changes(self):
+        # Exercise
+        diff = diff_templates(
+            _roundtrip(_create_stack({"/a": "1", "/b": "2"}, {"/a"})),
+            index_stack(_create_stack({"/a": "1", "/b": "changed"}, {"/a"})),
+        )
+
+        # Verify
+        assert set(diff.changed) == {"/b"}
+        assert not diff.invalidations
+
+    def test_should_fire_new_invalidation(self):
+        # Exercise
+        diff = diff_templates(
+            _roundtrip(_create_stack({"/a": "1"})),
+            index_stack(_create_stack({"/a": "1"}, {"/a"})),
+        )
+
+        # Verify
+        assert diff.has_changes
+        assert list(diff.invalidations) == ["InvalidateServiceRestarter"]
+
+        report = diff.as_report()
+        assert report["invalidations"] == [
+            {
+                "resource": "InvalidateServiceRestarter",
+                "type": "Custom::RestartEcsService",
+                "target": {"Fn::ImportValue": "service-export"},
+            }
+        ]
+
+
+class TestHashParameterValue:
+    def test_should_not_use_unkeyed_hash(self):
+        # Exercise
+        value_hash = hash_parameter_value("String", "password")
+
+        # Verify
+        unkeyed_hash = hashlib.blake2b(b"String\0password", digest_size=8).hexdigest()
+        assert value_hash != unkeyed_hash
+
+    def test_should_hash_same_value_consistently(self):
+        assert hash_parameter_value("String", "1") == hash_parameter_value(
+            "String", "1"
+        )
+        assert hash_parameter_value("String", "1") != hash_parameter_value(
+            "SecureString", "1"
+        )
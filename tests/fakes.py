@@ -0,0 +1,508 @@
+"""Local stand-ins for the AWS services that ssmash talks to."""
+
+import copy
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from datetime import timezone
+from unittest.mock import patch
+
+#: The time that pre-existing fake resources were last modified
+INITIAL_TIME = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeClientError(Exception):
+    """Mimics a botocore ClientError, which carries the AWS error code in it's response."""
+
+    def __init__(self, code: str, operation_name: str = "Unknown"):
+        super().__init__(f"An error occurred ({code}) when calling {operation_name}")
+        self.response = {"Error": {"Code": code, "Message": str(self)}}
+        self.operation_name = operation_name
+
+
+class FakeSsmClient:
+    """A minimal in-memory stand-in for a boto3 SSM client."""
+
+    def __init__(self, parameters: dict = None, throttle_count: int = 0):
+        """
+        Parameters:
+            parameters: Existing parameters, as a dictionary of
+                {name: (type, value)}
+            throttle_count: The number of write requests to reject with a
+                throttling error before they start succeeding.
+        """
+        self.parameters = dict(parameters or {})
+        self.last_modified = {name: INITIAL_TIME for name in self.parameters}
+        self.throttle_count = throttle_count
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _record(self, operation_name: str, **kwargs):
+        with self._lock:
+            self.calls.append((operation_name, kwargs))
+            if operation_name in (
+                "PutParameter",
+                "DeleteParameter",
+                "DeleteParameters",
+            ):
+                if self.throttle_count > 0:
+                    self.throttle_count -= 1
+                    raise FakeClientError("ThrottlingException", operation_name)
+
+    def count_calls(self, operation_name: str) -> int:
+        return len([c for c in self.calls if c[0] == operation_name])
+
+    def put_parameter(self, Name: str, Value: str, Type: str, Overwrite=False, **kw):
+        self._record("PutParameter", Name=Name, Value=Value, Type=Type)
+        if Name in self.parameters and not Overwrite:
+            raise FakeClientError("ParameterAlreadyExists", "PutParameter")
+        self.parameters[Name] = (Type, Value)
+        self.last_modified[Name] = datetime.now(timezone.utc)
+        return {"Version": 1}
+
+    def get_parameters(self, Names: list, WithDecryption=False):
+        self._record("GetParameters", Names=Names)
+        if len(Names) > 10:
+            raise FakeClientError("ValidationException", "GetParameters")
+        return {
+            "Parameters": [
+                {
+                    "Name": name,
+                    "Type": self.parameters[name][0],
+                    "Value": self.parameters[name][1],
+                    "LastModifiedDate": self.last_modified[name],
+                }
+                for name in Names
+                if name in self.parameters
+            ],
+            "InvalidParameters": [
+                name for name in Names if name not in self.parameters
+            ],
+        }
+
+    def delete_parameter(self, Name: str):
+        self._record("DeleteParameter", Name=Name)
+        if Name not in self.parameters:
+            raise FakeClientError("ParameterNotFound", "DeleteParameter")
+        del self.parameters[Name]
+        return {}
+
+    def delete_parameters(self, Names: list):
+        self._record("DeleteParameters", Names=Names)
+        deleted = [name for name in Names if name in self.parameters]
+        for name in deleted:
+            del self.parameters[name]
+        return {
+            "DeletedParameters": deleted,
+            "InvalidParameters": [name for name in Names if name not in deleted],
+        }
+
+
+@contextmanager
+def fake_lambda_runtime(**clients):
+    """Provide the modules that are available to an inline Lambda handler.
+
+    The handlers import `cfnresponse` and `boto3` when they run, so we
+    replace those modules with fakes. `boto3` returns the supplied clients,
+    by service name. Yields the fake `cfnresponse` module, which records the
+    responses sent to CloudFormation.
+    """
+    cfnresponse = FakeCfnResponse()
+    with patch.dict(
+        "sys.modules", {"cfnresponse": cfnresponse, "boto3": FakeBoto3(**clients)}
+    ):
+        yield cfnresponse
+
+
+class FakeCfnResponse:
+    """Mimics the `cfnresponse` module that is injected into inline Lambda handlers."""
+
+    SUCCESS = "SUCCESS"
+    FAILED = "FAILED"
+
+    def __init__(self):
+        self.responses = []
+
+    def send(
+        self,
+        event,
+        context,
+        responseStatus,
+        responseData,
+        physicalResourceId=None,
+        noEcho=False,
+        reason=None,
+    ):
+        self.responses.append(
+            {
+                "Status": responseStatus,
+                "Data": responseData,
+                "PhysicalResourceId": physicalResourceId,
+                "Reason": reason,
+            }
+        )
+
+
+class FakeBoto3:
+    """Mimics the `boto3` module, returning pre-built clients by service name."""
+
+    def __init__(self, **clients):
+        self.clients = clients
+
+    def client(self, service_name: str, **kwargs):
+        return self.clients[service_name]
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        assert seconds >= 0
+        self.now += seconds
+
+
+class FakeLambdaContext:
+    """Mimics the context object that is passed to a Lambda handler."""
+
+    def __init__(
+        self,
+        remaining_millis: int = 300000,
+        function_name: str = "ssmash-handler",
+        clock: FakeClock = None,
+    ):
+        self.remaining_millis = remaining_millis
+        self.function_name = function_name
+        self.clock = clock
+        self._start = clock() if clock else 0
+
+    def get_remaining_time_in_millis(self) -> int:
+        if self.clock:
+            return int(self.remaining_millis - (self.clock() - self._start) * 1000)
+        return self.remaining_millis
+
+
+class FakeLambdaClient:
+    """A minimal in-memory stand-in for a boto3 Lambda client."""
+
+    def __init__(
+        self,
+        function_names=(),
+        conflict_count: int = 0,
+        latency=0.0,
+        polls_until_updated: int = 0,
+        throttle_count: int = 0,
+        failed_updates=(),
+    ):
+        """
+        Parameters:
+            function_names: The names of existing functions.
+            conflict_count: The number of configuration updates that will
+                race with a concurrent update, and so fail because the
+                revision has changed.
+            throttle_count: The number of configuration updates to reject
+                with a throttling error.
+            latency: The number of seconds that each update (or invocation)
+                takes.
+            polls_until_updated: The number of times an updated function's
+                configuration must be fetched before the update finishes.
+            failed_updates: The names of functions whose updates finish with
+                a "Failed" status.
+        """
+        self.functions = {
+            name: {
+                "FunctionName": name,
+                "RevisionId": "rev-0",
+                "Environment": {},
+                "LastUpdateStatus": "Successful",
+            }
+            for name in function_names
+        }
+        self.conflict_count = conflict_count
+        self.latency = latency
+        self.polls_until_updated = polls_until_updated
+        self.throttle_count = throttle_count
+        self.failed_updates = set(failed_updates)
+        self.calls = []
+        self.max_concurrent_invocations = 0
+        self._running_invocations = 0
+        self._remaining_polls = {}
+        self._lock = threading.Lock()
+
+    def count_calls(self, operation_name: str) -> int:
+        return len([c for c in self.calls if c[0] == operation_name])
+
+    def _get_function(self, name: str) -> dict:
+        if name not in self.functions:
+            raise FakeClientError("ResourceNotFoundException", "GetFunction")
+        return self.functions[name]
+
+    def get_function_configuration(self, FunctionName: str):
+        with self._lock:
+            self.calls.append(
+                ("GetFunctionConfiguration", {"FunctionName": FunctionName})
+            )
+            function = self._get_function(FunctionName)
+            if self._remaining_polls.get(FunctionName):
+                self._remaining_polls[FunctionName] -= 1
+            elif function["LastUpdateStatus"] == "InProgress":
+                if FunctionName in self.failed_updates:
+                    function["LastUpdateStatus"] = "Failed"
+                    function["LastUpdateStatusReason"] = "Insufficient capacity"
+                else:
+                    function["LastUpdateStatus"] = "Successful"
+            return copy.deepcopy(function)
+
+    def update_function_configuration(
+        self, FunctionName: str, RevisionId: str = None, **kwargs
+    ):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.calls.append(
+                (
+                    "UpdateFunctionConfiguration",
+                    dict(FunctionName=FunctionName, RevisionId=RevisionId, **kwargs),
+                )
+            )
+            function = self._get_function(FunctionName)
+
+            if self.throttle_count > 0:
+                self.throttle_count -= 1
+                raise FakeClientError(
+                    "TooManyRequestsException", "UpdateFunctionConfiguration"
+                )
+
+            if self.conflict_count > 0:
+                # Simulate somebody else updating the function first
+                self.conflict_count -= 1
+                function["RevisionId"] = _next_revision(function["RevisionId"])
+
+            if RevisionId and RevisionId != function["RevisionId"]:
+                raise FakeClientError(
+                    "PreconditionFailedException", "UpdateFunctionConfiguration"
+                )
+
+            function.update(copy.deepcopy(kwargs))
+            function["RevisionId"] = _next_revision(function["RevisionId"])
+            function["LastUpdateStatus"] = "InProgress"
+            self._remaining_polls[FunctionName] = self.polls_until_updated
+            return copy.deepcopy(function)
+
+    def invoke(self, FunctionName: str, InvocationType: str, Payload: bytes):
+        with self._lock:
+            self.calls.append(
+                (
+                    "Invoke",
+                    dict(
+                        FunctionName=FunctionName,
+                        InvocationType=InvocationType,
+                        Payload=Payload,
+                    ),
+                )
+            )
+            self._get_function(FunctionName)
+            self._running_invocations += 1
+            self.max_concurrent_invocations = max(
+                self.max_concurrent_invocations, self._running_invocations
+            )
+
+        try:
+            # Tests often patch `time.sleep`, but invocations still need to
+            # overlap
+            threading.Event().wait(self.latency)
+        finally:
+            with self._lock:
+                self._running_invocations -= 1
+        return {"StatusCode": 200}
+
+
+def _next_revision(revision_id: str) -> str:
+    prefix, number = revision_id.rsplit("-", 1)
+    return f"{prefix}-{int(number) + 1}"
+
+
+class FakeCloudFormationClient:
+    """A minimal in-memory stand-in for a boto3 CloudFormation client."""
+
+    def __init__(self, stacks: dict = None, page_size: int = 100):
+        """
+        Parameters:
+            stacks: Existing stacks, as a dictionary of
+                {stack_name: {physical_id: resource_type}}. A resource
+                that hasn't been created yet has a physical ID of None.
+            page_size: The number of resources to return in each page.
+        """
+        self.stacks = stacks or {}
+        self.page_size = page_size
+        self.calls = []
+
+    def count_calls(self, operation_name: str) -> int:
+        return len([c for c in self.calls if c[0] == operation_name])
+
+    def get_paginator(self, operation_name: str):
+        assert operation_name == "list_stack_resources"
+        return self
+
+    def paginate(self, StackName: str):
+        # Only `list_stack_resources` is paginated, so we act as our own paginator
+        next_token = None
+        while True:
+            page = self.list_stack_resources(StackName=StackName, NextToken=next_token)
+            yield page
+            next_token = page.get("NextToken")
+            if not next_token:
+                break
+
+    def list_stack_resources(self, StackName: str, NextToken: str = None):
+        self.calls.append(("ListStackResources", {"StackName": StackName}))
+        if StackName not in self.stacks:
+            raise FakeClientError("ValidationError", "ListStackResources")
+
+        resources = sorted(self.stacks[StackName].items(), key=lambda r: r[0] or "")
+        start = int(NextToken or 0)
+        end = start + self.page_size
+        summaries = []
+        for i, (physical_id, resource_type) in enumerate(resources[start:end], start):
+            summary = {
+                "LogicalResourceId": f"Resource{i}",
+                "ResourceType": resource_type,
+            }
+            if physical_id is not None:
+                summary["PhysicalResourceId"] = physical_id
+            summaries.append(summary)
+        result = {"StackResourceSummaries": summaries}
+        if end < len(resources):
+            result["NextToken"] = str(end)
+        return result
+
+
+class FakeEcsClient:
+    """A minimal in-memory stand-in for a boto3 ECS client.
+
+    A restarted service becomes stable after it has been described a fixed
+    number of times, which simulates a rolling deployment.
+    """
+
+    def __init__(
+        self,
+        service_names=(),
+        polls_until_stable: int = 1,
+        latency=0.0,
+        throttle_count: int = 0,
+    ):
+        """
+        Parameters:
+            service_names: The names of existing services.
+            polls_until_stable: The number of times a restarted service must
+                be described before it's deployment finishes.
+            latency: The number of seconds that each request takes.
+            throttle_count: The number of service updates to reject with a
+                throttling error.
+        """
+        self.services = {
+            name: {
+                "serviceName": name,
+                "serviceArn": f"arn:aws:ecs:us-east-1:123456789012:service/{name}",
+                "desiredCount": 2,
+                "runningCount": 2,
+                "deployments": [
+                    {
+                        "id": f"ecs-svc/{name}-0",
+                        "status": "PRIMARY",
+                        "createdAt": INITIAL_TIME,
+                    }
+                ],
+            }
+            for name in service_names
+        }
+        self.polls_until_stable = polls_until_stable
+        self.latency = latency
+        self.throttle_count = throttle_count
+        self.calls = []
+        self._remaining_polls = {}
+        self._lock = threading.Lock()
+
+    def count_calls(self, operation_name: str) -> int:
+        return len([c for c in self.calls if c[0] == operation_name])
+
+    def _wait(self):
+        # Tests often patch `time.sleep`, but requests still take time
+        threading.Event().wait(self.latency)
+
+    def _find_service(self, name_or_arn: str):
+        for name, service in self.services.items():
+            if name_or_arn in (name, service["serviceArn"]):
+                return name, service
+        return None, None
+
+    def update_service(self, cluster: str, service: str, forceNewDeployment=False):
+        self._wait()
+        with self._lock:
+            self.calls.append(
+                ("UpdateService", {"cluster": cluster, "service": service})
+            )
+            name, data = self._find_service(service)
+            if data is None:
+                raise FakeClientError("ServiceNotFoundException", "UpdateService")
+
+            if self.throttle_count > 0:
+                self.throttle_count -= 1
+                raise FakeClientError("ThrottlingException", "UpdateService")
+
+            deployment = {
+                "id": f"ecs-svc/{name}-{len(data['deployments'])}",
+                "status": "PRIMARY",
+                "createdAt": datetime.now(timezone.utc),
+            }
+            for old in data["deployments"]:
+                old["status"] = "ACTIVE"
+            data["deployments"].insert(0, deployment)
+            self._remaining_polls[name] = self.polls_until_stable
+            return {"service": copy.deepcopy(data)}
+
+    def tag_resource(self, resourceArn: str, tags: list):
+        with self._lock:
+            self.calls.append(("TagResource", {"resourceArn": resourceArn}))
+            name, data = self._find_service(resourceArn)
+            if data is None:
+                raise FakeClientError("ResourceNotFoundException", "TagResource")
+
+            merged = {t["key"]: t["value"] for t in data.get("tags", [])}
+            merged.update({t["key"]: t["value"] for t in tags})
+            data["tags"] = [{"key": k, "value": v} for k, v in sorted(merged.items())]
+            return {}
+
+    def describe_services(self, cluster: str, services: list, include=()):
+        self._wait()
+        with self._lock:
+            self.calls.append(
+                ("DescribeServices", {"cluster": cluster, "services": services})
+            )
+            if len(services) > 10:
+                raise FakeClientError("InvalidParameterException", "DescribeServices")
+
+            result = {"services": [], "failures": []}
+            for service in services:
+                name, data = self._find_service(service)
+                if data is None:
+                    result["failures"].append({"arn": service, "reason": "MISSING"})
+                    continue
+
+                if self._remaining_polls.get(name):
+                    self._remaining_polls[name] -= 1
+                    if not self._remaining_polls[name]:
+                        # The rolling deployment has finished
+                        del data["deployments"][1:]
+                described = copy.deepcopy(data)
+                if "TAGS" not in include:
+                    described.pop("tags", None)
+                result["services"].append(described)
+            return result
@@ -0,0 +1,157 @@
+"""Benchmark the custom resource handlers against simulated AWS services.
+
+Run this from the project root with `python -m tests.handler_benchmark`. For
+each fleet size, it reports the wall time that a handler takes, and the
+number of calls it makes to each AWS API. Polling for ECS stability uses a
+simulated clock, so the simulated time is reported separately.
+"""
+
+import argparse
+import time
+from collections import Counter
+from unittest.mock import patch
+
+from ssmash.custom_resources import replace_lambda_context_resource_handler
+from ssmash.custom_resources import restart_ecs_service_resource_handler
+from .fakes import FakeClock
+from .fakes import FakeEcsClient
+from .fakes import FakeLambdaClient
+from .fakes import FakeLambdaContext
+from .fakes import fake_lambda_runtime
+
+#: The number of targets to invalidate in each benchmark run
+DEFAULT_FLEET_SIZES = (1, 10, 50, 200)
+
+
+def benchmark_lambda(fleet_size: int, latency: float, throttle_count: int) -> dict:
+    client = FakeLambdaClient(
+        [f"function-{i}" for i in range(fleet_size)],
+        latency=latency,
+        throttle_count=throttle_count,
+    )
+    event = _create_event(
+        "InvalidateLambdaReplacer",
+        FunctionNames=sorted(client.functions),
+        IgnoredParameterNames=["/a"],
+        IgnoredParameterKeys=["1"],
+    )
+
+    with fake_lambda_runtime(**{"lambda": client}) as cfnresponse:
+        start = time.perf_counter()
+        replace_lambda_context_resource_handler(event, FakeLambdaContext())
+        wall_time = time.perf_counter() - start
+
+    return _summarise(cfnresponse, client, wall_time)
+
+
+def benchmark_ecs(
+    fleet_size: int, latency: float, throttle_count: int, polls_until_stable: int
+) -> dict:
+    client = FakeEcsClient(
+        [f"service-{i}" for i in range(fleet_size)],
+        polls_until_stable=polls_until_stable,
+        latency=latency,
+        throttle_count=throttle_count,
+    )
+    event = _create_event(
+        "InvalidateServiceRestarter",
+        ClusterArn="cluster",
+        ServiceArns=sorted(client.services),
+    )
+    clock = FakeClock()
+
+    with fake_lambda_runtime(ecs=client) as cfnresponse, patch(
+        "time.sleep", clock.sleep
+    ), patch("time.monotonic", clock):
+        start = time.perf_counter()
+        restart_ecs_service_resource_handler(
+            event, FakeLambdaContext(remaining_millis=15 * 60 * 1000, clock=clock)
+        )
+        wall_time = time.perf_counter() - start
+
+    result = _summarise(cfnresponse, client, wall_time)
+    result["simulated_time"] = clock.now
+    return result
+
+
+def _create_event(logical_name: str, **properties) -> dict:
+    return {
+        "RequestType": "Update",
+        "RequestId": "benchmark",
+        "StackId": "arn:aws:cloudformation:us-east-1:123456789012:stack/bench/guid",
+        "LogicalResourceId": logical_name,
+        "PhysicalResourceId": "old",
+        "ResourceProperties": dict(ServiceToken="arn", **properties),
+    }
+
+
+def _summarise(cfnresponse, client, wall_time: float) -> dict:
+    (response,) = cfnresponse.responses
+    return {
+        "status": response["Status"],
+        "wall_time": wall_time,
+        "calls": Counter(c[0] for c in client.calls),
+    }
+
+
+def _print_result(handler: str, fleet_size: int, result: dict):
+    calls = ", ".join(
+        f"{name}={count}" for name, count in sorted(result["calls"].items())
+    )
+    simulated = result.get("simulated_time")
+    print(
+        f"{handler:<8} {fleet_size:>6} {result['status']:<8} "
+        f"{result['wall_time']:>9.3f}s "
+        + (f"{simulated:>9.0f}s " if simulated is not None else " " * 11)
+        + calls
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--fleet-size",
+        type=int,
+        action="append",
+        help="The number of targets to invalidate. May be repeated.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.01,
+        help="The number of seconds that each simulated API call takes.",
+    )
+    parser.add_argument(
+        "--throttle-count",
+        type=int,
+        default=5,
+        help="The number of Lambda or ECS updates to reject with a throttling error.",
+    )
+    parser.add_argument(
+        "--polls-until-stable",
+        type=int,
+        default=5,
+        help="The number of times each ECS service is described before it is stable.",
+    )
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'handler':<8} {'fleet':>6} {'status':<8} {'wall':>10} {'simulated':>10} calls"
+    )
+    for fleet_size in args.fleet_size or DEFAULT_FLEET_SIZES:
+        _print_result(
+            "lambda",
+            fleet_size,
+            benchmark_lambda(fleet_size, args.latency, args.throttle_count),
+        )
+        _print_result(
+            "ecs",
+            fleet_size,
+            benchmark_ecs(
+                fleet_size, args.latency, args.throttle_count, args.polls_until_stable
+            ),
+        )
+
+
+if __name__ == "__main__":
+    main()
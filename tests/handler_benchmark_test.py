@@ -0,0 +1,23 @@
+from .handler_benchmark import benchmark_ecs
+from .handler_benchmark import benchmark_lambda
+
+
+def test_lambda_benchmark_should_count_calls():
+    # Exercise
+    result = benchmark_lambda(fleet_size=3, latency=0, throttle_count=1)
+
+    # Verify
+    assert result["status"] == "SUCCESS"
+    assert result["calls"]["UpdateFunctionConfiguration"] == 4
+
+
+def test_ecs_benchmark_should_use_simulated_time():
+    # Exercise
+    result = benchmark_ecs(
+        fleet_size=12, latency=0, throttle_count=1, polls_until_stable=2
+    )
+
+    # Verify
+    assert result["status"] == "SUCCESS"
+    assert result["calls"]["UpdateService"] == 13
+    assert result["simulated_time"] > result["wall_time"]
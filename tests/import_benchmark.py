@@ -0,0 +1,96 @@
+"""Benchmark how long it takes to start the ssmash CLI.
+
+Run this from the project root with `python -m tests.import_benchmark`. It
+imports the CLI in a fresh interpreter several times using
+`python -X importtime`, and reports the median import time along with the
+slowest modules. Use `--max-ms` to fail when the import time regresses.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+#: The module that is imported when the CLI starts
+CLI_MODULE = "ssmash.cli"
+
+#: Top-level packages that shouldn't be imported until a command needs them
+DEFERRED_PACKAGES = ("boto3", "botocore", "flyingcircus", "inflection", "yaml")
+
+
+def measure_import(module: str = CLI_MODULE) -> Dict[str, Tuple[int, int]]:
+    """Import a module in a fresh interpreter.
+
+    Returns:
+        A dictionary of {module_name: (self_microseconds, cumulative_microseconds)}
+        for every module that was imported.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return parse_importtime(process.stderr)
+
+
+def parse_importtime(output: str) -> Dict[str, Tuple[int, int]]:
+    """Parse the timings reported by `python -X importtime`."""
+    result = dict()
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = [f.strip() for f in line[len("import time:") :].split("|")]
+        if not fields[0].isdigit():
+            # This is the header line
+            continue
+        result[fields[2]] = (int(fields[0]), int(fields[1]))
+    return result
+
+
+def get_deferred_imports(timings: Dict[str, Tuple[int, int]]) -> List[str]:
+    """Get the modules that were imported, but should have been deferred."""
+    return sorted(name for name in timings if name.split(".")[0] in DEFERRED_PACKAGES)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="The number of times to import the CLI."
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="The number of slowest modules to report."
+    )
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=None,
+        help="Exit with a non-zero status if the median import time is slower.",
+    )
+    args = parser.parse_args(argv)
+
+    runs = [measure_import() for _ in range(args.repeat)]
+    median_ms = statistics.median(run[CLI_MODULE][1] for run in runs) / 1000
+
+    print(f"{CLI_MODULE}: {median_ms:.1f}ms (median of {args.repeat})")
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)
+    for name, (self_us, cumulative_us) in slowest[: args.top]:
+        print(f"  {self_us / 1000:>7.1f}ms {cumulative_us / 1000:>7.1f}ms  {name}")
+
+    failed = False
+    deferred = get_deferred_imports(runs[-1])
+    if deferred:
+        print("Imported modules that should be deferred: " + ", ".join(deferred))
+        failed = True
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"Import time is slower than {args.max_ms:.1f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import sys
+
+import pytest
+
+from .import_benchmark import CLI_MODULE
+from .import_benchmark import get_deferred_imports
+from .import_benchmark import measure_import
+from .import_benchmark import parse_importtime
+
+
+def test_should_parse_importtime_output():
+    # Setup
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       144 |        144 |     click.decorators\n"
+        "import time:      4041 |      21896 | ssmash.cli\n"
+    )
+
+    # Exercise
+    timings = parse_importtime(output)
+
+    # Verify
+    assert timings == {"click.decorators": (144, 144), "ssmash.cli": (4041, 21896)}
+
+
+@pytest.mark.skipif(
+    sys.version_info < (3, 7), reason="python -X importtime needs Python 3.7"
+)
+def test_cli_should_not_import_heavy_modules():
+    # Exercise
+    timings = measure_import()
+
+    # Verify
+    assert CLI_MODULE in timings
+    assert get_deferred_imports(timings) == []
@@ -0,0 +1,162 @@
+import ast
+import inspect
+import textwrap
+
+import pytest
+from flyingcircus.core import Stack
+
+from ssmash.converter import convert_hierarchy_to_ssm
+from ssmash.custom_resources import emit_embedded_metrics
+from ssmash.custom_resources import replace_lambda_context_resource_handler
+from ssmash.custom_resources import restart_ecs_service_resource_handler
+from ssmash.custom_resources import signal_ecs_deployment_handler
+from ssmash.custom_resources import write_ssm_parameters_resource_handler
+from ssmash.inline import create_inline_function
+from ssmash.inline import minify_source
+from ssmash.invalidation import create_ecs_service_invalidation_stack
+
+#: CloudFormation's limit for a template that is passed in the request body
+MAX_TEMPLATE_BODY_SIZE = 51200
+
+
+def _without_docstrings(tree: ast.AST) -> str:
+    for node in ast.walk(tree):
+        body = getattr(node, "body", None)
+        if (
+            isinstance(body, list)
+            and body
+            and isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Str)
+        ):
+            node.body = body[1:] or [ast.Pass()]
+    return ast.dump(tree)
+
+
+def _assert_equivalent(source: str, minified: str):
+    assert _without_docstrings(ast.parse(minified)) == _without_docstrings(
+        ast.parse(source)
+    )
+
+
+class TestMinifySource:
+    @pytest.mark.parametrize(
+        "handler",
+        [
+            emit_embedded_metrics,
+            replace_lambda_context_resource_handler,
+            restart_ecs_service_resource_handler,
+            signal_ecs_deployment_handler,
+            write_ssm_parameters_resource_handler,
+        ],
+    )
+    def test_should_not_change_handler_code(self, handler):
+        # Setup
+        source = inspect.getsource(handler)
+
+        # Exercise
+        minified = minify_source(source)
+
+        # Verify
+        _assert_equivalent(source, minified)
+        assert len(minified) < len(source) * 2 / 3
+
+    def test_should_remove_comments_and_blank_lines(self):
+        # Setup
+        source = textwrap.dedent(
+            """\
+            def f(x):
+                # Explain something
+
+                return x  # Explain something else
+            """
+        )
+
+        # Exercise
+        minified = minify_source(source)
+
+        # Verify
+        assert minified == "def f(x):\n return x\n"
+
+    def test_should_join_lines_inside_brackets(self):
+        # Setup
+        source = textwrap.dedent(
+            """\
+            def f(x):
+                return dict(
+                    a=x,  # Comment
+                    b=[
+                        1,
+                        2,
+                    ],
+                )
+            """
+        )
+
+        # Exercise
+        minified = minify_source(source)
+
+        # Verify
+        assert minified == "def f(x):\n return dict(a=x, b=[1, 2,],)\n"
+        _assert_equivalent(source, minified)
+
+    def test_should_keep_content_of_multiline_strings(self):
+        # Setup
+        source = textwrap.dedent(
+            '''\
+            def f():
+                """Docstring"""
+                x = """  first
+                    # Not a comment
+
+                last"""
+                return x
+            '''
+        )
+
+        # Exercise
+        minified = minify_source(source)
+
+        # Verify
+        assert '"""  first\n        # Not a comment\n\n    last"""' in minified
+        assert "Docstring" not in minified
+        _assert_equivalent(source, minified)
+
+
+class TestCreateInlineFunction:
+    def test_should_include_helpers_before_handler(self):
+        # Exercise
+        function = create_inline_function(
+            restart_ecs_service_resource_handler,
+            "arn:role",
+            helpers=[emit_embedded_metrics],
+        )
+
+        # Verify
+        code = function.Properties.Code["ZipFile"]
+        assert code.index("def emit_embedded_metrics(") < code.index(
+            "def restart_ecs_service_resource_handler("
+        )
+        assert (
+            function.Properties.Handler == "index.restart_ecs_service_resource_handler"
+        )
+        compile(code, "index.py", "exec")
+
+    def test_several_invalidations_should_fit_in_a_template(self):
+        # Setup
+        parameters = convert_hierarchy_to_ssm({"a": 1})
+        stack = Stack()
+        stack.merge_stack(parameters)
+
+        # Exercise
+        for name in ["a", "b", "c", "d"]:
+            stack.merge_stack(
+                create_ecs_service_invalidation_stack(
+                    cluster="arn:cluster",
+                    service="arn:service:" + name,
+                    dependencies=list(parameters.Resources.values()),
+                    restart_role="arn:role",
+                ).with_prefixed_names("Invalidate" + name.upper())
+            )
+
+        # Verify
+        assert len(stack.export("yaml")) < MAX_TEMPLATE_BODY_SIZE * 3 / 4
@@ -1,14 +1,24 @@
+import json
 import re
 
+import yaml
+
 from flyingcircus.core import AWSObject
+from flyingcircus.core import Stack
 from flyingcircus.intrinsic_function import GetAtt
 from flyingcircus.intrinsic_function import Ref
+from flyingcircus.service.cloudformation import WaitCondition
+from flyingcircus.service.cloudformation import WaitConditionHandle
+from flyingcircus.service.events import Rule
 from flyingcircus.service.lambda_ import Function
 from flyingcircus.service.ssm import SSMParameter
 from flyingcircus.service.ssm import SSMParameterProperties
 
 from ssmash.invalidation import create_ecs_service_invalidation_stack
 from ssmash.invalidation import create_lambda_invalidation_stack
+from ssmash.invalidation import deduplicate_invalidation_functions
+from ssmash.invalidation import limit_concurrent_invalidations
+from ssmash.yamlhelper import CfnTemplateYamlLoader
 
 
 class TestEcsServiceInvalidation:
@@ -61,6 +71,223 @@ class TestEcsServiceInvalidation:
         assert Ref(ssm_parameter) in dependent_values
         assert GetAtt(ssm_parameter, "Value") in dependent_values
 
+    def test_creates_single_resource_for_multiple_lambdas(self):
+        # Setup
+        functions = ["function-a", "function-b", "function-c"]
+
+        # Exercise
+        stack = create_lambda_invalidation_stack(
+            function=functions, dependencies=[], role="role-arn"
+        )
+
+        # Verify
+        custom_resources = [
+            r for r in stack.Resources.values() if r["Type"].startswith("Custom::")
+        ]
+        assert len(custom_resources) == 1
+
+        properties = custom_resources[0]["Properties"]
+        assert properties["FunctionNames"] == functions
+        assert "FunctionName" not in properties
+
+    def test_creates_resource_for_lambdas_in_stacks(self):
+        # Exercise
+        stack = create_lambda_invalidation_stack(
+            function=[], dependencies=[], role="role-arn", stacks=["stack-name"]
+        )
+
+        # Verify
+        (updater,) = [
+            r for r in stack.Resources.values() if r["Type"].startswith("Custom::")
+        ]
+        assert updater["Properties"]["StackNames"] == ["stack-name"]
+        assert "FunctionName" not in updater["Properties"]
+        assert "FunctionNames" not in updater["Properties"]
+
+
+class TestDeduplicateInvalidationFunctions:
+    def _create_stack(self, roles, asynchronous=False) -> Stack:
+        stack = Stack()
+        for i, role in enumerate(roles):
+            stack.merge_stack(
+                create_ecs_service_invalidation_stack(
+                    cluster="cluster-name",
+                    service=f"service-{i}",
+                    dependencies=[],
+                    restart_role=role,
+                    asynchronous=asynchronous,
+                ).with_prefixed_names(f"Invalidate{i}")
+            )
+        stack.merge_stack(
+            create_lambda_invalidation_stack(
+                function="function-name", dependencies=[], role=roles[0]
+            ).with_prefixed_names("InvalidateFunction")
+        )
+        return stack
+
+    def _get_functions(self, stack: Stack) -> dict:
+        return {
+            name: r for name, r in stack.Resources.items() if isinstance(r, Function)
+        }
+
+    def _get_service_token_name(self, stack: Stack, logical_name: str) -> str:
+        """Get the logical name of the Function used by a custom resource."""
+        token = stack.Resources[logical_name]["Properties"]["ServiceToken"]
+        (name,) = [
+            name
+            for name, function in self._get_functions(stack).items()
+            if GetAtt(function, "Arn") == token
+        ]
+        return name
+
+    def test_should_share_function_between_identical_invalidations(self):
+        # Setup
+        stack = self._create_stack(["role-arn"] * 3)
+
+        # Exercise
+        deduplicate_invalidation_functions(stack)
+
+        # Verify
+        functions = self._get_functions(stack)
+        assert len(functions) == 2
+        assert all(name.startswith("InvalidationLambda") for name in functions)
+
+        restart_lambda = self._get_service_token_name(stack, "Invalidate0Restarter")
+        for i in range(3):
+            assert (
+                self._get_service_token_name(stack, f"Invalidate{i}Restarter")
+                == restart_lambda
+            )
+        assert (
+            self._get_service_token_name(stack, "InvalidateFunctionReplacer")
+            != restart_lambda
+        )
+
+    def test_should_not_share_functions_with_different_roles(self):
+        # Setup
+        stack = self._create_stack(["role-a", "role-b", "role-a"])
+
+        # Exercise
+        deduplicate_invalidation_functions(stack)
+
+        # Verify
+        assert len(self._get_functions(stack)) == 3
+        assert self._get_service_token_name(
+            stack, "Invalidate2Restarter"
+        ) == self._get_service_token_name(stack, "Invalidate0Restarter")
+        assert self._get_service_token_name(
+            stack, "Invalidate1Restarter"
+        ) != self._get_service_token_name(stack, "Invalidate0Restarter")
+
+    def test_shared_function_name_should_not_depend_on_other_invalidations(self):
+        # Setup
+        stack = self._create_stack(["role-a", "role-b"])
+        smaller_stack = self._create_stack(["role-b"])
+
+        # Exercise
+        deduplicate_invalidation_functions(stack)
+        deduplicate_invalidation_functions(smaller_stack)
+
+        # Verify
+        assert self._get_service_token_name(
+            stack, "Invalidate1Restarter"
+        ) == self._get_service_token_name(smaller_stack, "Invalidate0Restarter")
+
+    def test_exported_template_should_only_reference_remaining_functions(self):
+        # Setup
+        stack = self._create_stack(["role-arn"] * 3)
+
+        # Exercise
+        deduplicate_invalidation_functions(stack)
+
+        # Verify
+        template = stack.export("yaml")
+        assert template.count("Type: AWS::Lambda::Function") == 2
+        assert "RestartLambda" not in template
+
+    def test_should_not_share_functions_that_are_referenced_elsewhere(self):
+        # Setup
+        stack = self._create_stack(["role-arn"] * 2, asynchronous=True)
+
+        # Exercise
+        deduplicate_invalidation_functions(stack)
+
+        # Verify
+        functions = self._get_functions(stack)
+        assert len(functions) == 4
+        for i in range(2):
+            rule = stack.Resources[f"Invalidate{i}DeploymentRule"]
+            assert rule.Properties.Targets[0]["Arn"] == GetAtt(
+                functions[f"Invalidate{i}SignalLambda"], "Arn"
+            )
+
+        template = stack.export("yaml")
+        assert template.count("Type: AWS::Lambda::Function") == 4
+
+
+class TestLimitConcurrentInvalidations:
+    def _create_invalidations(self, count: int, asynchronous=False) -> list:
+        return [
+            create_ecs_service_invalidation_stack(
+                cluster="cluster-name",
+                service=f"service-{i}",
+                dependencies=[],
+                restart_role="role-arn",
+                asynchronous=asynchronous,
+            ).with_prefixed_names(f"Invalidate{i}")
+            for i in range(count)
+        ]
+
+    def _get_dependencies(self, invalidations: list) -> dict:
+        stack = Stack()
+        for invalidation in invalidations:
+            stack.merge_stack(invalidation)
+        template = yaml.load(stack.export("yaml"), Loader=CfnTemplateYamlLoader)
+        return {
+            name: resource.get("DependsOn", [])
+            for name, resource in template["Resources"].items()
+            if resource["Type"] == "Custom::RestartEcsService"
+        }
+
+    def test_should_chain_invalidations(self):
+        # Setup
+        invalidations = self._create_invalidations(5)
+
+        # Exercise
+        limit_concurrent_invalidations(invalidations, 2)
+
+        # Verify
+        assert self._get_dependencies(invalidations) == {
+            "Invalidate0Restarter": [],
+            "Invalidate1Restarter": [],
+            "Invalidate2Restarter": ["Invalidate0Restarter"],
+            "Invalidate3Restarter": ["Invalidate1Restarter"],
+            "Invalidate4Restarter": ["Invalidate2Restarter"],
+        }
+
+    def test_should_wait_for_asynchronous_restart_to_finish(self):
+        # Setup
+        invalidations = self._create_invalidations(2, asynchronous=True)
+
+        # Exercise
+        limit_concurrent_invalidations(invalidations, 1)
+
+        # Verify
+        dependencies = self._get_dependencies(invalidations)
+        assert dependencies["Invalidate1Restarter"][-1].startswith(
+            "Invalidate0RestartWaitCondition"
+        )
+
+    def test_should_not_change_invalidations_within_limit(self):
+        # Setup
+        invalidations = self._create_invalidations(3)
+
+        # Exercise
+        limit_concurrent_invalidations(invalidations, 3)
+
+        # Verify
+        assert not any(self._get_dependencies(invalidations).values())
+
 
 def _get_flattened_attributes(value) -> set:
     """Get all attributes on this resource, flattening the hierarchy"""
@@ -80,6 +307,93 @@ def _get_flattened_attributes(value) -> set:
 
     return result
 
+    def test_creates_single_resource_for_multiple_services(self):
+        # Exercise
+        stack = create_ecs_service_invalidation_stack(
+            cluster="cluster-name",
+            service=["service-a", "service-b"],
+            dependencies=[],
+            restart_role="role-arn",
+        )
+
+        # Verify
+        (restarter,) = [
+            r for r in stack.Resources.values() if r["Type"].startswith("Custom::")
+        ]
+        assert restarter["Properties"]["ServiceArns"] == ["service-a", "service-b"]
+        assert "ServiceArn" not in restarter["Properties"]
+
+    def test_creates_wait_condition_for_asynchronous_restart(self):
+        # Setup
+        ssm_parameter = SSMParameter(
+            Properties=SSMParameterProperties(
+                Name="test-parameter-name", Type="String", Value="test-param-value"
+            )
+        )
+
+        # Exercise
+        stack = create_ecs_service_invalidation_stack(
+            cluster="cluster-name",
+            service=["service-a", "service-b"],
+            dependencies=[ssm_parameter],
+            restart_role="role-arn",
+            timeout=1800,
+            asynchronous=True,
+        )
+
+        # Verify
+        restarter = stack.Resources["Restarter"]
+        assert restarter["Properties"]["WaitForStability"] == "false"
+
+        (wait_condition,) = [
+            r for r in stack.Resources.values() if isinstance(r, WaitCondition)
+        ]
+        (handle,) = [
+            r for r in stack.Resources.values() if isinstance(r, WaitConditionHandle)
+        ]
+        assert wait_condition.Properties.Handle == Ref(handle)
+        assert wait_condition.Properties.Count == 2
+        assert wait_condition.Properties.Timeout == "1800"
+
+        rules = [r for r in stack.Resources.values() if isinstance(r, Rule)]
+        assert len(rules) == 1
+        assert rules[0].Properties.EventPattern["detail-type"] == [
+            "ECS Deployment State Change"
+        ]
+
+        template = stack.export("yaml")
+        assert "- Restarter" in template, "WaitCondition should follow the restart"
+
+    def test_wait_condition_should_be_replaced_when_parameters_change(self):
+        # Setup
+        def create_stack(value):
+            ssm_parameter = SSMParameter(
+                Properties=SSMParameterProperties(
+                    Name="test-parameter-name", Type="String", Value=value
+                )
+            )
+            return create_ecs_service_invalidation_stack(
+                cluster="cluster-name",
+                service="service-name",
+                dependencies=[ssm_parameter],
+                restart_role="role-arn",
+                asynchronous=True,
+            )
+
+        # Exercise
+        names = [
+            {
+                name
+                for name, r in create_stack(value).Resources.items()
+                if isinstance(r, WaitCondition)
+            }
+            for value in ("first", "second", "first")
+        ]
+
+        # Verify
+        assert names[0] != names[1]
+        assert names[0] == names[2]
+
 
 class TestLambdaInvalidation:
     def test_creates_stack_for_single_lambda(self):
@@ -128,3 +442,27 @@ class TestLambdaInvalidation:
         dependent_values = _get_flattened_attributes(updater)
         assert Ref(ssm_parameter) in dependent_values
         assert GetAtt(ssm_parameter, "Value") in dependent_values
+
+    def test_creates_resource_that_prewarms_lambda(self):
+        # Exercise
+        stack = create_lambda_invalidation_stack(
+            function="some-function-name",
+            dependencies=[],
+            role="role-arn",
+            prewarm_concurrency=10,
+        )
+
+        # Verify
+        updater = stack.Resources["Replacer"]
+        assert updater["Properties"]["PrewarmConcurrency"] == "10"
+        assert json.loads(updater["Properties"]["PrewarmPayload"])
+        assert stack.Resources["ReplacementLambda"].Properties.Timeout == 5 * 60
+
+    def test_does_not_prewarm_lambda_by_default(self):
+        # Exercise
+        stack = create_lambda_invalidation_stack(
+            function="some-function-name", dependencies=[], role="role-arn"
+        )
+
+        # Verify
+        assert "PrewarmConcurrency" not in stack.Resources["Replacer"]["Properties"]
@@ -0,0 +1,94 @@
+from unittest.mock import patch
+
+from flyingcircus.core import Stack
+
+from ssmash.config import InvalidatingConfigKey
+from ssmash.converter import convert_hierarchy_to_ssm
+from ssmash.pipeline import PipelineContext
+from ssmash.pipeline import get_invalidated_resources
+
+
+def _create_appconfig():
+    return {
+        "acme": {
+            InvalidatingConfigKey.construct("shipping", ["servicea"]): {
+                "greeting": "hello",
+                "limit": 1000,
+            },
+            "warehouse": "birdseed",
+        },
+        ".ssmash-config": {"max-concurrent-restarts": 1},
+    }
+
+
+class TestPipelineContext:
+    def test_should_remove_ssmash_config(self):
+        # Setup
+        context = PipelineContext(_create_appconfig(), Stack())
+
+        # Exercise & Verify
+        assert list(context.clean_config) == ["acme"]
+        assert context.ssmash_config == {"max-concurrent-restarts": 1}
+        assert ".ssmash-config" in context.appconfig
+
+    def test_should_use_empty_ssmash_config_by_default(self):
+        # Exercise & Verify
+        assert PipelineContext({"a": 1}, Stack()).ssmash_config == {}
+
+    def test_should_create_prefixed_parameters(self):
+        # Setup
+        context = PipelineContext(_create_appconfig(), Stack())
+
+        # Exercise
+        parameters = context.parameters
+
+        # Verify
+        assert sorted(p.Properties.Name for p in parameters) == [
+            "/acme/shipping/greeting",
+            "/acme/shipping/limit",
+            "/acme/warehouse",
+        ]
+        assert all(
+            name.startswith("SSMParam") for name in context.parameter_stack.Resources
+        )
+
+    def test_should_convert_configuration_once(self):
+        # Setup
+        context = PipelineContext(_create_appconfig(), Stack())
+
+        # Exercise
+        with patch(
+            "ssmash.pipeline.convert_hierarchy_to_ssm", wraps=convert_hierarchy_to_ssm
+        ) as convert_mock:
+            first = context.invalidated_resources
+            second = context.invalidated_resources
+            context.parameters
+            context.parameter_stack
+
+        # Verify
+        assert convert_mock.call_count == 1
+        assert first is second
+
+    def test_should_find_invalidated_resources_without_explicit_conversion(self):
+        # Setup
+        context = PipelineContext(_create_appconfig(), Stack())
+
+        # Exercise
+        invalidated = context.invalidated_resources
+
+        # Verify
+        assert list(invalidated) == ["servicea"]
+        assert sorted(r.Properties.Name for r in invalidated["servicea"]) == [
+            "/acme/shipping/greeting",
+            "/acme/shipping/limit",
+        ]
+
+
+class TestGetInvalidatedResources:
+    def test_should_be_empty_for_plain_configuration(self):
+        # Setup
+        appconfig = {"a": {"b": 1}}
+        convert_hierarchy_to_ssm(appconfig)
+
+        # Exercise & Verify
+        assert get_invalidated_resources(appconfig) == {}
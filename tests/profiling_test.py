@@ -0,0 +1,58 @@
+import io
+
+from ssmash.profiling import PipelineProfiler
+from ssmash.profiling import count_leaves
+
+
+class TestPipelineProfiler:
+    def test_should_record_each_stage(self):
+        # Setup
+        profiler = PipelineProfiler()
+
+        # Exercise
+        with profiler.stage("first"):
+            pass
+        with profiler.stage("second", template="a.yaml"):
+            data = bytearray(10 ** 6)
+        report = profiler.finish()
+
+        # Verify
+        assert [s["name"] for s in report["stages"]] == ["first", "second"]
+        assert report["stages"][1]["template"] == "a.yaml"
+        assert report["stages"][1]["peak_memory"] >= len(data)
+        assert report["stages"][0]["peak_memory"] < report["stages"][1]["peak_memory"]
+        # Allow for each stage's wall time being rounded
+        stages_time = sum(s["wall_time"] for s in report["stages"])
+        assert report["wall_time"] >= stages_time - 1e-5
+
+    def test_should_record_stage_that_fails(self):
+        # Setup
+        profiler = PipelineProfiler()
+
+        # Exercise
+        try:
+            with profiler.stage("broken"):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        # Verify
+        assert [s["name"] for s in profiler.finish()["stages"]] == ["broken"]
+
+    def test_should_count_output_bytes(self):
+        # Setup
+        profiler = PipelineProfiler()
+        output = io.StringIO()
+
+        # Exercise
+        counting_output = profiler.count_output(output)
+        counting_output.write("abc")
+        counting_output.write("é")
+
+        # Verify
+        assert output.getvalue() == "abcé"
+        assert profiler.finish()["counts"]["template_bytes"] == 5
+
+
+def test_should_count_leaves():
+    assert count_leaves({"a": 1, "b": {"c": [1, 2], "d": {"e": None}}, "f": {}}) == 3
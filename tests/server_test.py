@@ -0,0 +1,200 @@
+import os
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+
+import pytest
+
+from ssmash import client
+from ssmash.server import create_server
+from ssmash.server import serve
+
+SIMPLE_INPUT = "acme:\n  greeting: hello\n"
+
+
+@contextmanager
+def running_server(tmp_path):
+    socket_path = str(tmp_path / "ssmash.sock")
+    server = create_server(socket_path)
+    thread = threading.Thread(target=serve, args=(server,))
+    thread.start()
+    try:
+        yield socket_path
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+class TestServer:
+    def test_should_convert_configuration(self, tmp_path):
+        with running_server(tmp_path) as socket_path:
+            # Exercise
+            result = client.convert(socket_path, SIMPLE_INPUT, [])
+
+        # Verify
+        assert result.exit_code == 0
+        assert not result.error
+        assert "Name: /acme/greeting" in result.output
+
+    def test_should_apply_chained_commands(self, tmp_path):
+        with running_server(tmp_path) as socket_path:
+            # Exercise
+            result = client.convert(
+                socket_path,
+                SIMPLE_INPUT,
+                [
+                    "invalidate-lambda",
+                    "--function-name",
+                    "function-name",
+                    "--role-name",
+                    "arn:role",
+                ],
+            )
+
+        # Verify
+        assert result.exit_code == 0
+        assert "Custom::ReplaceLambdaContext" in result.output
+
+    def test_should_report_errors(self, tmp_path):
+        with running_server(tmp_path) as socket_path:
+            # Exercise
+            result = client.convert(socket_path, SIMPLE_INPUT, ["invalidate-lambda"])
+
+        # Verify
+        assert result.exit_code != 0
+        assert result.error
+
+    def test_should_serve_concurrent_clients(self, tmp_path):
+        with running_server(tmp_path) as socket_path:
+            # Exercise
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(
+                    executor.map(
+                        lambda i: client.convert(
+                            socket_path, f"acme:\n  value{i}: {i}\n", []
+                        ),
+                        range(16),
+                    )
+                )
+
+        # Verify
+        for i, result in enumerate(results):
+            assert result.exit_code == 0
+            assert f"Name: /acme/value{i}" in result.output
+
+    def test_should_reject_bad_request(self, tmp_path):
+        with running_server(tmp_path) as socket_path:
+            # Exercise
+            result = client.convert(socket_path, SIMPLE_INPUT, "not-a-list")
+
+        # Verify
+        assert result.exit_code == 2
+        assert "Bad request" in result.error
+
+    @pytest.mark.parametrize(
+        ("args", "message"),
+        [
+            (["watch"], "The watch command can't be used"),
+            (["batch", "manifest.yaml"], "The batch command can't be used"),
+            (["serve"], "The serve command can't be used"),
+            (["--profile"], "The --profile option can't be used"),
+            (
+                ["--profile-stats", "out.prof"],
+                "The --profile-stats option can't be used",
+            ),
+            (["--profile-stats=out.prof"], "The --profile-stats option can't be used"),
+        ],
+    )
+    def test_should_reject_unsupported_commands(self, tmp_path, args, message):
+        with running_server(tmp_path) as socket_path:
+            # Exercise
+            result = client.convert(socket_path, SIMPLE_INPUT, args)
+
+        # Verify
+        assert result.exit_code == 2
+        assert message in result.error
+
+    def test_should_only_allow_current_user_to_connect(self, tmp_path):
+        with running_server(tmp_path) as socket_path:
+            # Exercise
+            mode = os.stat(socket_path).st_mode
+
+        # Verify
+        assert stat.S_IMODE(mode) == 0o600
+
+    def test_should_remove_socket_when_stopped(self, tmp_path):
+        # Exercise
+        with running_server(tmp_path) as socket_path:
+            assert os.path.exists(socket_path)
+
+        # Verify
+        assert not os.path.exists(socket_path)
+
+    def test_should_refuse_to_replace_running_server(self, tmp_path):
+        with running_server(tmp_path) as socket_path:
+            # Exercise & Verify
+            with pytest.raises(ValueError):
+                create_server(socket_path)
+
+
+class TestClientMain:
+    def test_should_write_output_file(self, tmp_path):
+        # Setup
+        input_path = tmp_path / "config.yaml"
+        input_path.write_text(SIMPLE_INPUT)
+        output_path = tmp_path / "template.yaml"
+
+        with running_server(tmp_path) as socket_path:
+            # Exercise
+            exit_code = client.main(
+                [
+                    "--socket",
+                    socket_path,
+                    "-i",
+                    str(input_path),
+                    "-o",
+                    str(output_path),
+                    "--description",
+                    "Served",
+                ]
+            )
+
+        # Verify
+        assert exit_code == 0
+        template = output_path.read_text()
+        assert "Description: Served" in template
+        assert "Name: /acme/greeting" in template
+
+    def test_should_report_missing_server(self, tmp_path, capsys):
+        # Setup
+        input_path = tmp_path / "config.yaml"
+        input_path.write_text(SIMPLE_INPUT)
+
+        # Exercise
+        exit_code = client.main(
+            ["--socket", str(tmp_path / "missing.sock"), "-i", str(input_path)]
+        )
+
+        # Verify
+        assert exit_code == 1
+        assert "Can't use the ssmash server" in capsys.readouterr().err
+
+
+class TestMessages:
+    def test_should_round_trip_message(self):
+        # Setup
+        stream = BytesIO()
+
+        # Exercise
+        client.write_message(stream, {"args": ["a"], "input": "x: 1\n"})
+        stream.seek(0)
+
+        # Verify
+        assert client.read_message(stream) == {"args": ["a"], "input": "x: 1\n"}
+
+    @pytest.mark.parametrize("data", [b"", b"[1, 2]\n", b"not json\n"])
+    def test_should_reject_malformed_message(self, data):
+        with pytest.raises(ValueError):
+            client.read_message(BytesIO(data))
@@ -0,0 +1,93 @@
+import pytest
+
+from ssmash.config import InvalidatingConfigKey
+from ssmash.splitter import get_subtree_filename
+from ssmash.splitter import split_appconfig
+
+
+class TestSplitAppconfig:
+    """Tests for split_appconfig."""
+
+    def test_should_split_at_top_level(self):
+        # Setup
+        appconfig = {"a": {"x": 1, "y": {"z": 2}}, "b": {"x": 3}}
+
+        # Exercise
+        result = split_appconfig(appconfig, 1)
+
+        # Verify
+        assert result == {
+            ("a",): {"a": {"x": 1, "y": {"z": 2}}},
+            ("b",): {"b": {"x": 3}},
+        }
+
+    def test_should_retain_hierarchy_above_split_depth(self):
+        # Setup
+        appconfig = {"a": {"x": {"p": 1}, "y": {"q": 2}}}
+
+        # Exercise
+        result = split_appconfig(appconfig, 2)
+
+        # Verify
+        assert result == {
+            ("a", "x"): {"a": {"x": {"p": 1}}},
+            ("a", "y"): {"a": {"y": {"q": 2}}},
+        }
+
+    def test_should_gather_shallow_leaf_values_into_root_subtree(self):
+        # Setup
+        appconfig = {"top": "aaa", "a": {"middle": "bbb", "x": {"p": 1}}}
+
+        # Exercise
+        result = split_appconfig(appconfig, 2)
+
+        # Verify
+        assert result == {
+            (): {"top": "aaa", "a": {"middle": "bbb"}},
+            ("a", "x"): {"a": {"x": {"p": 1}}},
+        }
+
+    def test_should_copy_invalidating_keys_that_are_shared_between_subtrees(self):
+        # Setup
+        shared_key = InvalidatingConfigKey.construct("a", invalidates=["servicea"])
+        appconfig = {shared_key: {"x": {"p": 1}, "y": {"q": 2}}}
+
+        # Exercise
+        result = split_appconfig(appconfig, 2)
+
+        # Verify
+        keys = [next(iter(subtree.keys())) for subtree in result.values()]
+        assert len(keys) == 2
+        assert keys[0] is not keys[1]
+        for key in keys:
+            assert key == "a"
+            assert key is not shared_key
+            assert isinstance(key, InvalidatingConfigKey)
+            assert key.invalidated_applications == {"servicea"}
+
+    def test_should_reject_invalid_depth(self):
+        with pytest.raises(ValueError):
+            split_appconfig({"a": {"b": 1}}, 0)
+
+
+class TestGetSubtreeFilename:
+    """Tests for get_subtree_filename."""
+
+    def test_should_join_path_components(self):
+        assert get_subtree_filename(("a", "b"), set()) == "a-b.yaml"
+
+    def test_should_name_root_subtree(self):
+        assert get_subtree_filename((), set()) == "root.yaml"
+
+    def test_should_dedupe_filenames(self):
+        # Setup
+        existing = set()
+
+        # Exercise
+        first = get_subtree_filename(("a-b",), existing)
+        second = get_subtree_filename(("a", "b"), existing)
+
+        # Verify
+        assert first == "a-b.yaml"
+        assert second == "a-b-2.yaml"
+        assert existing == {first, second}
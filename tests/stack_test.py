@@ -0,0 +1,27 @@
+from flyingcircus.core import Resource
+from flyingcircus.service.lambda_ import Function
+from flyingcircus.service.ssm import SSMParameter
+
+from ssmash.converter import convert_hierarchy_to_ssm
+from ssmash.stack import get_resources
+
+
+class TestGetResources:
+    def test_should_find_resources_by_type(self):
+        # Setup
+        stack = convert_hierarchy_to_ssm({"a": 1})
+        stack.Resources["Function"] = Function()
+
+        # Exercise
+        parameters = get_resources(stack, SSMParameter)
+
+        # Verify
+        assert [p.Properties.Name for p in parameters] == ["/a"]
+
+    def test_should_find_subclasses(self):
+        # Setup
+        stack = convert_hierarchy_to_ssm({"a": 1})
+        stack.Resources["Function"] = Function()
+
+        # Exercise & Verify
+        assert len(get_resources(stack, Resource)) == 2
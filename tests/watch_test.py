@@ -0,0 +1,97 @@
+import os
+
+from ssmash.config import InvalidatingConfigKey
+from ssmash.loader import EcsServiceInvalidator
+from ssmash.watch import FileWatcher
+from ssmash.watch import get_config_fingerprint
+
+
+class TestFileWatcher:
+    def test_should_report_first_check_as_change(self, tmp_path):
+        # Setup
+        path = tmp_path / "config.yaml"
+        path.write_text("a: 1")
+        watcher = FileWatcher(str(path))
+
+        # Exercise & Verify
+        assert watcher.has_changed()
+        assert not watcher.has_changed()
+
+    def test_should_detect_modification(self, tmp_path):
+        # Setup
+        path = tmp_path / "config.yaml"
+        path.write_text("a: 1")
+        watcher = FileWatcher(str(path))
+        watcher.has_changed()
+
+        # Exercise
+        path.write_text("a: 22")
+        os.utime(str(path), ns=(0, 0))
+
+        # Verify
+        assert watcher.has_changed()
+        assert not watcher.has_changed()
+
+    def test_should_poll_until_file_changes(self, tmp_path):
+        # Setup
+        path = tmp_path / "config.yaml"
+        path.write_text("a: 1")
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 3:
+                path.write_text("a: 22")
+
+        watcher = FileWatcher(str(path), interval=0.25, sleep=sleep)
+        watcher.has_changed()
+
+        # Exercise
+        watcher.wait_for_change()
+
+        # Verify
+        assert sleeps == [0.25, 0.25, 0.25]
+
+    def test_should_treat_missing_file_as_unchanged_until_created(self, tmp_path):
+        # Setup
+        path = tmp_path / "config.yaml"
+        watcher = FileWatcher(str(path))
+
+        # Exercise & Verify
+        assert not watcher.has_changed()
+        path.write_text("a: 1")
+        assert watcher.has_changed()
+
+
+class TestGetConfigFingerprint:
+    def test_should_match_equivalent_config(self):
+        assert get_config_fingerprint(
+            {"a": {"b": [1, 2]}, "c": "x"}
+        ) == get_config_fingerprint({"a": {"b": [1, 2]}, "c": "x"})
+
+    def test_should_distinguish_values(self):
+        assert get_config_fingerprint({"a": 1}) != get_config_fingerprint({"a": "1"})
+
+    def test_should_include_invalidated_applications(self):
+        # Setup
+        plain = {"a": 1}
+        invalidating = {InvalidatingConfigKey.construct("a", ["servicea"]): 1}
+
+        # Exercise & Verify
+        assert plain == invalidating
+        assert get_config_fingerprint(plain) != get_config_fingerprint(invalidating)
+
+    def test_should_include_invalidator_settings(self):
+        # Setup
+        def create_invalidator(service_name):
+            return EcsServiceInvalidator(
+                cluster_name="cluster", service_name=service_name, role_name="role"
+            )
+
+        # Exercise & Verify
+        assert get_config_fingerprint(
+            create_invalidator("a")
+        ) == get_config_fingerprint(create_invalidator("a"))
+        assert get_config_fingerprint(
+            create_invalidator("a")
+        ) != get_config_fingerprint(create_invalidator("b"))